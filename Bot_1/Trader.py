@@ -2,6 +2,7 @@ import logging
 import time
 
 from optibook.synchronous_client import Exchange
+from optibook.log_setup import setup_logging
 from utils4 import Calculator, OrderHandler
 from constants import *
 
@@ -121,6 +122,7 @@ class Trader:
 
 
 if __name__ == '__main__':
+    setup_logging(logging.DEBUG)
     global_logger = logging.getLogger(__name__)
     e = Exchange()
     e.connect()
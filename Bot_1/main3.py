@@ -1,5 +1,6 @@
 from optibook.synchronous_client import Exchange
-from utils3 import BidAskSpread,Hedging,Calculator,OrderHandler 
+from optibook.strategy_runtime import StrategyRuntime
+from utils3 import BidAskSpread,Calculator,OrderHandler 
 from settings import *
 import time
 
@@ -14,49 +15,80 @@ exchange.delete_orders("PHILIPS_B")
 init_pnl = exchange.get_pnl()
 
 
-def insert_or_delete(timestamp, order_id, new_volume, new_price, exchange, side):
+def next_quote(timestamp, order_id, new_volume, new_price):
+    """
+    Returns the (price, volume) to quote on a side if its order was fulfilled or expired, otherwise None.
+    """
     expired = time.time() - timestamp > TIME_LIMIT
     print(f'expired: {expired}')
     print(f'new_volume: {new_volume}')
     fulfilled = order_id is None
-    if fulfilled and abs(new_volume) > 0:
-        exchange.insert_order(TICKER_2, price = new_price, volume = abs(new_volume), side = side, order_type = 'limit')
-        timestamp = time.time()
-    elif expired and abs(new_volume) > 0:
-        print(f'-------------------------------------------------order_id: {order_id}')
-        remove = exchange.delete_order(TICKER_2,order_id = order_id)
-        exchange.insert_order(TICKER_2, price = new_price, volume = abs(new_volume), side = side, order_type = 'limit')
-        timestamp = time.time()
-    else:
-        pass
-
-x = 0
-print(f"Init PnL: {init_pnl}")
-while True:
-    print("~~~~~~~~~~~ TEAM ORDER BOOK OUTSTANDING ORDERS ~~~~~~~~~~~")
-    team_orderbook.update_outstanding_orders()
-    calculate = Calculator(exchange) # probs not gd to put cls instancein Calculator - Nidish
-    new_B_ask       = calculate.next_B_ask
-    new_B_ask_volume = calculate.new_B_ask_volume
-    new_B_bid       = calculate.next_B_bid
-    new_B_bid_volume = calculate.new_B_bid_volume
-    if len(team_orderbook.bids[TICKER_2]) != 0:
-        team_best_bid = team_orderbook.get_best_bid(TICKER_2).order_id
-    if len(team_orderbook.asks[TICKER_2]) != 0:
-        team_best_ask = team_orderbook.get_best_ask(TICKER_2).order_id
-    elif len(team_orderbook.bids[TICKER_2]) == 0:
-        print("no bids team orderbook")
-        team_best_bid = None
-        team_best_ask = None
-    insert_or_delete(ask_time, team_best_ask, new_B_ask_volume, new_B_ask, exchange,'ask')
-    insert_or_delete(bid_time, team_best_bid, new_B_bid_volume, new_B_bid, exchange,'bid')
-    hedging = Hedging(exchange)
-    current_pnl = exchange.get_pnl()
-    pnl_diff = current_pnl - init_pnl
-    init_pnl = pnl_diff
-    print(f"~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ delta_pnl= {pnl_diff} ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-    
-    # time.sleep(0.05)
-    time.sleep(0.1)
-    
+    if (fulfilled or expired) and abs(new_volume) > 0:
+        return new_price, abs(new_volume)
+    return None
+
+
+class QuoteStrategy:
+    """
+    Quotes PHILIPS_B and hedges in PHILIPS_A on the events of the exchange.
+    The Calculator is created once and refreshed on every event. Fills are hedged by the exchange client as they arrive.
+    """
+    def __init__(self, exchange, init_pnl):
+        self.exchange = exchange
+        self.init_pnl = init_pnl
+        self.ask_time = ask_time
+        self.bid_time = bid_time
+        self.team_best_bid = None
+        self.team_best_ask = None
+        self.calculate = Calculator(exchange)
+        exchange.enable_auto_hedging({TICKER_1: 1, TICKER_2: 1}, TICKER_1)
+
+    def on_book_update(self, instrument_ids):
+        self.quote()
 
+    def on_timer(self):
+        self.quote()
+
+    def quote(self):
+        print("~~~~~~~~~~~ TEAM ORDER BOOK OUTSTANDING ORDERS ~~~~~~~~~~~")
+        team_orderbook.update_outstanding_orders()
+        calculate = self.calculate
+        calculate.refresh()
+        new_B_ask       = calculate.next_B_ask
+        new_B_ask_volume = calculate.new_B_ask_volume
+        new_B_bid       = calculate.next_B_bid
+        new_B_bid_volume = calculate.new_B_bid_volume
+        if len(team_orderbook.bids[TICKER_2]) != 0:
+            self.team_best_bid = team_orderbook.get_best_bid(TICKER_2).order_id
+        if len(team_orderbook.asks[TICKER_2]) != 0:
+            self.team_best_ask = team_orderbook.get_best_ask(TICKER_2).order_id
+        elif len(team_orderbook.bids[TICKER_2]) == 0:
+            print("no bids team orderbook")
+            self.team_best_bid = None
+            self.team_best_ask = None
+        desired_orders = {}
+        next_ask = next_quote(self.ask_time, self.team_best_ask, new_B_ask_volume, new_B_ask)
+        if next_ask is not None:
+            desired_orders['ask'] = [next_ask]
+            self.ask_time = time.time()
+        next_bid = next_quote(self.bid_time, self.team_best_bid, new_B_bid_volume, new_B_bid)
+        if next_bid is not None:
+            desired_orders['bid'] = [next_bid]
+            self.bid_time = time.time()
+        if desired_orders:
+            team_orderbook.reconcile(TICKER_2, desired_orders)
+        # picks up what the hedges on fills left, e.g. an IOC that did not fully trade
+        self.exchange.hedge_now()
+        current_pnl = self.exchange.get_pnl()
+        pnl_diff = current_pnl - self.init_pnl
+        self.init_pnl = pnl_diff
+        print(f"~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ delta_pnl= {pnl_diff} ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+
+print(f"Init PnL: {init_pnl}")
+# Quotes are refreshed on book updates and at least every TIME_LIMIT, instead of every 0.1 s.
+runtime = StrategyRuntime(exchange, QuoteStrategy(exchange, init_pnl), instruments=INSTRUMENTS, min_interval=0.01, timer_interval=TIME_LIMIT)
+try:
+    runtime.run()
+finally:
+    print(f"Runtime metrics: {runtime.get_metrics()}")
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 import numpy as np
 import time
 
+from optibook.common_types import PriceVolume
 from settings import *
 #TODO: DOCUMENTATION
 
@@ -42,6 +43,15 @@ class Hedging:
             order_type: limit or ioc
         """
         self.exchange = exchange  #Name of the exchange
+        self.order_type = order_type
+        self.refresh()
+
+    def refresh(self):
+        """
+        Takes a new snapshot of the books and positions and hedges the net position.
+        Lets one instance be reused on every event instead of constructing a new one.
+        """
+        exchange = self.exchange
         self.PHILIPS_A_price_book = exchange.get_last_price_book(TICKER_1)  # Liquid price book
         self.PHILIPS_B_price_book = exchange.get_last_price_book(TICKER_2) # Illiquid price book
         self.positions = exchange.get_positions()   # Obtain all positions
@@ -54,7 +64,6 @@ class Hedging:
         self.spread_dict = {'PHILIPS_A': BidAskSpread(self.PHILIPS_A_price_book),  
                             'PHILIPS_B' : BidAskSpread(self.PHILIPS_B_price_book)
                             }
-        self.order_type = order_type
         self.side_selector()
         # self.create_order()
         print(f'self.volume: {self.volume}')
@@ -83,7 +92,16 @@ class Calculator:
     Calculates new bid/ask prices and volumes
     """
     def __init__(self,exchange,INSTRUMENTS = INSTRUMENTS):
+        self.exchange = exchange
         self.INSTRUMENTS = INSTRUMENTS
+        self.refresh()
+
+    def refresh(self):
+        """
+        Recalculates the quotes from a new snapshot of the books and positions.
+        Lets one instance be reused on every event instead of constructing a new one.
+        """
+        exchange = self.exchange
         self.A_positions = exchange.get_positions()[self.INSTRUMENTS[0]]
         self.B_positions = exchange.get_positions()[self.INSTRUMENTS[1]]
 
@@ -157,6 +175,8 @@ class OrderHandler:
         self.INSTRUMENTS = INSTRUMENTS
         self.bids = {}
         self.asks = {}
+        self.order_indices = {}
+        self.versions = {}
         
 
     def place_order(self, instrument_id, price, volume, side, order_type):
@@ -187,14 +207,37 @@ class OrderHandler:
         success = self.exchange.delete_order(instrument_id, order_id)
         return success
         
+    def reconcile(self, instrument, desired_orders):
+        """
+        Makes our outstanding orders on the instrument match the desired orders with the fewest messages:
+        volume-only changes are amended, stale price levels deleted and new ones inserted, all in one round-trip.
+        Args:
+            instrument (str): The instrument to reconcile the orders of.
+            desired_orders (dict): Maps 'bid' and/or 'ask' to a list of (price, volume) levels that should be
+                outstanding. Sides that are left out are not touched.
+        Returns:
+            result (ReconcileResult): The number of inserts, amends and deletes sent, new order ids and errors.
+        """
+        desired = {side: [PriceVolume(price, volume) for price, volume in levels] for side, levels in desired_orders.items()}
+        result = self.exchange.reconcile_orders(instrument, desired)
+        for error in result.errors:
+            print(f"Reconciling orders on {instrument} failed: {error!r}")
+        return result
+
     def update_outstanding_orders(self):
         """
         Update the outstanding limit orders for all instruments.
+        The lists are only rebuilt from the exchange's order index when our orders changed since the last update.
         """
         for instrument in self.INSTRUMENTS:
-            orders = self.exchange.get_outstanding_orders(instrument).values()
-            self.asks[instrument] = sorted([o for o in orders if o.side == "ask"], key = lambda x: x.price)
-            self.bids[instrument] = sorted([o for o in orders if o.side == "bid"], key = lambda x: x.price)
+            index = self.exchange.get_order_index(instrument)
+            if self.order_indices.get(instrument) is index and self.versions[instrument] == index.version:
+                continue
+            self.order_indices[instrument] = index
+            self.versions[instrument] = index.version
+            # Both lists are kept in ascending price order.
+            self.asks[instrument] = index.get_orders("ask")
+            self.bids[instrument] = index.get_orders("bid")[::-1]
     
     def get_best_bid(self, instrument):
         """
@@ -233,8 +276,7 @@ class OrderHandler:
         Returns:
             volume (int): The total volume of all outstanding asks.
         """
-        asks = self.asks[instrument]
-        return sum([o.volume for o in asks])
+        return self.order_indices[instrument].get_volume("ask")
         
         
     def get_bid_volume(self, instrument):
@@ -245,8 +287,7 @@ class OrderHandler:
         Returns:
             volume (int): The total volume of all outstanding asks.
         """
-        bids = self.bids[instrument]
-        return sum([o.volume for o in bids])
+        return self.order_indices[instrument].get_volume("bid")
 
 
 def mysign(x):
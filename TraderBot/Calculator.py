@@ -1,6 +1,7 @@
 import time
-import numpy as np
-from collections import deque
+
+from TickContext import TickContext
+from volatility_risk_mgmt.rolling_stats import RollingMeanVariance
 
 
 class Calculator:
@@ -8,7 +9,8 @@ class Calculator:
         self.exchange = exchange
         self.LIQUID_INSTRUMENT, self.ILLIQUID_INSTRUMENT = instruments
         self.UC = undercut_constant
-        self.bid_ask_spreads = deque([], maxlen=60)
+        # Variance of the last 60 illiquid spreads, updated in O(1) per tick.
+        self.bid_ask_spreads = RollingMeanVariance(60)
 
     def get_positions(self):
         """
@@ -40,13 +42,30 @@ class Calculator:
         
         return liquid_book, illiquid_book
         
+    def get_tick_context(self, record_spread=True):
+        """
+        Builds the context for a single decision from one snapshot of the books and positions.
+        Args:
+            record_spread (bool): Whether to add the illiquid spread of this tick to the volatility statistics.
+                Only the quoting decision should, so every tick is counted once.
+        Returns:
+            (TickContext): The snapshot and its memoized derived quantities.
+        """
+        liquid_book, illiquid_book = self.get_books()
+        liquid_position, illiquid_position = self.get_positions()
+        ctx = TickContext(liquid_book, illiquid_book, liquid_position, illiquid_position, self.UC)
+        if record_spread:
+            self.bid_ask_spreads.update(ctx.illiquid_spread)
+        ctx.volatility = self.get_volatility()
+        return ctx
+
     def get_volatility(self):
         """
         Returns the volatility of the market in terms of bid ask spread.
         Returns:
             (float): variance of the bid ask spread.
         """
-        return np.var(self.bid_ask_spreads)
+        return self.bid_ask_spreads.variance
 
     def get_best_ask_price(self, order_book):
         """
@@ -84,10 +103,7 @@ class Calculator:
         Returns:
             (float): The spread between the highest bid and lowest ask.
         """
-        spread = self.get_best_ask_price(order_book) - self.get_best_bid_price(order_book)
-        self.bid_ask_spreads.append(spread)
-        
-        return spread
+        return self.get_best_ask_price(order_book) - self.get_best_bid_price(order_book)
 
     def get_mid_price(self, order_book):
         """
@@ -103,76 +119,62 @@ class Calculator:
         # The mid price is the average of the highest bid and lowest ask.
         return (self.get_best_bid_price(order_book) + self.get_best_ask_price(order_book)) / 2
 
-    def get_undercut_bid_price(self, order_book):
+    def get_undercut_bid_price(self, ctx):
         """
-        Returns the undercut bid price of the given order book.
+        Returns the undercut bid price of the illiquid order book.
         Args:
-            order_book (PriceBook): The order book to get the undercut bid price from.
+            ctx (TickContext): The context of the current tick.
         Returns:
-            (float): The undercut bid price of the given order book.
+            (float): The undercut bid price of the illiquid order book.
         """
-        if not order_book:
-            raise ValueError("Order book is empty.")
+        return ctx.undercut_illiquid_bid
 
-        mid_price = self.get_mid_price(order_book)
-        spread = self.get_bid_ask_spread(order_book)
-        return mid_price - (0.5 * spread * self.UC)
-
-    def get_undercut_illiquid_ask_price(self, order_book):
+    def get_undercut_illiquid_ask_price(self, ctx):
         """
-        Returns the undercut ask price of the given order book.
+        Returns the undercut ask price of the illiquid order book.
         Args:
-            order_book (PriceBook): The order book to get the undercut ask price from.
+            ctx (TickContext): The context of the current tick.
         Returns:
-            (float): The undercut ask price of the given order book.
+            (float): The undercut ask price of the illiquid order book.
         """
-        if not order_book:
-            raise ValueError("Order book is empty.")
+        return ctx.undercut_illiquid_ask
 
-        mid_price = self.get_mid_price(order_book)
-        spread = self.get_bid_ask_spread(order_book)
-        return mid_price + (0.5 * spread * self.UC)
 
-
-    def get_next_ask_price(self, liquid_book, illiquid_book):
+    def get_next_ask_price(self, ctx):
         """
         Calculates the next ask price for the illiquid instrument.
         Args:
-            liquid_book (PriceBook): The liquid order book.
-            illiquid_book (PriceBook): The illiquid order book.
+            ctx (TickContext): The context of the current tick.
         Returns:
             (float): The next ask price for the illiquid instrument.
             (float): The difference between the next ask price and best ask price on the exchange.
         """
-        best_liquid_ask = self.get_best_ask_price(liquid_book)
-        best_illiquid_ask = self.get_best_ask_price(illiquid_book)
-        undercut_illiquid_ask = self.get_undercut_illiquid_ask_price(illiquid_book)
+        best_liquid_ask = ctx.best_liquid_ask
+        best_illiquid_ask = ctx.best_illiquid_ask
 
         if best_liquid_ask >= best_illiquid_ask:
             next_ask_price = best_liquid_ask
         else:
-            next_ask_price = max(undercut_illiquid_ask, (best_liquid_ask + best_illiquid_ask) / 2)
+            next_ask_price = max(ctx.undercut_illiquid_ask, (best_liquid_ask + best_illiquid_ask) / 2)
 
         illiquid_ask_delta = next_ask_price - best_liquid_ask
 
         return next_ask_price, illiquid_ask_delta
 
-    def get_next_bid_price(self, liquid_book, illiquid_book):
+    def get_next_bid_price(self, ctx):
         """
         Calculates the next bid price for the illiquid instrument.
         Args:
-            liquid_book (PriceBook): The liquid order book.
-            illiquid_book (PriceBook): The illiquid order book.
+            ctx (TickContext): The context of the current tick.
         Returns:
             (float): The next bid price for the illiquid instrument.
             (float): The difference between the next bid price and best bid price on the exchange.
         """
-        best_liquid_bid = self.get_best_bid_price(liquid_book)
-        best_illiquid_bid = self.get_best_bid_price(illiquid_book)
-        undercut_illiquid_bid = self.get_undercut_bid_price(illiquid_book)
+        best_liquid_bid = ctx.best_liquid_bid
+        best_illiquid_bid = ctx.best_illiquid_bid
 
         if best_liquid_bid > best_illiquid_bid:
-            next_bid_price = min(undercut_illiquid_bid, (best_liquid_bid + best_illiquid_bid) / 2)
+            next_bid_price = min(ctx.undercut_illiquid_bid, (best_liquid_bid + best_illiquid_bid) / 2)
         else:
             next_bid_price = best_liquid_bid
             
@@ -181,48 +183,48 @@ class Calculator:
         return next_bid_price, illiquid_bid_delta
 
 
-    def get_next_ask_volume(self, liquid_position, illiquid_position, illiquid_ask_delta, MAX_VOLUME=30, VOL_FACTOR=0.5, VOL_LIMIT=150):
-        position_diff = abs(liquid_position - illiquid_position)
-        volatility = self.get_volatility()
-        new_ask_volume = position_diff * abs(illiquid_ask_delta) * volatility
+    def get_next_ask_volume(self, ctx, illiquid_ask_delta, MAX_VOLUME=30, VOL_FACTOR=0.5, VOL_LIMIT=150):
+        new_ask_volume = ctx.position_diff * abs(illiquid_ask_delta) * ctx.volatility
         new_ask_volume = min(VOL_LIMIT, new_ask_volume)
         
         return int(new_ask_volume)
         
-    def get_next_bid_volume(self, liquid_position, illiquid_position, illiquid_bid_delta, MAX_VOLUME=30, VOL_FACTOR=0.5, VOL_LIMIT=150):
-        position_diff = abs(liquid_position - illiquid_position)
-        volatility = self.get_volatility()
-        new_bid_volume = position_diff * abs(illiquid_bid_delta) * volatility
+    def get_next_bid_volume(self, ctx, illiquid_bid_delta, MAX_VOLUME=30, VOL_FACTOR=0.5, VOL_LIMIT=150):
+        new_bid_volume = ctx.position_diff * abs(illiquid_bid_delta) * ctx.volatility
         new_bid_volume = min(VOL_LIMIT, new_bid_volume)
         
         return int(new_bid_volume)
 
-    def get_next_bid(self):
+    def get_next_bid(self, ctx=None):
         """
         Returns the next bid (price and volume) for the illiquid instrument.
+        Args:
+            ctx (TickContext): The context of the current tick. A new one is taken if not given.
         Returns:
             (float): The next bid price for the illiquid instrument.
             (int): The next bid volume for the illiquid instrument.
         """
-        liquid_book, illiquid_book = self.get_books()
-        liquid_position, illiquid_position = self.get_positions()
+        if ctx is None:
+            ctx = self.get_tick_context()
 
-        next_bid_price, price_delta = self.get_next_bid_price(liquid_book, illiquid_book)
-        next_bid_volume = self.get_next_bid_volume(liquid_position, illiquid_position, price_delta)
+        next_bid_price, price_delta = self.get_next_bid_price(ctx)
+        next_bid_volume = self.get_next_bid_volume(ctx, price_delta)
 
         return next_bid_price, next_bid_volume
 
-    def get_next_ask(self):
+    def get_next_ask(self, ctx=None):
         """
         Returns the next ask (price and volume) for the illiquid instrument.
+        Args:
+            ctx (TickContext): The context of the current tick. A new one is taken if not given.
         Returns:
             (float): The next ask price for the illiquid instrument.
             (int): The next ask volume for the illiquid instrument.
         """
-        liquid_book, illiquid_book = self.get_books()
-        liquid_position, illiquid_position = self.get_positions()
+        if ctx is None:
+            ctx = self.get_tick_context()
 
-        next_ask_price, volume_delta = self.get_next_ask_price(liquid_book, illiquid_book)
-        next_ask_volume = self.get_next_ask_volume(liquid_position, illiquid_position, volume_delta)
+        next_ask_price, price_delta = self.get_next_ask_price(ctx)
+        next_ask_volume = self.get_next_ask_volume(ctx, price_delta)
 
-        return next_ask_price, next_ask_volume
\ No newline at end of file
+        return next_ask_price, next_ask_volume
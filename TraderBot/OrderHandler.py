@@ -1,3 +1,9 @@
+import logging
+import time
+
+from optibook.common_types import PriceVolume
+
+
 class OrderHandler:
     """
     Wrapper class to insert, delete, and update orders
@@ -7,8 +13,9 @@ class OrderHandler:
     def __init__(self, exchange, INSTRUMENTS):
         self.exchange = exchange
         self.INSTRUMENTS = INSTRUMENTS
-        self.bids = {}
-        self.asks = {}
+        self.order_indices = {}
+        self.logger = logging.getLogger(__name__)
+        self.requote_stats = {"count": 0, "last": 0.0, "total": 0.0, "max": 0.0}
         
 
     def place_order(self, instrument_id, price, volume, side, order_type):
@@ -23,7 +30,9 @@ class OrderHandler:
         Returns:
             order_id (int): The id of the order that was placed.
         """
-        order_id = self.exchange.insert_order(instrument_id, price=price, volume=volume, side=side, order_type=order_type)
+        # We quote a single limit order per side, so a newer quote replaces one still waiting on the rate limiter.
+        slot = (instrument_id, side) if order_type == "limit" else None
+        order_id = self.exchange.insert_order(instrument_id, price=price, volume=volume, side=side, order_type=order_type, slot=slot)
 
         return order_id
 
@@ -39,14 +48,51 @@ class OrderHandler:
         success = self.exchange.delete_order(instrument_id, order_id=order_id)
         return success
         
+    def reconcile(self, instrument, desired_orders):
+        """
+        Makes our outstanding orders on the instrument match the desired orders with the fewest messages:
+        volume-only changes are amended, stale price levels deleted and new ones inserted, all in one round-trip.
+        Args:
+            instrument (str): The instrument to reconcile the orders of.
+            desired_orders (dict): Maps 'bid' and/or 'ask' to a list of (price, volume) levels that should be
+                outstanding. Sides that are left out are not touched.
+        Returns:
+            result (ReconcileResult): The number of inserts, amends and deletes sent, new order ids and errors.
+        """
+        desired = {side: [PriceVolume(price, volume) for price, volume in levels] for side, levels in desired_orders.items()}
+
+        start_time = time.time()
+        result = self.exchange.reconcile_orders(instrument, desired)
+        self._record_requote_time(time.time() - start_time)
+
+        for error in result.errors:
+            self.logger.error(f"Reconciling orders on {instrument} failed: {error!r}")
+        return result
+
+    def _record_requote_time(self, elapsed):
+        stats = self.requote_stats
+        stats["count"] += 1
+        stats["last"] = elapsed
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+
+    def get_requote_stats(self):
+        """
+        Returns the time-to-requote statistics of reconcile.
+        Returns:
+            stats (dict): count, and the last, mean and max time in seconds from sending a batch to all acks.
+        """
+        stats = self.requote_stats
+        mean = stats["total"] / stats["count"] if stats["count"] else 0.0
+        return {"count": stats["count"], "last": stats["last"], "mean": mean, "max": stats["max"]}
+
     def update_outstanding_orders(self):
         """
         Update the outstanding limit orders for all instruments.
+        The exchange keeps a live, price ordered index of our orders, so this only fetches the index per instrument.
         """
         for instrument in self.INSTRUMENTS:
-            orders = self.exchange.get_outstanding_orders(instrument).values()
-            self.asks[instrument] = sorted([o for o in orders if o.side == "ask"], key = lambda x: x.price)
-            self.bids[instrument] = sorted([o for o in orders if o.side == "bid"], key = lambda x: x.price)
+            self.order_indices[instrument] = self.exchange.get_order_index(instrument)
     
     def get_best_bid(self, instrument):
         """
@@ -56,9 +102,7 @@ class OrderHandler:
         Returns:
             bid (Order): Order object for the higest bid.
         """
-        # The bids are sorted in ascending order, so highest bid is last.
-        bids = self.bids[instrument]
-        return bids[-1] if bids else None
+        return self.order_indices[instrument].get_best_order("bid")
             
                 
     def get_best_ask(self, instrument):
@@ -72,9 +116,7 @@ class OrderHandler:
             asks <list>
             asks[0] type <OrderStatus>
         """
-        # The bids are sorted in ascending order, so highest bid is last.
-        asks = self.asks[instrument]
-        return asks[0] if asks else None
+        return self.order_indices[instrument].get_best_order("ask")
     
     
     def get_ask_volume(self, instrument):
@@ -85,8 +127,7 @@ class OrderHandler:
         Returns:
             volume (int): The total volume of all outstanding asks.
         """
-        asks = self.asks[instrument]
-        return sum([o.volume for o in asks])
+        return self.order_indices[instrument].get_volume("ask")
         
         
     def get_bid_volume(self, instrument):
@@ -97,5 +138,4 @@ class OrderHandler:
         Returns:
             volume (int): The total volume of all outstanding asks.
         """
-        bids = self.bids[instrument]
-        return sum([o.volume for o in bids])
\ No newline at end of file
+        return self.order_indices[instrument].get_volume("bid")
\ No newline at end of file
@@ -0,0 +1,53 @@
+import time
+
+
+class RequotePolicy:
+    """
+    Decides whether a resting quote should be replaced by a newly calculated one.
+    A quote is only replaced when the price moved by enough ticks or the volume by enough lots,
+    or when it is older than the maximum age. This saves order messages and keeps queue priority.
+    """
+
+    def __init__(self, tick_size, min_price_ticks=1, min_volume_lots=1, max_age=1.0):
+        """
+        Args:
+            tick_size (float): The tick size of the quoted instrument.
+            min_price_ticks (int): Minimum price change, in ticks, that triggers a requote.
+            min_volume_lots (int): Minimum volume change, in lots, that triggers a requote.
+            max_age (float): Seconds after which a quote is replaced even if it did not change.
+        """
+        self.tick_size = tick_size
+        self.min_price_ticks = min_price_ticks
+        self.min_volume_lots = min_volume_lots
+        self.max_age = max_age
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_requote(self, live_order, price, volume, quote_time):
+        """
+        Returns whether the live order should be replaced by a quote at the given price and volume.
+        Args:
+            live_order (OrderStatus): Our resting order on this side, or None if there is none.
+            price (float): The newly calculated price.
+            volume (int): The newly calculated volume.
+            quote_time (float): The time the live order was quoted.
+        Returns:
+            requote (bool): Whether to send the new quote.
+        """
+        # Half a tick of slack, as the calculated prices are not rounded to the tick size.
+        requote = (live_order is None
+                   or abs(price - live_order.price) >= (self.min_price_ticks - 0.5) * self.tick_size
+                   or abs(volume - live_order.volume) >= self.min_volume_lots
+                   or time.time() - quote_time > self.max_age)
+        if requote:
+            self.sent += 1
+        else:
+            self.suppressed += 1
+        return requote
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): Number of requotes sent and suppressed.
+        """
+        return {"sent": self.sent, "suppressed": self.suppressed}
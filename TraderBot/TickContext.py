@@ -0,0 +1,61 @@
+from functools import cached_property
+
+
+class TickContext:
+    """
+    A consistent snapshot of the market and our positions for a single decision.
+    The books and positions are read once, and every quantity derived from them is computed at most once per tick.
+    """
+
+    def __init__(self, liquid_book, illiquid_book, liquid_position, illiquid_position, undercut_constant, volatility=0.0):
+        """
+        Args:
+            liquid_book (PriceBook): The liquid order book.
+            illiquid_book (PriceBook): The illiquid order book.
+            liquid_position (int): Our position in the liquid instrument.
+            illiquid_position (int): Our position in the illiquid instrument.
+            undercut_constant (float): Fraction of the spread by which the illiquid quotes undercut the book.
+            volatility (float): Variance of the recent illiquid bid ask spreads, including this tick.
+        """
+        self.liquid_book = liquid_book
+        self.illiquid_book = illiquid_book
+        self.liquid_position = liquid_position
+        self.illiquid_position = illiquid_position
+        self.UC = undercut_constant
+        self.volatility = volatility
+
+    @cached_property
+    def best_liquid_bid(self):
+        return self.liquid_book.bids[0].price
+
+    @cached_property
+    def best_liquid_ask(self):
+        return self.liquid_book.asks[0].price
+
+    @cached_property
+    def best_illiquid_bid(self):
+        return self.illiquid_book.bids[0].price
+
+    @cached_property
+    def best_illiquid_ask(self):
+        return self.illiquid_book.asks[0].price
+
+    @cached_property
+    def illiquid_spread(self):
+        return self.best_illiquid_ask - self.best_illiquid_bid
+
+    @cached_property
+    def illiquid_mid(self):
+        return (self.best_illiquid_bid + self.best_illiquid_ask) / 2
+
+    @cached_property
+    def undercut_illiquid_bid(self):
+        return self.illiquid_mid - (0.5 * self.illiquid_spread * self.UC)
+
+    @cached_property
+    def undercut_illiquid_ask(self):
+        return self.illiquid_mid + (0.5 * self.illiquid_spread * self.UC)
+
+    @cached_property
+    def position_diff(self):
+        return abs(self.liquid_position - self.illiquid_position)
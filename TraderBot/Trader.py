@@ -3,9 +3,24 @@ import time
 
 from Calculator import Calculator
 from OrderHandler import OrderHandler
+from RequotePolicy import RequotePolicy
 
 class Trader:
-    def __init__(self, exchange, instruments, quote_time_limit = 0.1):
+    def __init__(self, exchange, instruments, quote_time_limit = 1.0, quote_ttl = None, requote_ticks = 1, requote_lots = 1, auto_hedge = False, profiler = None, metrics = None):
+        """
+        Args:
+            exchange (Exchange): The connected exchange.
+            instruments (list): The liquid and illiquid instrument.
+            quote_time_limit (float): Maximum age of a quote in seconds, after which it is refreshed even if unchanged.
+            quote_ttl (float): Seconds after which a quote is deleted if no run refreshed it, twice quote_time_limit by
+                default. Must be longer than quote_time_limit, so a run can keep an unchanged quote before it is deleted.
+            requote_ticks (int): Minimum price change in ticks for which a resting quote is replaced.
+            requote_lots (int): Minimum volume change in lots for which a resting quote is replaced.
+            auto_hedge (bool): Hedge fills in the liquid instrument on the exchange's event loop as soon as they arrive,
+                instead of on the next run.
+            profiler (SamplingProfiler): Samples a fraction of the runs when given, see optibook.profiler.
+            metrics (MetricsRegistry): Registry to count the requotes in when given, e.g. the one of Exchange.enable_metrics.
+        """
         self.e = exchange
         self.instruments = instruments
         self.LIQUID_INSTRUMENT = self.instruments[0]
@@ -16,126 +31,192 @@ class Trader:
         self.last_ask_time = time.time()
         self.last_bid_time = time.time()
         self.QUOTE_TIME_LIMIT = quote_time_limit
+        self.QUOTE_TTL = quote_ttl if quote_ttl is not None else 2 * quote_time_limit
+        assert self.QUOTE_TTL > self.QUOTE_TIME_LIMIT, "quote_ttl must be longer than quote_time_limit"
+        tick_size = self.e.get_instruments()[self.ILLIQUID_INSTRUMENT].tick_size
+        self.requote_policy = RequotePolicy(tick_size, requote_ticks, requote_lots, quote_time_limit)
+        # Timers on the exchange's event loop that delete a quote that was not refreshed within QUOTE_TTL.
+        self.expiry_timers = {"bid": None, "ask": None}
+        self.auto_hedge = auto_hedge
+        self.profiler = profiler
+        self.requote_counters = None
+        if metrics is not None:
+            requotes = metrics.counter("trader_requotes_total", "Quotes sent by the trader, per side.", ["instrument", "side"])
+            self.requote_counters = {side: requotes.labels(self.ILLIQUID_INSTRUMENT, side) for side in ("bid", "ask")}
+        if self.auto_hedge:
+            self.e.enable_auto_hedging({self.LIQUID_INSTRUMENT: 1, self.ILLIQUID_INSTRUMENT: 1}, self.LIQUID_INSTRUMENT)
 
     def run(self):
         """
         Runs the trader: Update orders and place new ones.
+        The quotes that need to change are reconciled against our outstanding orders in a single batch.
         """
+        if self.profiler is None:
+            self._run()
+        else:
+            with self.profiler.iteration("Trader.run"):
+                self._run()
+
+    def _run(self):
         self.logger.debug("Updating outstanding orders...")
         self.order_handler.update_outstanding_orders()
 
+        # One snapshot of books and positions for both sides of the decision.
+        ctx = self.calculator.get_tick_context()
         self.logger.debug("Updating bids...")
-        self._update_bids(self.ILLIQUID_INSTRUMENT)
+        next_bid = self._update_bids(self.ILLIQUID_INSTRUMENT, ctx)
         self.logger.debug("Updating asks...")
-        self._update_asks(self.ILLIQUID_INSTRUMENT)
+        next_ask = self._update_asks(self.ILLIQUID_INSTRUMENT, ctx)
+        self._requote(self.ILLIQUID_INSTRUMENT, next_bid, next_ask)
+
         self.logger.debug("Hedging...")
+        if self.auto_hedge:
+            # Fills were hedged when they arrived, this only picks up what those hedges left.
+            self.e.hedge_now()
+        else:
+            self._hedge()
+
+    def on_book_update(self, instrument_ids):
+        """
+        Called by the StrategyRuntime when the book of any of the instruments changed.
+        Both instruments feed the quotes, so any update leads to a full run.
+        Args:
+            instrument_ids (set): The instruments whose book changed.
+        """
+        self.run()
+
+    def on_trades(self, trades):
+        """
+        Called by the StrategyRuntime with our own fills, before any book update, so the position is hedged right away.
+        Args:
+            trades (list): The private trades received since the previous call.
+        """
+        if self.auto_hedge:
+            return
+        self.logger.debug("%d fills. Hedging...", len(trades))
         self._hedge()
 
-    def _update_bids(self, instrument):
+    def on_timer(self):
+        """
+        Called by the StrategyRuntime when the market was quiet for a while, so quotes are still refreshed.
+        """
+        self.run()
+
+    def _requote(self, instrument, next_bid, next_ask):
+        """
+        Reconciles the sides that need a new quote and restarts their quote timers.
+        Args:
+            instrument (str): The instrument to quote.
+            next_bid (tuple): The (price, volume) of the new bid, or None if the bid does not need to change.
+            next_ask (tuple): The (price, volume) of the new ask, or None if the ask does not need to change.
+        """
+        desired_orders = {}
+        if next_bid is not None:
+            desired_orders["bid"] = [next_bid]
+        if next_ask is not None:
+            desired_orders["ask"] = [next_ask]
+        if not desired_orders:
+            return
+
+        # The old timers go first, or one could fire during the round-trip and delete the quote that was just sent.
+        for side in desired_orders:
+            self._cancel_expiry_timer(side)
+        result = self.order_handler.reconcile(instrument, desired_orders)
+        now = time.time()
+        if next_bid is not None:
+            self.last_bid_time = now
+        if next_ask is not None:
+            self.last_ask_time = now
+        for side in desired_orders:
+            self.expiry_timers[side] = self.e.schedule_orders_expiry(instrument, side, self.QUOTE_TTL)
+            if self.requote_counters is not None:
+                self.requote_counters[side].inc()
+        if self.logger.isEnabledFor(logging.DEBUG):
+            # the statistics are only gathered when they are logged
+            self.logger.debug("Requoted %s with %s in %.1f ms. Requotes %s.", list(desired_orders), result,
+                              self.order_handler.get_requote_stats()['last'] * 1000, self.requote_policy.get_stats())
+
+    def _cancel_expiry_timer(self, side):
+        """
+        Cancels the deletion of the previous quote on the side, as it is about to be replaced.
+        A quote is refreshed by the requote policy once it is QUOTE_TIME_LIMIT old; the timer only deletes it after
+        QUOTE_TTL, when no run came by to do so, so it does not rest forever while the strategy is stalled.
+        Args:
+            side (str): The side that is requoted ['bid' / 'ask'].
+        """
+        timer = self.expiry_timers[side]
+        if timer is not None:
+            self.e.cancel_timer(timer)
+            self.expiry_timers[side] = None
+
+    def _update_bids(self, instrument, ctx):
         """
         For the given instrument:
-            - if bid is fulfilled, place a new bid.
-            - if bid is expired, delete the bid and place a new one.
+            - if bid is fulfilled, quote a new bid.
+            - if the new bid differs enough from the resting one, or the resting one is expired,
+              move the bid to the new price and volume.
         Args:
             instrument (str): The instrument to update bids for.
+            ctx (TickContext): The context of the current tick.
+        Returns:
+            next_bid (tuple): The (price, volume) to quote, or None if no action is needed.
         """
-        next_bid_price, next_bid_volume = self.calculator.get_next_bid()
+        next_bid_price, next_bid_volume = self.calculator.get_next_bid(ctx)
         if next_bid_volume <= 0:
             self.logger.debug("Negative volume. No action taken.")
-            return
+            return None
 
         best_bid = self.order_handler.get_best_bid(instrument)
-            
-        if self._is_fulfilled(best_bid):
-            # Insert a new bid if volume is greater than 0.
-            self.logger.debug(f"Placing a bid for {next_bid_volume} units @ {next_bid_price}.")
-            self.order_handler.place_order(instrument, next_bid_price, next_bid_volume, "bid", "limit")
-            self.last_bid_time = time.time()
-
-        elif self._is_expired(self.last_bid_time):
-            # Delete the previous bid order and insert a new one.
-            self.logger.debug("Last bid expired. Deleting bid.")
-            deleted = self.order_handler.delete_order(instrument, best_bid.order_id)
-            if not deleted: self.logger.error("Failed to delete bid order.")
-            self.logger.debug(f"Placing a bid for {next_bid_volume} units @ {next_bid_price}.")
-            self.order_handler.place_order(instrument, next_bid_price, next_bid_volume, "bid", "limit")
-            self.last_bid_time = time.time()
 
-        else:
-            self.logger.debug("Last bid not expired or fulfilled. No action taken.")
+        if self.requote_policy.should_requote(best_bid, next_bid_price, next_bid_volume, self.last_bid_time):
+            self.logger.debug("Quoting a bid for %s units @ %s.", next_bid_volume, next_bid_price)
+            return next_bid_price, next_bid_volume
+
+        self.logger.debug("Last bid not expired, fulfilled or changed enough. No action taken.")
+        return None
 
-    def _update_asks(self, instrument):
+    def _update_asks(self, instrument, ctx):
         """
         For the given instrument:
-            - if ask is fulfilled, place a new ask.
-            - if ask is expired, delete the ask and place a new one.
+            - if ask is fulfilled, quote a new ask.
+            - if the new ask differs enough from the resting one, or the resting one is expired,
+              move the ask to the new price and volume.
         Args:
             instrument (str): The instrument to update asks for.
+            ctx (TickContext): The context of the current tick.
+        Returns:
+            next_ask (tuple): The (price, volume) to quote, or None if no action is needed.
         """
-        next_ask_price, next_ask_volume = self.calculator.get_next_ask()
+        next_ask_price, next_ask_volume = self.calculator.get_next_ask(ctx)
         if next_ask_volume <= 0:
             self.logger.debug("Negative volume. No action taken.")
-            return
+            return None
 
         best_ask = self.order_handler.get_best_ask(instrument)
-        if self._is_fulfilled(best_ask):
-            # Insert a new ask if volume is greater than 0.
-            self.logger.debug(f"Placing an ask for {next_ask_volume} units @ {next_ask_price}.")
-            self.order_handler.place_order(instrument, next_ask_price, next_ask_volume, "ask", "limit")
-            self.last_ask_time = time.time()
-
-        elif self._is_expired(self.last_bid_time):
-            # Delete the previous ask order and insert a new one.
-            self.logger.debug("Last ask expired. Deleting ask.")
-            deleted = self.order_handler.delete_order(instrument, best_ask.order_id)
-            if not deleted: self.logger.error("Failed to delete ask order.")
-            self.logger.debug(f"Placing an ask for {next_ask_volume} units @ {next_ask_price}.")
-            self.order_handler.place_order(instrument, next_ask_price, next_ask_volume, "ask", "limit")
-            self.last_ask_time = time.time()
 
-        else:
-            self.logger.debug("Last ask not expired or fulfilled. No action taken.")
+        if self.requote_policy.should_requote(best_ask, next_ask_price, next_ask_volume, self.last_ask_time):
+            self.logger.debug("Quoting an ask for %s units @ %s.", next_ask_volume, next_ask_price)
+            return next_ask_price, next_ask_volume
 
-    def _is_expired(self, last_time):
-        """
-        Returns whether the order is expired.
-        Args:
-            last_time (float): The time of the last order.
-        Returns:
-            expired (bool): Whether the order is expired based on the time limit.
-        """
-        return time.time() - last_time > self.QUOTE_TIME_LIMIT
+        self.logger.debug("Last ask not expired, fulfilled or changed enough. No action taken.")
+        return None
 
-    def _is_fulfilled(self, order):
-        """
-        Returns whether the order is fulfilled.
-        An order is only fulfilled if it is not inside the team order book, in which case, it is None.
-        Args:
-            order (OrderStatus): The order to check.
-        Returns:
-            fulfilled (bool): Whether the order is fulfilled.
-        """
-        return order is None
-        
     def _hedge(self):
-        PHILIPS_A_price_book = self.e.get_last_price_book(self.LIQUID_INSTRUMENT)  # Liquid price book
-        PHILIPS_B_price_book = self.e.get_last_price_book(self.ILLIQUID_INSTRUMENT)  # Iliquid price book
-        liquid_position, illiquid_position = self.calculator.get_positions() # tuple type of (liquid orders, illiquid orders)
+        # A fresh snapshot, as quoting may have traded. It does not count towards the spread statistics.
+        ctx = self.calculator.get_tick_context(record_spread=False)
         # Sum of all positions
-        total_positions = liquid_position + illiquid_position # Hedge CLASS: self.total_positions = self.positions[TICKER_1] + self.positions[TICKER_2]
+        total_positions = ctx.liquid_position + ctx.illiquid_position # Hedge CLASS: self.total_positions = self.positions[TICKER_1] + self.positions[TICKER_2]
         # TODO: CHANGE ABOVE TO total_positions = abs(liquid_position) + abs(illiquid_position)
         # TODO: CHANGE THE ABOVE TO SUM THE ABS OF BOTH POSITIONS
         # total volume
         # TODO: ¿REMOVE THE ABOVE AFTER MAKING THE TODO CHANGE ABOVE?
-        # self.calculator.get_books() returns the tuple (liquid_book, illiquid_book)
-        PHILIPS_A_price_book, PHILIPS_B_price_book = self.calculator.get_books()
         order_type = "ioc"
         if total_positions > 0: # Hedge CLASS: if self.total_positions > 0:
             selected_side = "ask" # Hedge CLASS: self.selected_side = 'ask'
-            selected_price = self.calculator.get_best_bid_price(PHILIPS_A_price_book) # Hedge CLASS: self.selected_price = self.spread_dict['PHILIPS_A'].highest_bid # calculator.get_best_bid_price(liquid_book)
+            selected_price = ctx.best_liquid_bid # Hedge CLASS: self.selected_price = self.spread_dict['PHILIPS_A'].highest_bid # calculator.get_best_bid_price(liquid_book)
         elif total_positions < 0:
             selected_side = "bid"
-            selected_price = self.calculator.get_best_ask_price(PHILIPS_B_price_book) # Hedge CLASS: self.selected_price = self.spread_dict['PHILIPS_A'].lowest_ask # calculator.get_best_ask_price(liquid_book)
+            selected_price = ctx.best_illiquid_ask # Hedge CLASS: self.selected_price = self.spread_dict['PHILIPS_A'].lowest_ask # calculator.get_best_ask_price(liquid_book)
         else:
             return True
         # self.exchange.insert_order(...) w/ params (instrument_id, price, volume, side, order_type)
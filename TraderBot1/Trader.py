@@ -5,7 +5,7 @@ from Calculator import Calculator
 from OrderHandler import OrderHandler
 
 class Trader:
-    def __init__(self, exchange, instruments, quote_time_limit = 0.1):
+    def __init__(self, exchange, instruments, quote_time_limit = 0.1, profiler = None):
         self.e = exchange
         self.instruments = instruments
         self.LIQUID_INSTRUMENT = self.instruments[0]
@@ -16,85 +16,130 @@ class Trader:
         self.last_ask_time = time.time()
         self.last_bid_time = time.time()
         self.QUOTE_TIME_LIMIT = quote_time_limit
+        self.profiler = profiler
 
     def run(self):
         """
         Runs the trader: Update orders and place new ones.
+        The quotes that need to change are reconciled against our outstanding orders in a single batch.
+        A fraction of the runs is sampled when a SamplingProfiler was given.
         """
+        if self.profiler is None:
+            self._run()
+        else:
+            with self.profiler.iteration("Trader.run"):
+                self._run()
+
+    def _run(self):
         self.logger.debug("Updating outstanding orders...")
         self.order_handler.update_outstanding_orders()
 
         self.logger.debug("Updating bids...")
-        self._update_bids(self.ILLIQUID_INSTRUMENT)
+        next_bid = self._update_bids(self.ILLIQUID_INSTRUMENT)
         self.logger.debug("Updating asks...")
-        self._update_asks(self.ILLIQUID_INSTRUMENT)
+        next_ask = self._update_asks(self.ILLIQUID_INSTRUMENT)
+        self._requote(self.ILLIQUID_INSTRUMENT, next_bid, next_ask)
+
         self.logger.debug("Hedging...")
         self._hedge()
 
+    def on_book_update(self, instrument_ids):
+        """
+        Called by the StrategyRuntime when the book of any of the instruments changed.
+        Both instruments feed the quotes, so any update leads to a full run.
+        Args:
+            instrument_ids (set): The instruments whose book changed.
+        """
+        self.run()
+
+    def on_trades(self, trades):
+        """
+        Called by the StrategyRuntime with our own fills, before any book update, so the position is hedged right away.
+        Args:
+            trades (list): The private trades received since the previous call.
+        """
+        self.logger.debug("%d fills. Hedging...", len(trades))
+        self._hedge()
+
+    def on_timer(self):
+        """
+        Called by the StrategyRuntime when the market was quiet for a while, so quotes are still refreshed.
+        """
+        self.run()
+
+    def _requote(self, instrument, next_bid, next_ask):
+        """
+        Reconciles the sides that need a new quote and restarts their quote timers.
+        Args:
+            instrument (str): The instrument to quote.
+            next_bid (tuple): The (price, volume) of the new bid, or None if the bid does not need to change.
+            next_ask (tuple): The (price, volume) of the new ask, or None if the ask does not need to change.
+        """
+        desired_orders = {}
+        if next_bid is not None:
+            desired_orders["bid"] = [next_bid]
+        if next_ask is not None:
+            desired_orders["ask"] = [next_ask]
+        if not desired_orders:
+            return
+
+        result = self.order_handler.reconcile(instrument, desired_orders)
+        now = time.time()
+        if next_bid is not None:
+            self.last_bid_time = now
+        if next_ask is not None:
+            self.last_ask_time = now
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Requoted %s with %s in %.1f ms.", list(desired_orders), result,
+                              self.order_handler.get_requote_stats()['last'] * 1000)
+
     def _update_bids(self, instrument):
         """
         For the given instrument:
-            - if bid is fulfilled, place a new bid.
-            - if bid is expired, delete the bid and place a new one.
+            - if bid is fulfilled, quote a new bid.
+            - if bid is expired, move the bid to the new price and volume.
         Args:
             instrument (str): The instrument to update bids for.
+        Returns:
+            next_bid (tuple): The (price, volume) to quote, or None if no action is needed.
         """
         next_bid_price, next_bid_volume = self.calculator.get_next_bid()
         if next_bid_volume <= 0:
             self.logger.debug("Negative volume. No action taken.")
-            return
+            return None
 
         best_bid = self.order_handler.get_best_bid(instrument)
-            
-        if self._is_fulfilled(best_bid):
-            # Insert a new bid if volume is greater than 0.
-            self.logger.debug(f"Placing a bid for {next_bid_volume} units @ {next_bid_price}.")
-            self.order_handler.place_order(instrument, next_bid_price, next_bid_volume, "bid", "limit")
-            self.last_bid_time = time.time()
-
-        elif self._is_expired(self.last_bid_time):
-            # Delete the previous bid order and insert a new one.
-            self.logger.debug("Last bid expired. Deleting bid.")
-            deleted = self.order_handler.delete_order(instrument, best_bid.order_id)
-            if not deleted: self.logger.error("Failed to delete bid order.")
-            self.logger.debug(f"Placing a bid for {next_bid_volume} units @ {next_bid_price}.")
-            self.order_handler.place_order(instrument, next_bid_price, next_bid_volume, "bid", "limit")
-            self.last_bid_time = time.time()
 
-        else:
-            self.logger.debug("Last bid not expired or fulfilled. No action taken.")
+        if self._is_fulfilled(best_bid) or self._is_expired(self.last_bid_time):
+            self.logger.debug("Quoting a bid for %s units @ %s.", next_bid_volume, next_bid_price)
+            return next_bid_price, next_bid_volume
+
+        self.logger.debug("Last bid not expired or fulfilled. No action taken.")
+        return None
 
     def _update_asks(self, instrument):
         """
         For the given instrument:
-            - if ask is fulfilled, place a new ask.
-            - if ask is expired, delete the ask and place a new one.
+            - if ask is fulfilled, quote a new ask.
+            - if ask is expired, move the ask to the new price and volume.
         Args:
             instrument (str): The instrument to update asks for.
+        Returns:
+            next_ask (tuple): The (price, volume) to quote, or None if no action is needed.
         """
         next_ask_price, next_ask_volume = self.calculator.get_next_ask()
         if next_ask_volume <= 0:
             self.logger.debug("Negative volume. No action taken.")
-            return
+            return None
 
         best_ask = self.order_handler.get_best_ask(instrument)
-        if self._is_fulfilled(best_ask):
-            # Insert a new ask if volume is greater than 0.
-            self.logger.debug(f"Placing an ask for {next_ask_volume} units @ {next_ask_price}.")
-            self.order_handler.place_order(instrument, next_ask_price, next_ask_volume, "ask", "limit")
-            self.last_ask_time = time.time()
-
-        elif self._is_expired(self.last_bid_time):
-            # Delete the previous ask order and insert a new one.
-            self.logger.debug("Last ask expired. Deleting ask.")
-            deleted = self.order_handler.delete_order(instrument, best_ask.order_id)
-            if not deleted: self.logger.error("Failed to delete ask order.")
-            self.logger.debug(f"Placing an ask for {next_ask_volume} units @ {next_ask_price}.")
-            self.order_handler.place_order(instrument, next_ask_price, next_ask_volume, "ask", "limit")
-            self.last_ask_time = time.time()
 
-        else:
-            self.logger.debug("Last ask not expired or fulfilled. No action taken.")
+        if self._is_fulfilled(best_ask) or self._is_expired(self.last_ask_time):
+            self.logger.debug("Quoting an ask for %s units @ %s.", next_ask_volume, next_ask_price)
+            return next_ask_price, next_ask_volume
+
+        self.logger.debug("Last ask not expired or fulfilled. No action taken.")
+        return None
 
     def _is_expired(self, last_time):
         """
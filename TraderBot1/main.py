@@ -1,21 +1,35 @@
+import os
 from Trader import Trader
 from optibook.synchronous_client import Exchange
+from optibook.strategy_runtime import StrategyRuntime
+from optibook.profiler import SamplingProfiler
+from optibook.log_setup import setup_logging
 import logging
-import time
 
 if __name__ == '__main__':
+    # Records are written from a background thread, so logging does not hold up the trading and event loop threads.
+    setup_logging(os.environ.get("TRADER_LOG_LEVEL", "INFO"))
     global_logger = logging.getLogger(__name__)
     e = Exchange()
     e.connect()
     global_logger.debug("Connected to the exchange.")
-    trader = Trader(e, ['PHILIPS_A', 'PHILIPS_B'], 0.1)
+
+    # Opt-in profiling: TRADER_PROFILE=0.1 samples 10% of the runs and the event loop. kill -USR1 <pid> writes the
+    # collapsed stacks to TRADER_PROFILE_OUTPUT, as does the end of the run.
+    profiler = None
+    profile_output = os.environ.get("TRADER_PROFILE_OUTPUT", "trader_profile.folded")
+    if float(os.environ.get("TRADER_PROFILE", 0)) > 0:
+        profiler = SamplingProfiler(fraction=float(os.environ["TRADER_PROFILE"]))
+        e.profile_event_loop(profiler)
+        profiler.dump_on_signal(profile_output)
+    trader = Trader(e, ['PHILIPS_A', 'PHILIPS_B'], 0.1, profiler=profiler)
     global_logger.debug("Trader initialized...")
     
-    while True:
-        # try:
-        #     trader.run()
-        # except Exception as e:
-        #     global_logger.error(f'Exception: {e}')
-        
-        trader.run()
-        time.sleep(0.25)
\ No newline at end of file
+    # React to book updates, fills and quiet periods instead of polling on a fixed sleep.
+    runtime = StrategyRuntime(e, trader, instruments=['PHILIPS_A', 'PHILIPS_B'], min_interval=0.01, timer_interval=0.25)
+    try:
+        runtime.run()
+    finally:
+        global_logger.debug("Runtime metrics: %s", runtime.get_metrics())
+        if profiler is not None:
+            profiler.dump(profile_output)
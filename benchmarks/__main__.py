@@ -0,0 +1,92 @@
+"""
+Runs all benchmarks, without a connection to an exchange.
+
+Run from the repository root with: python -m benchmarks [--only client,trader] [--json results.json]
+
+The JSON output maps '<suite>.<case>' to its value and unit, with the keys sorted, so the files of two versions can be
+diffed or compared case by case. A case that fails has a null value and the error.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import sys
+import traceback
+
+SCHEMA_VERSION = 1
+SUITES = ['client', 'trader', 'pre_trade_risk', 'tick_context']
+
+
+def run_suite(name):
+    """
+    Returns:
+        (dict): Per '<suite>.<case>' a dict with the value and unit, or the error if the case failed.
+    """
+    try:
+        module = importlib.import_module(f'benchmarks.{name}')
+    except Exception as e:
+        return {name: {'value': None, 'unit': None, 'error': repr(e)}}
+
+    cases = getattr(module, 'CASES', None)
+    if cases is None:
+        cases = {None: module.run}
+    results = {}
+    for case_name, case in cases.items():
+        try:
+            values = case()
+        except Exception as e:
+            traceback.print_exc()
+            values = {case_name: e}
+        if case_name is not None and not isinstance(values, dict):
+            values = {case_name: values}
+        for key, value in values.items():
+            if isinstance(value, Exception):
+                results[f'{name}.{key}'] = {'value': None, 'unit': module.UNIT, 'error': repr(value)}
+            else:
+                results[f'{name}.{key}'] = {'value': round(float(value), 3), 'unit': module.UNIT}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks of the client and bots.")
+    parser.add_argument('--only', default=None, help=f"comma separated suites to run, from {', '.join(SUITES)}")
+    parser.add_argument('--json', default=None, metavar='PATH', help="write the results as JSON to PATH, - for stdout")
+    args = parser.parse_args()
+
+    suites = args.only.split(',') if args.only else SUITES
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for suite in suites:
+        results.update(run_suite(suite))
+
+    if args.json is None:
+        for key, result in results.items():
+            value = f"{result['value']:14.1f}" if result['value'] is not None else f"{'failed':>14}"
+            print(f"{key:<40} {value} {result['unit'] or ''}")
+        return
+
+    output = {
+        'schema_version': SCHEMA_VERSION,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.json == '-':
+        print(text)
+    else:
+        with open(args.json, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Measures the hot paths of the client: reading frames from the info feed, handling book updates and trade ticks,
+polling trade ticks, booking trades, reading the PnL and a round trip onto the event loop.
+
+Run from the repository root with: python -m benchmarks.client
+"""
+import asyncio
+import threading
+import time
+import types
+
+from optibook_client.exchange_client import InfoClient, PositionAccountant
+from optibook_client.idl import common_capnp, info_capnp
+from optibook_client.synchronous_client import Exchange
+from optibook_client.synchronous_wrapper import SynchronousWrapper
+
+from .common import ns_per_call
+
+UNIT = 'ns/call'
+NUMBER = 20000
+NR_FRAMES = 20000
+DEPTH = 5
+LARGE_HISTORY = 100000
+INSTRUMENT_ID = 'PHILIPS_A'
+
+
+def price_book_message(instrument_id=INSTRUMENT_ID, mid=100.0, depth=DEPTH):
+    msg = common_capnp.RawMessage.new_message()
+    msg.type = info_capnp.PriceBook.schema.node.id
+    book = info_capnp.PriceBook.new_message()
+    book.instrumentId = instrument_id
+    bids = book.init('bids', depth)
+    asks = book.init('asks', depth)
+    for k in range(depth):
+        bids[k].price = mid - 0.1 * (k + 1)
+        bids[k].volume = 10 * (k + 1)
+        asks[k].price = mid + 0.1 * (k + 1)
+        asks[k].volume = 10 * (k + 1)
+    msg.msg = book
+    return msg
+
+
+def trade_tick_message(instrument_id=INSTRUMENT_ID, trade_id=0):
+    msg = common_capnp.RawMessage.new_message()
+    msg.type = common_capnp.TradeTick.schema.node.id
+    tick = common_capnp.TradeTick.new_message()
+    tick.tradeId = trade_id
+    tick.timestamp = time.time_ns()
+    tick.instrumentId = instrument_id
+    tick.price = 100.0
+    tick.volume = 5
+    tick.aggressorSide = 'bid'
+    tick.buyer = 'buyer'
+    tick.seller = 'seller'
+    msg.msg = tick
+    return msg
+
+
+def as_struct(msg, schema):
+    # a reader, like the structs the handlers get from the socket
+    return msg.as_reader().msg.as_struct(schema)
+
+
+def new_info_client(max_nr_trade_history=100):
+    return InfoClient(host='localhost', port=1, max_nr_trade_history=max_nr_trade_history)
+
+
+class _OpenTransport:
+    def is_closing(self):
+        return False
+
+
+class _FakeWriter:
+    transport = _OpenTransport()
+
+
+def bench_raw_read():
+    """
+    RawClient._read on a stream of book updates, with message handling left out. Nanoseconds per frame.
+    """
+    data = price_book_message().to_bytes() * NR_FRAMES
+    client = new_info_client()
+    nr_messages = [0]
+
+    async def on_message(msg):
+        nr_messages[0] += 1
+
+    client._on_message = on_message
+
+    async def read_all():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        client._reader, client._writer = reader, _FakeWriter()
+        start = time.perf_counter()
+        try:
+            await client._read()
+        except asyncio.IncompleteReadError:
+            pass
+        return time.perf_counter() - start
+
+    loop = asyncio.new_event_loop()
+    try:
+        seconds = min(loop.run_until_complete(read_all()) for _ in range(3))
+    finally:
+        loop.close()
+    # a frame that fails to parse ends the read early, which would look fast
+    assert nr_messages[0] == 3 * NR_FRAMES, f"parsed {nr_messages[0]} of {3 * NR_FRAMES} frames"
+    return seconds / NR_FRAMES * 1e9
+
+
+def bench_on_price_book():
+    client = new_info_client()
+    book = as_struct(price_book_message(), info_capnp.PriceBook.schema)
+    return ns_per_call(lambda: client.onPriceBook(book), NUMBER)
+
+
+def bench_on_trade_tick():
+    client = new_info_client()
+    tick = as_struct(trade_tick_message(), common_capnp.TradeTick.schema)
+    # a full history, so every tick also drops the oldest one
+    for _ in range(client._max_trade_history):
+        client.onTradeTick(tick)
+    return ns_per_call(lambda: client.onTradeTick(tick), NUMBER)
+
+
+def bench_poll_new_trade_ticks():
+    """
+    Polling the 10 newest trade ticks from a history of LARGE_HISTORY ticks.
+    """
+    client = new_info_client(max_nr_trade_history=LARGE_HISTORY)
+    tick = as_struct(trade_tick_message(), common_capnp.TradeTick.schema)
+    for _ in range(LARGE_HISTORY):
+        client.onTradeTick(tick)
+    last_polled_index = client._trade_tick_history_last_polled_index
+
+    def poll():
+        last_polled_index[INSTRUMENT_ID] = LARGE_HISTORY - 10
+        client.poll_new_trade_ticks(INSTRUMENT_ID)
+
+    return ns_per_call(poll, NUMBER // 10)
+
+
+def bench_handle_trade():
+    accountant = PositionAccountant()
+    accountant.update_mark_price(INSTRUMENT_ID, 100.0)
+    trades = [types.SimpleNamespace(instrumentId=INSTRUMENT_ID, side=side, volume=5, price=100.0 + 0.1 * k)
+              for k, side in enumerate(['bid', 'bid', 'ask', 'ask', 'ask', 'bid'])]
+    trades = trades * (NUMBER // len(trades))
+
+    def handle_all():
+        for trade in trades:
+            accountant.handle_trade(trade)
+
+    return ns_per_call(handle_all, 1) / len(trades)
+
+
+def bench_exchange_get_pnl():
+    exchange = Exchange(host='localhost', info_port=1, exec_port=1)
+    # get_pnl only reads local state, the connection check is all it needs the exchange for
+    exchange.is_connected = lambda: True
+    for n in range(20):
+        instrument_id = f'INSTRUMENT_{n}'
+        exchange._e.update_mark_price(instrument_id, 100.0)
+        exchange._e._position_accountant.handle_trade(types.SimpleNamespace(instrumentId=instrument_id, side='bid', volume=5, price=99.0))
+    return ns_per_call(exchange.get_pnl, NUMBER)
+
+
+def bench_run_on_loop():
+    """
+    A round trip of a coroutine that does nothing from the calling thread onto the event loop thread and back.
+    """
+    wrapper = SynchronousWrapper([])
+    loop = wrapper.get_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def noop():
+        pass
+
+    try:
+        return ns_per_call(lambda: wrapper.run_on_loop(noop()), NUMBER // 10)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+CASES = {
+    'raw_read': bench_raw_read,
+    'on_price_book': bench_on_price_book,
+    'on_trade_tick': bench_on_trade_tick,
+    'poll_new_trade_ticks': bench_poll_new_trade_ticks,
+    'handle_trade': bench_handle_trade,
+    'exchange_get_pnl': bench_exchange_get_pnl,
+    'run_on_loop': bench_run_on_loop,
+}
+
+
+def run():
+    return {name: case() for name, case in CASES.items()}
+
+
+if __name__ == '__main__':
+    for name, ns in run().items():
+        print(f'{name:<24} {ns:10.0f} {UNIT}')
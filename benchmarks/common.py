@@ -0,0 +1,40 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import os
+import sys
+import timeit
+
+import optibook_client
+import optibook_client.common_types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_local_client():
+    """
+    The bots and some shared modules import the client as optibook, the name it is installed under on the exchange
+    hosts. Make that name refer to the client in this repository, unless a client is installed.
+    """
+    try:
+        import optibook.common_types  # noqa: F401
+    except ImportError:
+        sys.modules['optibook'] = optibook_client
+        sys.modules['optibook.common_types'] = optibook_client.common_types
+
+
+def use_bot(directory):
+    """
+    The bot modules import each other as scripts, so their directory has to be on the path.
+    """
+    path = os.path.join(REPO_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def ns_per_call(f, number, repeat=5):
+    """
+    Returns:
+        (float): The fastest of repeat timings of number calls of f, in nanoseconds per call.
+    """
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number * 1e9
@@ -0,0 +1,67 @@
+"""
+Measures the cost of each local pre-trade risk check.
+
+Run from the repository root with: python -m benchmarks.pre_trade_risk
+"""
+import timeit
+
+from optibook_client.common_types import Instrument, OrderStatus, PriceChangeLimit
+from optibook_client.exchange_client import OrderIndex, PositionAccountant
+from optibook_client.pre_trade_risk import PreTradeRiskChecker, RiskLimits
+
+UNIT = 'ns/call'
+NUMBER = 100000
+
+
+class FakeExecClient:
+    def __init__(self, instruments):
+        self._position_accountant = PositionAccountant()
+        self._order_indices = {i: OrderIndex(i) for i in instruments}
+        for n, instrument_id in enumerate(instruments):
+            for k in range(10):
+                o = OrderStatus()
+                o.order_id = n * 100 + k
+                o.instrument_id = instrument_id
+                o.price = 100.0 + (k if k % 2 else -k) * 0.1
+                o.volume = 5
+                o.side = 'ask' if k % 2 else 'bid'
+                self._order_indices[instrument_id].update(o)
+
+    def get_position(self, instrument_id):
+        return self._position_accountant.get_position(instrument_id)
+
+    def get_order_index(self, instrument_id):
+        return self._order_indices[instrument_id]
+
+
+def build_checker():
+    instruments = {i: Instrument(i, tick_size=0.1, price_change_limit=PriceChangeLimit(5.0, 0.1)) for i in ['PHILIPS_A', 'PHILIPS_B']}
+    limits = RiskLimits(max_order_volume=100,
+                        default_position_limit=500,
+                        group_position_limits={'PHILIPS': (['PHILIPS_A', 'PHILIPS_B'], 300)})
+    exec_client = FakeExecClient(list(instruments))
+    checker = PreTradeRiskChecker(limits, lambda: instruments, lambda instrument_id: 100.0, exec_client)
+    return checker, instruments['PHILIPS_B']
+
+
+def run():
+    checker, instrument = build_checker()
+    cases = {
+        'check_order_volume': lambda: checker.check_order_volume('PHILIPS_B', 10),
+        'check_paused': lambda: checker.check_paused(instrument),
+        'check_tick_size': lambda: checker.check_tick_size(instrument, 100.3),
+        'check_price_band': lambda: checker.check_price_band(instrument, 100.3),
+        'check_position_limits': lambda: checker.check_position_limits('PHILIPS_B', 10, 'bid'),
+        'check_insert': lambda: checker.check_insert('PHILIPS_B', 100.3, 10, 'bid'),
+        'check_amend': lambda: checker.check_amend('PHILIPS_B', 100, 10),
+    }
+    results = {}
+    for name, f in cases.items():
+        seconds = min(timeit.repeat(f, number=NUMBER, repeat=5))
+        results[name] = seconds / NUMBER * 1e9
+    return results
+
+
+if __name__ == '__main__':
+    for name, ns in run().items():
+        print(f'{name:<24} {ns:8.0f} {UNIT}')
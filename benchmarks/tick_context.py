@@ -0,0 +1,62 @@
+"""
+Measures how many quoting decisions per second the TraderBot Calculator makes, with one tick context per decision
+versus a separate snapshot for each side.
+
+Run from the repository root with: python -m benchmarks.tick_context
+"""
+import os
+import sys
+import timeit
+
+from optibook_client.common_types import PriceBook, PriceVolume
+
+# the bot modules import each other as scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TraderBot'))
+
+from Calculator import Calculator  # noqa: E402
+
+UNIT = 'decisions/s'
+NUMBER = 20000
+
+
+class FakeExchange:
+    def __init__(self):
+        self._books = {
+            'PHILIPS_A': PriceBook(instrument_id='PHILIPS_A',
+                                   bids=[PriceVolume(100.0 - 0.1 * k, 10) for k in range(5)],
+                                   asks=[PriceVolume(100.1 + 0.1 * k, 10) for k in range(5)]),
+            'PHILIPS_B': PriceBook(instrument_id='PHILIPS_B',
+                                   bids=[PriceVolume(99.8 - 0.1 * k, 5) for k in range(5)],
+                                   asks=[PriceVolume(100.4 + 0.1 * k, 5) for k in range(5)]),
+        }
+        self._positions = {'PHILIPS_A': 40, 'PHILIPS_B': -25}
+
+    def get_last_price_book(self, instrument_id):
+        return self._books[instrument_id]
+
+    def get_positions(self):
+        return dict(self._positions)
+
+
+def run():
+    calculator = Calculator(FakeExchange(), ['PHILIPS_A', 'PHILIPS_B'])
+
+    def with_context():
+        ctx = calculator.get_tick_context()
+        calculator.get_next_bid(ctx)
+        calculator.get_next_ask(ctx)
+
+    def snapshot_per_side():
+        calculator.get_next_bid()
+        calculator.get_next_ask()
+
+    results = {}
+    for name, f in [('tick_context', with_context), ('snapshot_per_side', snapshot_per_side)]:
+        seconds = min(timeit.repeat(f, number=NUMBER, repeat=5))
+        results[name] = NUMBER / seconds
+    return results
+
+
+if __name__ == '__main__':
+    for name, decisions_per_second in run().items():
+        print(f'{name:<24} {decisions_per_second:10.0f} {UNIT}')
@@ -0,0 +1,114 @@
+"""
+Measures the TraderBot: fetching the outstanding orders, and a full Trader.run decision against an exchange that acks
+every order immediately.
+
+Run from the repository root with: python -m benchmarks.trader
+"""
+import itertools
+
+from optibook_client.common_types import Instrument, OrderStatus, PriceBook, PriceVolume, ReconcileResult
+from optibook_client.exchange_client import OrderIndex
+
+from .common import ns_per_call, use_bot, use_local_client
+
+use_local_client()
+use_bot('TraderBot')
+
+from OrderHandler import OrderHandler  # noqa: E402
+from Trader import Trader  # noqa: E402
+
+UNIT = 'ns/call'
+NUMBER = 5000
+INSTRUMENTS = ['PHILIPS_A', 'PHILIPS_B']
+
+
+class FakeExchange:
+    """
+    Books that alternate between two states, so every decision requotes, and orders that are acked at once.
+    """
+
+    def __init__(self):
+        self._instruments = {i: Instrument(i, tick_size=0.1) for i in INSTRUMENTS}
+        self._order_indices = {i: OrderIndex(i) for i in INSTRUMENTS}
+        self._order_ids = itertools.count(1)
+        # the illiquid spread changes with the state, so the spread variance, and with it the quoted volume, is not 0
+        self._books = [
+            {'PHILIPS_A': self._book('PHILIPS_A', mid, 1), 'PHILIPS_B': self._book('PHILIPS_B', mid, half_spread_ticks)}
+            for mid, half_spread_ticks in [(100.0, 3), (100.4, 5)]
+        ]
+        self._nr_book_reads = 0
+        self._positions = {'PHILIPS_A': 2000, 'PHILIPS_B': -1000}
+
+    @staticmethod
+    def _book(instrument_id, mid, half_spread_ticks):
+        return PriceBook(instrument_id=instrument_id,
+                         bids=[PriceVolume(round(mid - 0.1 * (half_spread_ticks + k), 1), 10) for k in range(5)],
+                         asks=[PriceVolume(round(mid + 0.1 * (half_spread_ticks + k), 1), 10) for k in range(5)])
+
+    def get_instruments(self):
+        return self._instruments
+
+    def get_last_price_book(self, instrument_id):
+        # a run reads both books twice, for quoting and for hedging, and all four come from the same state
+        book = self._books[(self._nr_book_reads // 4) % 2][instrument_id]
+        self._nr_book_reads += 1
+        return book
+
+    def get_positions(self):
+        return dict(self._positions)
+
+    def get_order_index(self, instrument_id):
+        return self._order_indices[instrument_id]
+
+    def reconcile_orders(self, instrument_id, desired_orders):
+        index = self._order_indices[instrument_id]
+        result = ReconcileResult()
+        for side, levels in desired_orders.items():
+            for order in index.get_orders(side):
+                deleted = OrderStatus()
+                deleted.order_id, deleted.instrument_id, deleted.side = order.order_id, instrument_id, side
+                deleted.price, deleted.volume = order.price, 0
+                index.update(deleted)
+                result.nr_deletes += 1
+            for level in levels:
+                order = OrderStatus()
+                order.order_id, order.instrument_id, order.side = next(self._order_ids), instrument_id, side
+                order.price, order.volume = level.price, level.volume
+                index.update(order)
+                result.order_ids.append(order.order_id)
+                result.nr_inserts += 1
+        return result
+
+    def insert_order(self, instrument_id, *, price, volume, side, order_type='limit', slot=None):
+        return next(self._order_ids)
+
+    def schedule_orders_expiry(self, instrument_id, side, ttl):
+        return object()
+
+    def cancel_timer(self, timer):
+        pass
+
+
+def bench_update_outstanding_orders():
+    order_handler = OrderHandler(FakeExchange(), INSTRUMENTS)
+    return ns_per_call(order_handler.update_outstanding_orders, NUMBER * 10)
+
+
+def bench_trader_run():
+    trader = Trader(FakeExchange(), INSTRUMENTS, quote_time_limit=1.0)
+    return ns_per_call(trader.run, NUMBER)
+
+
+CASES = {
+    'update_outstanding_orders': bench_update_outstanding_orders,
+    'trader_run': bench_trader_run,
+}
+
+
+def run():
+    return {name: case() for name, case in CASES.items()}
+
+
+if __name__ == '__main__':
+    for name, ns in run().items():
+        print(f'{name:<28} {ns:10.0f} {UNIT}')
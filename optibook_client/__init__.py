@@ -5,3 +5,8 @@ capnp.create_event_loop(threaded=True)
 from .synchronous_client import Exchange
 from .exchange_client import InfoClient, ExecClient
 from .exchange_client import ORDER_TYPE_IOC, ORDER_TYPE_LIMIT, SIDE_ASK, SIDE_BID
+from .pre_trade_risk import PreTradeRiskError, RiskLimits
+from .rate_limiter import PRIORITY_HIGH, PRIORITY_NORMAL
+from .profiler import SamplingProfiler
+from .log_setup import setup_logging
+from .metrics import MetricsRegistry, MetricsServer
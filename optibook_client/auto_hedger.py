@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+import typing
+
+from .common_types import OrderStatus, Trade, TopOfBook
+from .exchange_client import ORDER_TYPE_IOC, SIDE_ASK, SIDE_BID
+from .rate_limiter import PRIORITY_HIGH
+
+logger = logging.getLogger('client')
+
+
+class _PendingHedge:
+    __slots__ = ('side', 'volume', 'remaining', 'order_id', 'expiry')
+
+    def __init__(self, side, volume):
+        self.side = side
+        self.volume = volume
+        self.remaining = volume
+        self.order_id = None
+        self.expiry = None
+
+
+class AutoHedger:
+    """
+    Hedges the net exposure of a group of instruments as soon as one of them trades.
+
+    The exec client calls on_trade from its onTrade handler on the event loop thread, right after the position accountant
+    booked the trade. The hedger then computes the net exposure of the group from the booked positions and sends an IOC
+    on the hedge instrument, priced off the cached top of book, without waiting for a strategy thread or fetching books.
+
+    Hedges that were sent and did not fill yet are counted as in flight, so a burst of fills only sends the volume that is
+    not already being hedged. Fills are attributed to a hedge by the order id of its IOC, and a hedge stays in flight
+    until it filled completely, the exchange reported the order done, or fill_timeout seconds passed after the insert
+    was answered, as the fills of an IOC may arrive after its answer. Fills on the hedge instrument that arrive while an
+    insert is not answered yet cannot be attributed, so hedging waits for the answer.
+    """
+    def __init__(self,
+                 exec_client,
+                 get_top_of_book: typing.Callable[[str], typing.Optional[TopOfBook]],
+                 hedge_ratios: typing.Dict[str, float],
+                 hedge_instrument: str,
+                 tick_size: float = 0.0,
+                 slippage_ticks: int = 0,
+                 max_hedge_volume: typing.Optional[int] = None,
+                 fill_timeout: float = 1.0):
+        """
+        Parameters
+        ----------
+        exec_client: ExecClient
+            The client whose positions are hedged and that sends the hedges.
+
+        get_top_of_book: typing.Callable[[str], TopOfBook]
+            Returns the cached top of book of an instrument.
+
+        hedge_ratios: typing.Dict[str, float]
+            Exposure per lot of each instrument in the group, e.g. {'PHILIPS_A': 1, 'PHILIPS_B': 1}. Must include the
+            hedge instrument.
+
+        hedge_instrument: str
+            The liquid instrument the hedges are sent on.
+
+        tick_size: float
+            Tick size of the hedge instrument, used with slippage_ticks.
+
+        slippage_ticks: int
+            Number of ticks beyond the best opposite price a hedge may trade at.
+
+        max_hedge_volume: int
+            Maximum volume of a single hedge order. None for no maximum.
+
+        fill_timeout: float
+            Seconds after the answer to its insert after which the unfilled volume of a hedge is taken to be cancelled,
+            if the exchange did not report the order done before.
+        """
+        assert hedge_instrument in hedge_ratios, "hedge_instrument must be in hedge_ratios"
+        assert hedge_ratios[hedge_instrument] != 0, "hedge_instrument must have a non-zero hedge ratio"
+        self._exec_client = exec_client
+        self._get_top_of_book = get_top_of_book
+        self.hedge_ratios = dict(hedge_ratios)
+        self.hedge_instrument = hedge_instrument
+        self.tick_size = tick_size
+        self.slippage_ticks = slippage_ticks
+        self.max_hedge_volume = max_hedge_volume
+        self.fill_timeout = fill_timeout
+
+        self._pending: typing.List[_PendingHedge] = []
+        self._pending_by_order_id: typing.Dict[int, _PendingHedge] = {}
+        # fills on the hedge instrument and finished orders that arrived while an insert was not answered yet, per order id
+        self._unattributed_fills: typing.Dict[int, int] = {}
+        self._unattributed_done: typing.Set[int] = set()
+
+        self._nr_hedges = 0
+        self._nr_skipped = 0
+        self._hedged_volume = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def get_exposure(self) -> float:
+        """
+        Net exposure of the group in lots of the hedge instrument, including hedges in flight.
+        """
+        exposure = sum(ratio * self._exec_client.get_position(instrument_id) for instrument_id, ratio in self.hedge_ratios.items())
+        exposure /= self.hedge_ratios[self.hedge_instrument]
+        return exposure + self.get_in_flight_volume()
+
+    def get_in_flight_volume(self) -> int:
+        """
+        Signed volume of hedges that were sent and not yet filled or answered.
+        """
+        return sum(p.remaining if p.side == SIDE_BID else -p.remaining for p in self._pending)
+
+    def on_trade(self, trade: Trade) -> None:
+        """
+        Called on the event loop thread for every private trade, after its position was booked.
+        """
+        if trade.instrument_id not in self.hedge_ratios:
+            return
+        if trade.instrument_id == self.hedge_instrument:
+            pending = self._pending_by_order_id.get(trade.order_id)
+            if pending is not None:
+                self._fill(pending, trade.volume)
+            elif self._has_unanswered():
+                # possibly the fill of a hedge whose order id is not known yet, decided when its insert is answered
+                self._unattributed_fills[trade.order_id] = self._unattributed_fills.get(trade.order_id, 0) + trade.volume
+                return
+        self.hedge(time.perf_counter())
+
+    def on_order_update(self, order: OrderStatus) -> None:
+        """
+        Called on the event loop thread for every order update. An update to volume 0 of a hedge means the exchange is
+        done with it, so whatever did not fill is no longer in flight.
+        """
+        if order.volume != 0 or order.instrument_id != self.hedge_instrument:
+            return
+        pending = self._pending_by_order_id.get(order.order_id)
+        if pending is not None:
+            self._release(pending)
+        elif self._has_unanswered():
+            self._unattributed_done.add(order.order_id)
+
+    def _has_unanswered(self):
+        return any(p.order_id is None for p in self._pending)
+
+    def _fill(self, pending, volume):
+        pending.remaining -= min(volume, pending.remaining)
+        if pending.remaining == 0:
+            self._release(pending)
+
+    def _release(self, pending):
+        if pending.expiry is not None:
+            pending.expiry.cancel()
+            pending.expiry = None
+        if pending in self._pending:
+            self._pending.remove(pending)
+        if pending.order_id is not None:
+            self._pending_by_order_id.pop(pending.order_id, None)
+
+    def _on_answered(self):
+        """
+        Once all inserts are answered, the fills that could not be attributed are known not to be hedge fills.
+        """
+        if self._has_unanswered():
+            return
+        self._unattributed_done.clear()
+        if self._unattributed_fills:
+            self._unattributed_fills.clear()
+            self.hedge(time.perf_counter())
+
+    def hedge(self, fill_time: float = None) -> None:
+        """
+        Sends an IOC for the exposure that is not hedged or being hedged yet. Must be called on the event loop thread.
+        """
+        if self._unattributed_fills:
+            # the exposure is not known until those fills are attributed, hedging resumes when the inserts are answered
+            return
+        volume = -int(round(self.get_exposure()))
+        if volume == 0:
+            return
+        side = SIDE_BID if volume > 0 else SIDE_ASK
+        volume = abs(volume)
+        if self.max_hedge_volume is not None:
+            volume = min(volume, self.max_hedge_volume)
+
+        top_of_book = self._get_top_of_book(self.hedge_instrument)
+        price = None
+        if top_of_book is not None:
+            if side == SIDE_BID and top_of_book.best_ask_price is not None:
+                price = top_of_book.best_ask_price + self.slippage_ticks * self.tick_size
+            elif side == SIDE_ASK and top_of_book.best_bid_price is not None:
+                price = top_of_book.best_bid_price - self.slippage_ticks * self.tick_size
+        if price is None:
+            self._nr_skipped += 1
+            logger.warning(f"Cannot hedge {side} {volume} lots of '{self.hedge_instrument}', there is no opposite side in the book.")
+            return
+        if self.tick_size:
+            price = round(round(price / self.tick_size) * self.tick_size, 8)
+
+        pending = _PendingHedge(side, volume)
+        self._pending.append(pending)
+        asyncio.ensure_future(self._send(pending, price, fill_time))
+
+    async def _send(self, pending, price, fill_time):
+        try:
+            order_id = await self._exec_client.insert_order(instrument_id=self.hedge_instrument, price=price, volume=pending.volume,
+                                                            side=pending.side, order_type=ORDER_TYPE_IOC, priority=PRIORITY_HIGH)
+        except Exception:
+            logger.exception('Hedge of %s %s lots of %s @ %s failed', pending.side, pending.volume, self.hedge_instrument, price)
+            self._release(pending)
+            self._on_answered()
+            return
+        if order_id is None:
+            # not sent, see ExecClient.insert_order
+            self._release(pending)
+            self._on_answered()
+            return
+
+        self._nr_hedges += 1
+        self._hedged_volume += pending.volume
+        if fill_time is not None:
+            latency = time.perf_counter() - fill_time
+            self._total_latency += latency
+            if latency > self._max_latency:
+                self._max_latency = latency
+
+        pending.order_id = order_id
+        self._pending_by_order_id[order_id] = pending
+        filled = self._unattributed_fills.pop(order_id, 0)
+        if filled:
+            self._fill(pending, filled)
+        if order_id in self._unattributed_done:
+            self._unattributed_done.discard(order_id)
+            self._release(pending)
+        elif pending.remaining > 0:
+            # the exchange cancels what an IOC did not fill, but its fills may still be on their way
+            pending.expiry = asyncio.get_event_loop().call_later(self.fill_timeout, self._release, pending)
+        self._on_answered()
+
+    def get_metrics(self) -> typing.Dict[str, float]:
+        """
+        Returns the number of hedges sent and skipped, the volume sent, the volume still in flight and the mean and
+        maximum time in seconds from the fill to the answer of its hedge.
+        """
+        return {
+            'hedges': self._nr_hedges,
+            'skipped': self._nr_skipped,
+            'hedged_volume': self._hedged_volume,
+            'in_flight_volume': self.get_in_flight_volume(),
+            'mean_latency': self._total_latency / self._nr_hedges if self._nr_hedges else 0.0,
+            'max_latency': self._max_latency,
+        }
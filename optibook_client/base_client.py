@@ -8,7 +8,6 @@ from .idl import common_capnp
 
 VERBOSE = 5
 logging.addLevelName(VERBOSE, 'VERBOSE')
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(name)-10s] [%(threadName)-12s] %(message)s')
 logger = logging.getLogger('client')
 
 TIMEOUT_VAL = 2
@@ -35,6 +34,23 @@ def logger_decorator(func):
 
 _default_settings = _get_default_settings()
 
+# pycapnp 1.x turned from_bytes into a context manager that frees the message when the block exits, while replies and
+# structs are used after _read moved on. from_segments returns a plain reader that keeps the segments alive, in all
+# versions that have it, and saves joining the frame.
+_HAS_FROM_SEGMENTS = hasattr(common_capnp.RawMessage, 'from_segments')
+
+
+def _message_from_frame(nr_segments_b, segment_sizes_b, segment_sizes, all_data):
+    if not _HAS_FROM_SEGMENTS:
+        return common_capnp.RawMessage.from_bytes(nr_segments_b + segment_sizes_b + all_data)
+    data = memoryview(all_data)
+    segments = []
+    offset = 0
+    for size in segment_sizes:
+        segments.append(data[offset:offset + size])
+        offset += size
+    return common_capnp.RawMessage.from_segments(segments)
+
 
 class Client:
     def __init__(self, host, port):
@@ -129,7 +145,7 @@ class RawClient:
         del self._extra_callbacks[c_id]
 
     async def _read(self):
-        logger.info(f'start read {self._reader}')
+        logger.info('start read %s', self._reader)
         try:
             while not self._writer.transport.is_closing():
                 nr_segments_b = await self._reader.readexactly(4)
@@ -138,13 +154,10 @@ class RawClient:
                 if nr_segments % 2 == 0:
                     bytes_to_read += 4
                 segment_sizes_b = await self._reader.readexactly(bytes_to_read)
-                total_size = 0
-                for i in range(nr_segments):
-                    segment_size = int.from_bytes(segment_sizes_b[i*4:(i+1)*4], byteorder='little')
-                    total_size += segment_size * 8
-                all_data = await self._reader.readexactly(total_size)
-                total_msg_buf = nr_segments_b + segment_sizes_b + all_data
-                msg = common_capnp.RawMessage.from_bytes(total_msg_buf)
+                segment_sizes = [int.from_bytes(segment_sizes_b[i*4:(i+1)*4], byteorder='little') * 8
+                                 for i in range(nr_segments)]
+                all_data = await self._reader.readexactly(sum(segment_sizes))
+                msg = _message_from_frame(nr_segments_b, segment_sizes_b, segment_sizes, all_data)
 
                 if msg.type == common_capnp.GenericReply.schema.node.id:
                     await self._handle_message_reply(msg.msg.as_struct(common_capnp.GenericReply.schema))
@@ -193,7 +206,7 @@ class RawClient:
         self.reset_data()
 
         self._reader, self._writer = await asyncio.open_connection(self._host, self._port, loop=loop)
-        logger.info(f'opened connection')
+        logger.info('opened connection')
 
         async def try_run():
             try:
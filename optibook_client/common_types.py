@@ -119,6 +119,70 @@ class PriceBook:
         return self.instrument_id == other.instrument_id and self.bids == other.bids and self.asks == other.asks
 
 
+class TopOfBook:
+    """
+    The best levels of an order book, derived once when the book is received.
+
+    Prices and volumes of a side that is empty are None, as are the mid price,
+    spread and micro price unless both sides are present.
+
+    Attributes
+    ----------
+    timestamp: datetime.datetime
+        The time the book was received.
+
+    instrument_id: str
+        The id of the instrument the book is on.
+
+    best_bid_price: float
+        Highest bid price.
+
+    best_bid_volume: int
+        Volume at the highest bid price.
+
+    best_ask_price: float
+        Lowest ask price.
+
+    best_ask_volume: int
+        Volume at the lowest ask price.
+
+    mid_price: float
+        Average of the best bid and best ask price.
+
+    spread: float
+        Best ask price minus best bid price.
+
+    micro_price: float
+        Mid price weighted by the volume on the opposite side,
+        i.e. (bid * ask_volume + ask * bid_volume) / (bid_volume + ask_volume).
+    """
+    __slots__ = ('timestamp', 'instrument_id', 'best_bid_price', 'best_bid_volume', 'best_ask_price', 'best_ask_volume',
+                 'mid_price', 'spread', 'micro_price')
+
+    def __init__(self, timestamp, instrument_id, best_bid_price, best_bid_volume, best_ask_price, best_ask_volume):
+        self.timestamp: datetime = timestamp
+        self.instrument_id: str = instrument_id
+        self.best_bid_price: Optional[float] = best_bid_price
+        self.best_bid_volume: Optional[int] = best_bid_volume
+        self.best_ask_price: Optional[float] = best_ask_price
+        self.best_ask_volume: Optional[int] = best_ask_volume
+
+        if best_bid_price is not None and best_ask_price is not None:
+            self.mid_price: Optional[float] = (best_bid_price + best_ask_price) / 2
+            self.spread: Optional[float] = best_ask_price - best_bid_price
+            total_volume = best_bid_volume + best_ask_volume
+            self.micro_price: Optional[float] = (best_bid_price * best_ask_volume + best_ask_price * best_bid_volume) / total_volume \
+                if total_volume else self.mid_price
+        else:
+            self.mid_price = None
+            self.spread = None
+            self.micro_price = None
+
+    def __repr__(self):
+        return f"[top_of_book] instrument_id={self.instrument_id}, bid={self.best_bid_volume}@{self.best_bid_price}, " \
+               f"ask={self.best_ask_volume}@{self.best_ask_price}"
+
+
 class Trade:
     """
     A private trade.
@@ -182,6 +246,63 @@ class OrderStatus:
         self.side: str = ''
 
 
+class ReplaceResult:
+    """
+    Outcome of replacing an order, i.e. deleting an order and inserting a new one at the same time.
+
+    Attributes
+    ----------
+    deleted: bool
+        True if the old order was deleted. False if there was no old order or it was already gone,
+        e.g. because it traded in the meantime.
+
+    order_id: int
+        The id of the newly inserted order, or None if the insert failed.
+
+    error: Exception
+        The exception raised by the delete or the insert, or None if both succeeded.
+    """
+    def __init__(self, deleted: bool = False, order_id: Optional[int] = None, error: Optional[Exception] = None):
+        self.deleted: bool = deleted
+        self.order_id: Optional[int] = order_id
+        self.error: Optional[Exception] = error
+
+    def __repr__(self):
+        return f"[replace_result] deleted={self.deleted}, order_id={self.order_id}, error={self.error!r}"
+
+
+class ReconcileResult:
+    """
+    Outcome of reconciling the outstanding orders on an instrument with the desired orders.
+
+    Attributes
+    ----------
+    nr_inserts: int
+        Number of orders inserted for new price levels.
+
+    nr_amends: int
+        Number of orders amended to a new volume on an unchanged price level.
+
+    nr_deletes: int
+        Number of orders deleted from stale price levels, or surplus orders on a kept level.
+
+    order_ids: List[int]
+        The ids of the newly inserted orders.
+
+    errors: List[Exception]
+        Exceptions raised by any of the operations.
+    """
+    def __init__(self):
+        self.nr_inserts: int = 0
+        self.nr_amends: int = 0
+        self.nr_deletes: int = 0
+        self.order_ids: List[int] = []
+        self.errors: List[Exception] = []
+
+    def __repr__(self):
+        return f"[reconcile_result] inserts={self.nr_inserts}, amends={self.nr_amends}, deletes={self.nr_deletes}, errors={self.errors!r}"
+
+
 class InstrumentType(Enum):
     SPOT = 1
     OPTION = 2
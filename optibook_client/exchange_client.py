@@ -2,13 +2,18 @@
 
 import logging
 import json
+import asyncio
+import bisect
 import itertools
+import math
 import typing
+from array import array
 from datetime import datetime
 from collections import defaultdict, deque
 from .base_client import Client, RawClient, logger_decorator
-from .common_types import PriceBook, PriceVolume, Trade, TradeTick, OrderStatus, Instrument, PriceChangeLimit
+from .common_types import PriceBook, PriceVolume, TopOfBook, Trade, TradeTick, OrderStatus, Instrument, PriceChangeLimit, ReplaceResult, ReconcileResult
 from .base_client import _default_settings
+from .rate_limiter import RateLimiter, PRIORITY_HIGH, PRIORITY_NORMAL
 
 import capnp
 from .idl import exec_capnp, info_capnp, common_capnp
@@ -28,6 +33,19 @@ ORDER_TYPE_IOC = 'ioc'
 ALL_ORDER_TYPES = [ORDER_TYPE_LIMIT, ORDER_TYPE_IOC]
 
 
+def _notify(callbacks, *args):
+    # a failing subscriber must not take down the feed it subscribed to
+    for f in callbacks:
+        try:
+            f(*args)
+        except Exception:
+            logger.exception('Exception occurred in callback')
+
+
+# versions of the instrument definitions, unique across clients so a reconnect never repeats one
+_instruments_versions = itertools.count(1)
+
+
 class InfoClient(RawClient):
     def __init__(self, host: str = None, port: int = None, max_nr_trade_history: int = 100, admin_password: str = None):
         if not host:
@@ -39,6 +57,10 @@ class InfoClient(RawClient):
 
         self._admin_password = admin_password
         self._max_trade_history = max_nr_trade_history
+        self._last_traded_price_callbacks = []
+        self._top_of_book_callbacks = []
+        self._trade_tick_callbacks = []
+        self._metrics = None
 
     def _new_request_id(self):
         req_id = self._request_id
@@ -48,11 +70,13 @@ class InfoClient(RawClient):
     def reset_data(self) -> None:
         super(InfoClient, self).reset_data()
         self._last_price_book_by_instrument_id = dict()
+        self._top_of_book_by_instrument_id = dict()
 
         self._trade_tick_history_last_polled_index = defaultdict(lambda: 0)
         self._trade_tick_history = defaultdict(deque)
         self._last_traded_price = {}
         self._instruments = {}
+        self._instruments_version = next(_instruments_versions)
         self._expired_instruments_last_polled = {}
 
     async def _on_connected(self):
@@ -66,8 +90,15 @@ class InfoClient(RawClient):
         msg.msg = subscribe
         await self.send_request(subscribe.requestId, msg)
         logger.debug('logged in!')
+        if self._metrics is not None:
+            self._metrics.count_connection('info')
+
+    def set_metrics(self, metrics) -> None:
+        self._metrics = metrics
 
     async def _on_message(self, msg):
+        if self._metrics is not None:
+            self._metrics.count_info_message(msg.type)
         if msg.type == info_capnp.PriceBook.schema.node.id:
             self.onPriceBook(msg.msg.as_struct(info_capnp.PriceBook.schema))
         elif msg.type == common_capnp.TradeTick.schema.node.id:
@@ -92,6 +123,7 @@ class InfoClient(RawClient):
 
     def onInstrumentStartupData(self, msg):
         self._last_traded_price[msg.instrumentId] = msg.lastTradedPrice
+        _notify(self._last_traded_price_callbacks, msg.instrumentId, msg.lastTradedPrice)
 
     def onInstrumentCreated(self, msg):
         limit = None
@@ -99,10 +131,12 @@ class InfoClient(RawClient):
             limit = PriceChangeLimit(msg.priceChangeLimit.absoluteChange, msg.priceChangeLimit.relativeChange)
         i = Instrument.from_extra_info_json(msg.instrumentId, msg.tickSize, limit, msg.extraInfo)
         self._instruments[msg.instrumentId] = i
+        self._instruments_version = next(_instruments_versions)
 
     def onInstrumentExpired(self, msg):
         self._expired_instruments_last_polled[msg.instrumentId] = self._instruments[msg.instrumentId]
         del self._instruments[msg.instrumentId]
+        self._instruments_version = next(_instruments_versions)
 
     def onInstrumentPaused(self, msg):
         self._instruments[msg.instrumentId].paused = True
@@ -116,6 +150,17 @@ class InfoClient(RawClient):
         pb.timestamp = datetime.now()
         self._last_price_book_by_instrument_id[priceBook.instrumentId] = pb
 
+        # derive the top of book once here, so readers do not have to index into the book on every access
+        best_bid = pb.bids[0] if pb.bids else None
+        best_ask = pb.asks[0] if pb.asks else None
+        top_of_book = TopOfBook(
+            pb.timestamp, pb.instrument_id,
+            best_bid.price if best_bid else None, best_bid.volume if best_bid else None,
+            best_ask.price if best_ask else None, best_ask.volume if best_ask else None)
+        self._top_of_book_by_instrument_id[priceBook.instrumentId] = top_of_book
+        if self._top_of_book_callbacks:
+            _notify(self._top_of_book_callbacks, top_of_book)
+
     def onTradeTick(self, trade):
         t = TradeTick()
         t.instrument_id = trade.instrumentId
@@ -127,12 +172,30 @@ class InfoClient(RawClient):
         t.seller = trade.seller
         t.trade_nr = trade.tradeId
         self._last_traded_price[trade.instrumentId] = trade.price
+        _notify(self._last_traded_price_callbacks, t.instrument_id, t.price)
         inst_hist = self._trade_tick_history[t.instrument_id]
         inst_hist.append(t)
         while len(inst_hist) > self._max_trade_history:
             inst_hist.popleft()
             self._trade_tick_history_last_polled_index[t.instrument_id] = max(
                 self._trade_tick_history_last_polled_index[t.instrument_id] - 1, 0)
+        if self._trade_tick_callbacks:
+            _notify(self._trade_tick_callbacks, t)
+
+    def add_last_traded_price_callback(self, f: typing.Callable[[str, float], None]) -> None:
+        self._last_traded_price_callbacks.append(f)
+
+    def add_top_of_book_callback(self, f: typing.Callable[[TopOfBook], None]) -> None:
+        self._top_of_book_callbacks.append(f)
+
+    def remove_top_of_book_callback(self, f: typing.Callable[[TopOfBook], None]) -> None:
+        self._top_of_book_callbacks.remove(f)
+
+    def add_trade_tick_callback(self, f: typing.Callable[[TradeTick], None]) -> None:
+        self._trade_tick_callbacks.append(f)
+
+    def remove_trade_tick_callback(self, f: typing.Callable[[TradeTick], None]) -> None:
+        self._trade_tick_callbacks.remove(f)
 
     def get_last_traded_price(self, instrument_id: str) -> float:
         return self._last_traded_price.get(instrument_id, None)
@@ -140,6 +203,9 @@ class InfoClient(RawClient):
     def get_last_price_book(self, instrument_id: str) -> PriceBook:
         return self._last_price_book_by_instrument_id.get(instrument_id, None)
 
+    def get_top_of_book(self, instrument_id: str) -> TopOfBook:
+        return self._top_of_book_by_instrument_id.get(instrument_id, None)
+
     def get_trade_tick_history(self, instrument_id: str) -> typing.List[TradeTick]:
         return list(self._trade_tick_history.get(instrument_id, []))
 
@@ -161,49 +227,294 @@ class InfoClient(RawClient):
     def get_instruments(self) -> typing.Dict[str, Instrument]:
         return self._instruments
 
+    def get_instruments_version(self) -> int:
+        return self._instruments_version
+
 
 class PositionAccountant:
-    def __init__(self, positions=defaultdict()):
-        self._position_by_instrument_id = {}
+    """
+    Keeps position, average price, cash and realized/unrealized PnL per instrument.
+
+    Every instrument gets a slot in a set of flat arrays, so a trade, booking or mark price change only touches one slot
+    and adjusts the running totals, which makes reading the total PnL O(1).
+    Unrealized PnL is valued against the mark price, which is normally the last traded price.
+    """
+    def __init__(self, positions=defaultdict(), mark_prices=None):
+        self._slot_by_instrument_id: typing.Dict[str, int] = {}
+        self._instrument_ids: typing.List[str] = []
+        self._booked = bytearray()
+        self._volume = array('q')
+        self._cash = array('d')
+        self._average_price = array('d')
+        self._realized_pnl = array('d')
+        self._unrealized_pnl = array('d')
+        self._mark_price = array('d')
+
+        self._total_cash = 0.0
+        self._total_realized_pnl = 0.0
+        self._total_unrealized_pnl = 0.0
+        # number of open positions for which no mark price is known yet
+        self._nr_unmarked = 0
+
+        if mark_prices:
+            for instrument_id, price in mark_prices.items():
+                self.update_mark_price(instrument_id, price)
+
         for inst in positions:
-            self._position_by_instrument_id[inst.instrumentId] = { 'volume' : inst.position, 'cash' : inst.cash }
+            i = self._get_slot(inst.instrumentId)
+            self._booked[i] = 1
+            # the exchange only tells us position and cash, so take the average price that explains the cash
+            if inst.position != 0:
+                self._set_position(i, inst.position, -inst.cash / inst.position, 0.0)
+            else:
+                self._set_position(i, 0, 0.0, inst.cash)
+            self._cash[i] = inst.cash
+            self._total_cash += inst.cash
+
+    def _get_slot(self, instrument_id):
+        i = self._slot_by_instrument_id.get(instrument_id)
+        if i is None:
+            i = len(self._instrument_ids)
+            self._slot_by_instrument_id[instrument_id] = i
+            self._instrument_ids.append(instrument_id)
+            self._booked.append(0)
+            self._volume.append(0)
+            self._cash.append(0.0)
+            self._average_price.append(0.0)
+            self._realized_pnl.append(0.0)
+            self._unrealized_pnl.append(0.0)
+            self._mark_price.append(math.nan)
+        return i
+
+    def _set_position(self, i, volume, average_price, realized_pnl):
+        mark = self._mark_price[i]
+        if self._volume[i] != 0 and mark != mark:
+            self._nr_unmarked -= 1
+        if volume != 0 and mark != mark:
+            self._nr_unmarked += 1
+
+        unrealized_pnl = (mark - average_price) * volume if volume != 0 and mark == mark else 0.0
+        self._total_realized_pnl += realized_pnl - self._realized_pnl[i]
+        self._total_unrealized_pnl += unrealized_pnl - self._unrealized_pnl[i]
+        self._volume[i] = volume
+        self._average_price[i] = average_price
+        self._realized_pnl[i] = realized_pnl
+        self._unrealized_pnl[i] = unrealized_pnl
+
+    def _book(self, instrument_id, signed_volume, price):
+        i = self._get_slot(instrument_id)
+        self._booked[i] = 1
+        self._cash[i] -= signed_volume * price
+        self._total_cash -= signed_volume * price
+
+        volume = self._volume[i]
+        average_price = self._average_price[i]
+        realized_pnl = self._realized_pnl[i]
+        new_volume = volume + signed_volume
+
+        if volume == 0 or (volume > 0) == (signed_volume > 0):
+            # opening or increasing a position
+            average_price = (average_price * volume + price * signed_volume) / new_volume
+        else:
+            # reducing, closing or flipping a position
+            closed_volume = min(abs(signed_volume), abs(volume))
+            realized_pnl += (price - average_price) * closed_volume * (1 if volume > 0 else -1)
+            if new_volume == 0:
+                average_price = 0.0
+            elif (new_volume > 0) != (volume > 0):
+                average_price = price
+
+        self._set_position(i, new_volume, average_price, realized_pnl)
 
     def handle_trade(self, trade):
-        logger.debug(f'Private trade: {trade}.')
+        # each field is read from the struct once, and logged as a plain value so it can be formatted later
+        instrument_id, side, volume, price = trade.instrumentId, trade.side, trade.volume, trade.price
+        logger.debug('Private trade: %s %s %s @ %s.', instrument_id, side, volume, price)
 
-        if trade.side == 'bid':
+        if side == 'bid':
             sidemult = 1
-        elif trade.side == 'ask':
+        elif side == 'ask':
             sidemult = -1
         else:
             raise Exception('Unknown trade side.')
 
-        if trade.instrumentId not in self._position_by_instrument_id:
-            self._position_by_instrument_id[trade.instrumentId] = { 'volume' : 0, 'cash' : 0.0 }
-        self._position_by_instrument_id[trade.instrumentId]['volume'] += sidemult * trade.volume
-        self._position_by_instrument_id[trade.instrumentId]['cash'] -= sidemult * trade.volume * trade.price
+        self._book(instrument_id, sidemult * volume, price)
 
     def handle_single_sided_booking(self, ssb):
-        logger.debug(f'Single sided booking: {ssb}')
+        instrument_id, action, volume, price = ssb.instrumentId, ssb.action, ssb.volume, ssb.price
+        logger.debug('Single sided booking: %s %s %s @ %s', instrument_id, action, volume, price)
 
-        if ssb.action == ACTION_BUY:
+        if action == ACTION_BUY:
             sidemult = 1
-        elif ssb.action == ACTION_SELL:
+        elif action == ACTION_SELL:
             sidemult = -1
         else:
-            raise Exception('Unknown action: ' + str(ssb.action))
+            raise Exception('Unknown action: ' + str(action))
+
+        self._book(instrument_id, sidemult * volume, price)
+
+    def update_mark_price(self, instrument_id, price):
+        if not price:
+            return
+        i = self._get_slot(instrument_id)
+        volume = self._volume[i]
+        if volume != 0 and self._mark_price[i] != self._mark_price[i]:
+            self._nr_unmarked -= 1
+        self._mark_price[i] = price
 
-        if ssb.instrumentId not in self._position_by_instrument_id:
-            self._position_by_instrument_id[ssb.instrumentId] = { 'volume' : 0, 'cash' : 0.0 }
-        self._position_by_instrument_id[ssb.instrumentId]['volume'] += sidemult * ssb.volume
-        self._position_by_instrument_id[ssb.instrumentId]['cash'] -= sidemult * ssb.volume * ssb.price
+        if volume != 0:
+            unrealized_pnl = (price - self._average_price[i]) * volume
+            self._total_unrealized_pnl += unrealized_pnl - self._unrealized_pnl[i]
+            self._unrealized_pnl[i] = unrealized_pnl
+
+    def get_mark_prices(self) -> typing.Dict[str, float]:
+        return {k: self._mark_price[i] for k, i in self._slot_by_instrument_id.items() if self._mark_price[i] == self._mark_price[i]}
 
     def get_positions(self) -> typing.Dict[str, typing.Dict[str, float]]:
-        return self._position_by_instrument_id
-    
+        return {k: {'volume': self._volume[i], 'cash': self._cash[i]}
+                for k, i in self._slot_by_instrument_id.items() if self._booked[i]}
+
+    def get_instrument_pnls(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+        Position, realized and unrealized PnL per booked instrument. Safe to call from another thread than the one that
+        books the trades, e.g. to export metrics.
+        """
+        return {k: {'volume': self._volume[i], 'realized_pnl': self._realized_pnl[i], 'unrealized_pnl': self._unrealized_pnl[i]}
+                for k, i in list(self._slot_by_instrument_id.items()) if self._booked[i]}
+
+    def get_position(self, instrument_id) -> int:
+        i = self._slot_by_instrument_id.get(instrument_id)
+        return self._volume[i] if i is not None else 0
+
+    def get_average_price(self, instrument_id) -> float:
+        i = self._slot_by_instrument_id.get(instrument_id)
+        return self._average_price[i] if i is not None and self._volume[i] != 0 else None
+
     def get_cash(self) -> float:
-        return sum([pos['cash'] for pos in self._position_by_instrument_id.values()])
-    
+        return self._total_cash
+
+    def get_realized_pnl(self, instrument_id: str = None) -> float:
+        if instrument_id is None:
+            return self._total_realized_pnl
+        i = self._slot_by_instrument_id.get(instrument_id)
+        return self._realized_pnl[i] if i is not None else 0.0
+
+    def get_unrealized_pnl(self, instrument_id: str = None) -> float:
+        if instrument_id is None:
+            return self._total_unrealized_pnl
+        i = self._slot_by_instrument_id.get(instrument_id)
+        return self._unrealized_pnl[i] if i is not None else 0.0
+
+    def get_pnl(self) -> typing.Optional[float]:
+        """
+        Total realized plus unrealized PnL, or None if there is an open position without a mark price.
+        """
+        if self._nr_unmarked:
+            return None
+        return self._total_realized_pnl + self._total_unrealized_pnl
+
+
+class OrderIndex:
+    """
+    Price ordered view of our own outstanding orders on a single instrument.
+
+    Maintained from the order updates of the exec feed. Per side it keeps the sorted price levels, the orders and volume
+    per level and the total volume, so the best own order and the aggregate volumes are available without sorting or
+    summing. The version is incremented on every change, so readers can cheaply tell whether anything changed.
+
+    Only the event loop thread changes the index. The orders and price levels of a side are also kept as tuples, which are
+    rebuilt and replaced whole on every change of that side, so the getters can be called from any thread without ever
+    seeing a side half updated. Two getter calls may see different versions though.
+    """
+    def __init__(self, instrument_id: str):
+        self.instrument_id: str = instrument_id
+        self.version: int = 0
+        self._order_by_order_id: typing.Dict[int, OrderStatus] = {}
+        # per side: ascending list of prices, orders per price level and volume per price level
+        self._prices = {SIDE_BID: [], SIDE_ASK: []}
+        self._orders_by_price = {SIDE_BID: {}, SIDE_ASK: {}}
+        self._volume_by_price = {SIDE_BID: {}, SIDE_ASK: {}}
+        self._volume = {SIDE_BID: 0, SIDE_ASK: 0}
+        self._best_order = {SIDE_BID: None, SIDE_ASK: None}
+        # per side, best price first, replaced whole for readers on other threads
+        self._orders = {SIDE_BID: (), SIDE_ASK: ()}
+        self._price_levels = {SIDE_BID: (), SIDE_ASK: ()}
+
+    def update(self, order: OrderStatus) -> None:
+        previous = self._order_by_order_id.pop(order.order_id, None)
+        if previous is not None:
+            self._remove(previous)
+        if order.volume > 0:
+            self._order_by_order_id[order.order_id] = order
+            self._add(order)
+        self.version += 1
+
+    def _add(self, order):
+        side = order.side
+        level = self._orders_by_price[side].get(order.price)
+        if level is None:
+            level = self._orders_by_price[side][order.price] = {}
+            self._volume_by_price[side][order.price] = 0
+            bisect.insort(self._prices[side], order.price)
+        level[order.order_id] = order
+        self._volume_by_price[side][order.price] += order.volume
+        self._volume[side] += order.volume
+        self._update_side(side)
+
+    def _remove(self, order):
+        side = order.side
+        level = self._orders_by_price[side][order.price]
+        del level[order.order_id]
+        self._volume[side] -= order.volume
+        if level:
+            self._volume_by_price[side][order.price] -= order.volume
+        else:
+            del self._orders_by_price[side][order.price]
+            del self._volume_by_price[side][order.price]
+            prices = self._prices[side]
+            del prices[bisect.bisect_left(prices, order.price)]
+        self._update_side(side)
+
+    def _update_side(self, side):
+        prices = self._prices[side]
+        ordered_prices = prices[::-1] if side == SIDE_BID else prices
+        levels = self._orders_by_price[side]
+        volumes = self._volume_by_price[side]
+        self._orders[side] = tuple(o for price in ordered_prices for o in levels[price].values())
+        self._price_levels[side] = tuple(PriceVolume(price, volumes[price]) for price in ordered_prices)
+        # the oldest order on the best level, as that is the one with time priority
+        self._best_order[side] = self._orders[side][0] if prices else None
+
+    def get_best_order(self, side: str) -> typing.Optional[OrderStatus]:
+        return self._best_order[side]
+
+    def get_best_price(self, side: str) -> typing.Optional[float]:
+        order = self._best_order[side]
+        return order.price if order is not None else None
+
+    def get_volume(self, side: str, price: float = None) -> int:
+        if price is None:
+            return self._volume[side]
+        return self._volume_by_price[side].get(price, 0)
+
+    def get_order(self, order_id: int) -> typing.Optional[OrderStatus]:
+        return self._order_by_order_id.get(order_id)
+
+    def get_orders(self, side: str) -> typing.List[OrderStatus]:
+        """
+        Returns the orders on a side, from best to worst price.
+        """
+        return list(self._orders[side])
+
+    def get_price_levels(self, side: str) -> typing.List[PriceVolume]:
+        """
+        Returns the aggregate volume per price level on a side, from best to worst price.
+        """
+        return list(self._price_levels[side])
+
+    def __len__(self):
+        return len(self._order_by_order_id)
+
 
 class ExecClient(Client):
     def __init__(self, host: str = None, port: int = None, max_nr_trade_history: str = 100):
@@ -214,6 +525,11 @@ class ExecClient(Client):
 
         super().__init__(host=host, port=port)
         self._max_trade_history = max_nr_trade_history
+        self._risk_checker = None
+        self._rate_limiter = None
+        self._trade_callbacks = []
+        self._auto_hedger = None
+        self._metrics = None
 
     def reset_data(self) -> None:
         super(ExecClient, self).reset_data()
@@ -223,9 +539,27 @@ class ExecClient(Client):
         self._trade_history_last_polled_index = defaultdict(lambda: 0)
         self._trade_history = defaultdict(deque)
         self._order_status_by_order_id = defaultdict(dict)
+        self._order_index_by_instrument_id: typing.Dict[str, OrderIndex] = {}
 
     async def _on_connected(self):
         self._exec_portal = self._client.bootstrap().cast_as(exec_capnp.ExecPortal)
+        if self._metrics is not None:
+            self._metrics.count_connection('exec')
+
+    async def _request(self, method, promise):
+        # every request to the exec port goes through here, so it is timed when metrics are enabled
+        if self._metrics is None:
+            return await promise.a_wait()
+        return await self._metrics.time_exec_request(method, promise.a_wait())
+
+    def _check_risk(self, method, check, *args):
+        try:
+            check(*args)
+        except Exception:
+            # a PreTradeRiskError, the order is not sent
+            if self._metrics is not None:
+                self._metrics.count_reject(method, 'risk')
+            raise
 
     async def authenticate(self, username: str = None, password: str = None, admin_password: str = None) -> None:
         if not username:
@@ -239,21 +573,166 @@ class ExecClient(Client):
         else:
             result = await self._exec_portal.adminLogin(username, password, admin_password, self.ExecSubscription(self)).a_wait()
         self._exec = result.exec
-        self._position_accountant = PositionAccountant(positions=result.positions.positions)
+        # keep the mark prices that were already received on the info feed
+        self._position_accountant = PositionAccountant(positions=result.positions.positions,
+                                                       mark_prices=self._position_accountant.get_mark_prices())
 
-    async def insert_order(self, *, instrument_id: str, price: float, volume: int, side: str, order_type: str) -> int:
+    async def insert_order(self, *, instrument_id: str, price: float, volume: int, side: str, order_type: str,
+                           priority: int = None, slot: typing.Hashable = None) -> typing.Optional[int]:
         assert side in ALL_SIDES, f"side must be one of {ALL_SIDES}"
         assert order_type in ALL_ORDER_TYPES, f"order_type must be one of {ALL_ORDER_TYPES}"
-        return (await self._exec.insertOrder(instrument_id, price, volume, side, order_type).a_wait()).orderId
-
-    async def amend_order(self, instrument_id: str, order_id: int, volume: int) -> bool:
-        return (await self._exec.amendOrder(instrument_id, order_id, volume).a_wait()).success
-
-    async def delete_order(self, instrument_id: str, order_id: int) -> bool:
-        return (await self._exec.deleteOrder(instrument_id, order_id).a_wait()).success
+        if self._risk_checker is not None:
+            self._check_risk('insert', self._risk_checker.check_insert, instrument_id, price, volume, side)
+        if self._rate_limiter is not None:
+            if priority is None:
+                # IOCs are hedges, new limit orders are quotes
+                priority = PRIORITY_HIGH if order_type == ORDER_TYPE_IOC else PRIORITY_NORMAL
+            if not await self._rate_limiter.acquire(priority, slot):
+                return None
+        return (await self._request('insert', self._exec.insertOrder(instrument_id, price, volume, side, order_type))).orderId
+
+    async def amend_order(self, instrument_id: str, order_id: int, volume: int,
+                          priority: int = None, slot: typing.Hashable = None) -> bool:
+        if self._risk_checker is not None:
+            self._check_risk('amend', self._risk_checker.check_amend, instrument_id, order_id, volume)
+        if self._rate_limiter is not None:
+            if priority is None:
+                # reducing the volume of an order reduces risk
+                order = self.get_order_index(instrument_id).get_order(order_id)
+                priority = PRIORITY_HIGH if order is not None and volume < order.volume else PRIORITY_NORMAL
+            if not await self._rate_limiter.acquire(priority, slot):
+                return False
+        success = (await self._request('amend', self._exec.amendOrder(instrument_id, order_id, volume))).success
+        if not success and self._metrics is not None:
+            self._metrics.count_reject('amend', 'exchange')
+        return success
+
+    async def delete_order(self, instrument_id: str, order_id: int,
+                           priority: int = PRIORITY_HIGH, slot: typing.Hashable = None) -> bool:
+        if self._rate_limiter is not None and not await self._rate_limiter.acquire(priority, slot):
+            return False
+        return (await self._request('delete', self._exec.deleteOrder(instrument_id, order_id))).success
 
     async def delete_orders(self, instrument_id: str) -> None:
-        await self._exec.deleteOrders(instrument_id).a_wait()
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire(PRIORITY_HIGH)
+        await self._request('delete_all', self._exec.deleteOrders(instrument_id))
+
+    async def delete_orders_on_side(self, instrument_id: str, side: str) -> None:
+        orders = self.get_order_index(instrument_id).get_orders(side)
+        if orders:
+            await asyncio.gather(*[self.delete_order(instrument_id, o.order_id) for o in orders])
+
+    async def replace_order(self, *, instrument_id: str, order_id: typing.Optional[int], price: float, volume: int, side: str,
+                            order_type: str, priority: int = None, slot: typing.Hashable = None) -> ReplaceResult:
+        """
+        Deletes order_id and inserts the new order concurrently, so a replace costs a single round-trip.
+        If order_id is None only the insert is sent. Failures of either leg are reported in the result instead of raised.
+        """
+        insert = self.insert_order(instrument_id=instrument_id, price=price, volume=volume, side=side, order_type=order_type,
+                                   priority=priority, slot=slot)
+        if order_id is None:
+            deleted, new_order_id = False, (await asyncio.gather(insert, return_exceptions=True))[0]
+        else:
+            deleted, new_order_id = await asyncio.gather(self.delete_order(instrument_id, order_id), insert, return_exceptions=True)
+
+        result = ReplaceResult()
+        if isinstance(deleted, Exception):
+            result.error = deleted
+        else:
+            result.deleted = deleted
+        if isinstance(new_order_id, Exception):
+            result.error = new_order_id
+        else:
+            result.order_id = new_order_id
+        return result
+
+    async def reconcile_orders(self, instrument_id: str, desired_orders: typing.Dict[str, typing.List[PriceVolume]]) -> ReconcileResult:
+        """
+        Brings the outstanding limit orders on the sides in desired_orders to the desired price levels with the fewest
+        messages: orders on a level that is still wanted are amended if only the volume changed, orders on levels that
+        are no longer wanted are deleted and new levels are inserted. All operations are sent concurrently.
+        Sides that are not in desired_orders are left alone; an empty list removes all orders on that side.
+        """
+        index = self.get_order_index(instrument_id)
+        result = ReconcileResult()
+        operations = []
+
+        for side, levels in desired_orders.items():
+            assert side in ALL_SIDES, f"side must be one of {ALL_SIDES}"
+            desired_volume_by_price = {}
+            for level in levels:
+                if level.volume > 0:
+                    price = round(level.price, 8)
+                    desired_volume_by_price[price] = desired_volume_by_price.get(price, 0) + level.volume
+
+            for order in index.get_orders(side):
+                desired_volume = desired_volume_by_price.get(round(order.price, 8))
+                if desired_volume is None:
+                    # stale level, or a surplus order on a level we already kept an order on
+                    operations.append(self.delete_order(instrument_id, order.order_id))
+                    result.nr_deletes += 1
+                    continue
+                # keep the oldest order on the level, it has time priority
+                del desired_volume_by_price[round(order.price, 8)]
+                if order.volume != desired_volume:
+                    operations.append(self._amend_or_replace(order, desired_volume, result))
+                    result.nr_amends += 1
+
+            for price, volume in desired_volume_by_price.items():
+                operations.append(self._insert_for_reconcile(instrument_id, price, volume, side, result))
+                result.nr_inserts += 1
+
+        outcomes = await asyncio.gather(*operations, return_exceptions=True)
+        result.errors.extend(o for o in outcomes if isinstance(o, Exception))
+        return result
+
+    async def _insert_for_reconcile(self, instrument_id, price, volume, side, result):
+        order_id = await self.insert_order(instrument_id=instrument_id, price=price, volume=volume, side=side, order_type=ORDER_TYPE_LIMIT)
+        if order_id is not None:
+            result.order_ids.append(order_id)
+
+    async def _amend_or_replace(self, order, volume, result):
+        if await self.amend_order(order.instrument_id, order.order_id, volume):
+            return
+        # the exchange refused the amend, e.g. because the order traded in the meantime: fall back to delete and insert
+        replace_result = await self.replace_order(instrument_id=order.instrument_id, order_id=order.order_id, price=order.price,
+                                                  volume=volume, side=order.side, order_type=ORDER_TYPE_LIMIT)
+        if replace_result.order_id is not None:
+            result.order_ids.append(replace_result.order_id)
+        if replace_result.error is not None:
+            raise replace_result.error
+
+    def set_risk_checker(self, risk_checker) -> None:
+        """
+        Installs a checker whose check_insert/check_amend are called before every insert and amend is sent.
+        They raise to reject the order locally. None removes the checker.
+        """
+        self._risk_checker = risk_checker
+
+    def set_rate_limiter(self, rate_limiter: typing.Optional[RateLimiter]) -> None:
+        """
+        Installs a rate limiter that every insert, amend and delete has to acquire before it is sent. None removes it.
+        """
+        self._rate_limiter = rate_limiter
+
+    def get_rate_limiter(self) -> typing.Optional[RateLimiter]:
+        return self._rate_limiter
+
+    def set_auto_hedger(self, auto_hedger) -> None:
+        self._auto_hedger = auto_hedger
+
+    def set_metrics(self, metrics) -> None:
+        self._metrics = metrics
+
+    def get_auto_hedger(self):
+        return self._auto_hedger
+
+    def add_trade_callback(self, f: typing.Callable[[Trade], None]) -> None:
+        self._trade_callbacks.append(f)
+
+    def remove_trade_callback(self, f: typing.Callable[[Trade], None]) -> None:
+        self._trade_callbacks.remove(f)
 
     async def update_instrument_parameters(self, instrument_id: str, parameters: typing.Dict[str, typing.Any]) -> None:
         await self._exec.updateInstrumentParameters(instrument_id, json.dumps(parameters)).a_wait()
@@ -261,15 +740,33 @@ class ExecClient(Client):
     def get_positions(self) -> typing.Dict[str, int]:
         return { k : v['volume'] for k, v in self._position_accountant.get_positions().items() }
 
+    def get_position(self, instrument_id: str) -> int:
+        return self._position_accountant.get_position(instrument_id)
+
     def get_positions_and_cash(self) -> typing.Dict[str, typing.Dict[str, float]]:
         return self._position_accountant.get_positions()
 
     def get_cash(self) -> typing.Dict[str, float]:
         return self._position_accountant.get_cash()
+
+    def get_pnl(self) -> typing.Optional[float]:
+        return self._position_accountant.get_pnl()
+
+    def get_instrument_pnls(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return self._position_accountant.get_instrument_pnls()
+
+    def update_mark_price(self, instrument_id: str, price: float) -> None:
+        self._position_accountant.update_mark_price(instrument_id, price)
                 
     def get_outstanding_orders(self, instrument_id: str) -> typing.Dict[int, OrderStatus]:
         return self._order_status_by_order_id[instrument_id].copy()
 
+    def get_order_index(self, instrument_id: str) -> OrderIndex:
+        index = self._order_index_by_instrument_id.get(instrument_id)
+        if index is None:
+            index = self._order_index_by_instrument_id.setdefault(instrument_id, OrderIndex(instrument_id))
+        return index
+
     def get_trade_history(self, instrument_id: str) -> typing.List[Trade]:
         return list(self._trade_history[instrument_id])
 
@@ -301,7 +798,11 @@ class ExecClient(Client):
             self._exec._order_status_by_order_id[instrument_id][order_id] = o
             if order.volume == 0:
                 self._exec._order_status_by_order_id[instrument_id].pop(order_id)
-            logger.debug('order %s', order)
+            self._exec.get_order_index(instrument_id).update(o)
+            if self._exec._auto_hedger is not None:
+                self._exec._auto_hedger.on_order_update(o)
+            # plain values, the struct is only valid during this call and the record may be written later
+            logger.debug('order %s %s %s %s @ %s', order_id, instrument_id, o.side, o.volume, o.price)
 
         @logger_decorator
         def onTrade(self, trade, **kwargs):
@@ -319,7 +820,15 @@ class ExecClient(Client):
                     self._exec._trade_history_last_polled_index[tc.instrument_id] - 1, 0)
 
             self._exec._position_accountant.handle_trade(trade)
-            logger.debug('trade end %s', trade)
+            if self._exec._auto_hedger is not None:
+                # hedge before anything else sees the fill
+                try:
+                    self._exec._auto_hedger.on_trade(tc)
+                except Exception:
+                    logger.exception('Exception occurred while hedging a trade')
+            if self._exec._trade_callbacks:
+                _notify(self._exec._trade_callbacks, tc)
+            logger.debug('trade end %s %s %s %s @ %s', tc.order_id, tc.instrument_id, tc.side, tc.volume, tc.price)
 
         @logger_decorator
         def onSingleSidedBooking(self, ssb, **kwargs):
@@ -327,7 +836,7 @@ class ExecClient(Client):
 
         @logger_decorator
         def onForcedDisconnect(self, reason, **kwargs):
-            logger.error(f'Forcing a disconnect due to an error: {reason}.')
+            logger.error('Forcing a disconnect due to an error: %s.', reason)
 
         @logger_decorator
         def onNotification(self, source, msg, **kwargs):
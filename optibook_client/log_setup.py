@@ -0,0 +1,97 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import typing
+
+LOG_FORMAT = '%(asctime)s [%(name)-10s] [%(threadName)-12s] %(message)s'
+
+# argument types that cannot change between the log call and the moment the writer thread formats the record
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records for a QueueListener, leaving the formatting of the message to the listener's thread.
+
+    The standard QueueHandler formats every record on the calling thread before queueing it. This one only does so when
+    the record must be made safe to hand over: when an argument could change or be freed in the meantime (e.g. a capnp
+    struct that is only valid during the callback that received it), or when it carries exception info.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if record.exc_info or not _is_immutable(args):
+            return super().prepare(record)
+        return record
+
+
+def _is_immutable(args) -> bool:
+    if isinstance(args, tuple):
+        return all(isinstance(a, _IMMUTABLE_TYPES) for a in args)
+    if isinstance(args, dict):
+        return all(isinstance(a, _IMMUTABLE_TYPES) for a in args.values())
+    return isinstance(args, _IMMUTABLE_TYPES)
+
+
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: typing.Union[int, str] = logging.INFO,
+                  asynchronous: bool = True,
+                  handlers: typing.List[logging.Handler] = None,
+                  fmt: str = LOG_FORMAT) -> None:
+    """
+    Configure the root logger, replacing any handlers it has. Importing the client no longer configures logging, call
+    this from the main script of a bot instead.
+
+    In asynchronous mode, a log call on the trading or event loop thread only puts the record on a queue; a background
+    thread formats it and writes it to the handlers. Log calls below the level cost no more than the level check, so
+    pass arguments %-style (logger.debug('order %s', order_id)) instead of formatting them up front.
+
+    Parameters
+    ----------
+    level: int or str
+        The level of the root logger, e.g. logging.DEBUG or 'INFO'.
+    asynchronous: bool
+        Write the records from a background thread instead of from the thread that logs them.
+    handlers: typing.List[logging.Handler]
+        Optional, the handlers that write the records. Defaults to a handler that writes to stderr.
+    fmt: str
+        The format applied to the handlers that do not have a formatter yet.
+    """
+    global _listener
+    stop_logging()
+
+    if handlers is None:
+        handlers = [logging.StreamHandler(sys.stderr)]
+    for handler in handlers:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(fmt))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+    if asynchronous:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(LazyQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+
+
+def stop_logging() -> None:
+    """
+    Write the records that are still queued and stop the background thread of setup_logging. Runs at exit.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,436 @@
+import asyncio
+import bisect
+import http.server
+import logging
+import math
+import threading
+import time
+import typing
+
+from .idl import common_capnp, info_capnp
+
+logger = logging.getLogger('client')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names: typing.Sequence[str], values: typing.Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class _Metric:
+    """
+    A named family of time series that differ in the values of their labels. A metric without labels is its own, only,
+    time series and can be updated directly.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: typing.Dict[typing.Tuple[str, ...], typing.Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """
+        Returns the time series for the label values, in the order of labelnames. Keep the result to update it in a hot
+        path, so the lookup is only done once.
+        """
+        assert len(values) == len(self.labelnames), f"{self.name} has labels {self.labelnames}"
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> typing.Iterator[typing.Tuple[str, typing.Tuple[str, ...], typing.Tuple[str, ...], float]]:
+        for key, child in list(self._children.items()):
+            for suffix, extra_names, extra_values, value in child.samples():
+                yield suffix, self.labelnames + extra_names, key + extra_values, value
+
+    def expose(self) -> typing.List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for suffix, names, values, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        assert amount >= 0, "counters can only go up"
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+    def samples(self):
+        yield '', (), (), self._value
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. a number of messages. By convention its name ends in _total.
+    """
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._children[()].inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def get(self) -> float:
+        return self._value
+
+    def samples(self):
+        yield '', (), (), self._value
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. a position.
+
+    A gauge with a callback is not updated by the code it describes: the callback is called when the registry is
+    exposed, on the thread that scrapes it, and returns the value, or for a gauge with labels a dict from tuples of label
+    values to values. Use it for state that is already kept elsewhere, so keeping the metric costs nothing in between.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = (),
+                 callback: typing.Callable[[], typing.Any] = None):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._children[()].dec(amount)
+
+    def _samples(self):
+        if self._callback is None:
+            yield from super()._samples()
+            return
+        try:
+            values = self._callback()
+        except Exception:
+            logger.exception('Exception occurred while reading gauge %s', self.name)
+            return
+        if not self.labelnames:
+            if values is not None:
+                yield '', (), (), values
+            return
+        for key, value in values.items():
+            if value is not None:
+                yield '', self.labelnames, tuple(str(k) for k in key), value
+
+
+class _HistogramChild:
+    __slots__ = ('_upper_bounds', '_counts', '_sum', '_lock')
+
+    def __init__(self, upper_bounds):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for upper_bound, count in zip(self._upper_bounds + (math.inf,), counts):
+            cumulative += count
+            yield '_bucket', ('le',), (_format_value(upper_bound),), cumulative
+        yield '_sum', (), (), total
+        yield '_count', (), (), cumulative
+
+
+class Histogram(_Metric):
+    """
+    Counts observations, e.g. latencies, in buckets of cumulative upper bounds, and keeps their sum and count.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = (),
+                 buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        assert list(buckets) == sorted(buckets), "buckets must be sorted"
+        self._upper_bounds = tuple(float(b) for b in buckets if b != math.inf)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, exposed together in the Prometheus text format.
+
+    Updating a metric only takes a lock around an addition, so it can be done on the event loop and strategy threads.
+    Exposing, e.g. by a MetricsServer, happens on the thread that asks for it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: typing.Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            assert metric.name not in self._metrics, f"A metric named {metric.name} is already registered"
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def _get_or_register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        assert type(metric) is cls and metric.labelnames == tuple(labelnames), \
+            f"{name} is already registered as another metric"
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()) -> Counter:
+        """
+        Returns the counter with this name, registering it if it does not exist yet.
+        """
+        return self._get_or_register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: typing.Sequence[str] = (),
+              callback: typing.Callable[[], typing.Any] = None) -> Gauge:
+        """
+        Returns the gauge with this name, registering it if it does not exist yet.
+        """
+        return self._get_or_register(Gauge, name, documentation, labelnames, callback=callback)
+
+    def histogram(self, name: str, documentation: str, labelnames: typing.Sequence[str] = (),
+                  buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Returns the histogram with this name, registering it if it does not exist yet.
+        """
+        return self._get_or_register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def expose(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Serves a MetricsRegistry over HTTP at /metrics, from its own threads, so a scrape never runs on the event loop or
+    strategy threads.
+    """
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9100):
+        """
+        Parameters
+        ----------
+        registry: MetricsRegistry
+            The metrics to serve.
+        host: str
+            The address to listen on. Defaults to local connections only.
+        port: int
+            The port to listen on, or 0 for any free port (see the port attribute once started).
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self) -> None:
+        registry = self.registry
+        content_type = self.CONTENT_TYPE
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.expose().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('metrics request: ' + format, *args)
+
+        assert self._server is None, "The metrics server is already running"
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        logger.info('Serving metrics on http://%s:%d/metrics', self.host, self.port)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+
+_INFO_MESSAGE_TYPES = {
+    info_capnp.PriceBook.schema.node.id: 'price_book',
+    common_capnp.TradeTick.schema.node.id: 'trade_tick',
+    info_capnp.InstrumentCreated.schema.node.id: 'instrument_created',
+    info_capnp.InstrumentExpired.schema.node.id: 'instrument_expired',
+    info_capnp.InstrumentPaused.schema.node.id: 'instrument_paused',
+    info_capnp.InstrumentResumed.schema.node.id: 'instrument_resumed',
+    info_capnp.InstrumentParametersUpdated.schema.node.id: 'instrument_parameters_updated',
+    info_capnp.InstrumentStartupData.schema.node.id: 'instrument_startup_data',
+    common_capnp.GenericReply.schema.node.id: 'reply',
+}
+
+
+class ClientMetrics:
+    """
+    The metrics the clients keep about themselves: messages on the info feed per type, requests to the exec port and
+    their latency, rejected orders, connections and the lag of the event loop.
+
+    The clients hold None instead of this object unless metrics are enabled, so they cost nothing otherwise. The time
+    series that are updated per message are looked up once and cached.
+    """
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.info_messages = registry.counter('optibook_info_messages_total', 'Messages received on the info feed, per type.',
+                                              ['type'])
+        self.exec_requests = registry.histogram('optibook_exec_request_duration_seconds',
+                                                'Round-trip time of requests to the exec port, per method.', ['method'])
+        self.exec_errors = registry.counter('optibook_exec_request_errors_total', 'Requests to the exec port that raised, per method.',
+                                            ['method'])
+        self.order_rejects = registry.counter('optibook_order_rejects_total',
+                                              'Orders rejected by the exchange or the local risk checks, per method and reason.',
+                                              ['method', 'reason'])
+        self.connections = registry.counter('optibook_connections_total', 'Connections made, per client. More than one is a reconnect.',
+                                            ['client'])
+        self.loop_lag = registry.histogram('optibook_event_loop_lag_seconds',
+                                           'Delay of a callback scheduled on the event loop beyond its due time.')
+        self._info_message_counters = {}
+        self._exec_request_histograms = {}
+        self._loop_lag_handle = None
+
+    def count_info_message(self, message_type: int) -> None:
+        counter = self._info_message_counters.get(message_type)
+        if counter is None:
+            counter = self._info_message_counters[message_type] = self.info_messages.labels(
+                _INFO_MESSAGE_TYPES.get(message_type, str(message_type)))
+        counter.inc()
+
+    async def time_exec_request(self, method: str, awaitable: typing.Awaitable):
+        """
+        Awaits a request to the exec port and records its latency. A request that raises counts as an error and, for
+        an insert, as a rejected order.
+        """
+        histogram = self._exec_request_histograms.get(method)
+        if histogram is None:
+            histogram = self._exec_request_histograms[method] = self.exec_requests.labels(method)
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            self.exec_errors.labels(method).inc()
+            if method == 'insert':
+                self.count_reject(method, 'exchange')
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def count_reject(self, method: str, reason: str) -> None:
+        self.order_rejects.labels(method, reason).inc()
+
+    def count_connection(self, client: str) -> None:
+        self.connections.labels(client).inc()
+
+    def start_loop_lag_probe(self, loop: asyncio.AbstractEventLoop, interval: float = 0.1) -> None:
+        """
+        Schedule a callback on the loop every interval seconds and record how late it runs. Can be called from any
+        thread, also before the loop runs.
+        """
+        def probe(due):
+            now = loop.time()
+            self.loop_lag.observe(max(now - due, 0.0))
+            self._loop_lag_handle = loop.call_at(now + interval, probe, now + interval)
+
+        def start():
+            if self._loop_lag_handle is None:
+                self._loop_lag_handle = loop.call_later(interval, probe, loop.time() + interval)
+
+        loop.call_soon_threadsafe(start)
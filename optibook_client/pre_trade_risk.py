@@ -0,0 +1,167 @@
+import logging
+import typing
+
+from .common_types import Instrument
+from .exchange_client import SIDE_BID
+
+logger = logging.getLogger('client')
+
+
+class PreTradeRiskError(Exception):
+    """
+    Raised when an order is rejected locally, before it is sent to the exchange.
+    """
+    pass
+
+
+class RiskLimits:
+    """
+    Configuration of the local pre-trade risk checks.
+
+    Orders that bring a position or group closer to flat are never rejected on the position limits, even when it is
+    still beyond them afterwards, so hedges can always reduce an exposure that got over a limit.
+
+    Attributes
+    ----------
+    max_order_volume: int
+        Maximum volume of a single order. None disables the check.
+
+    position_limits: typing.Dict[str, int]
+        Maximum absolute position per instrument_id, including the volume of outstanding orders on the same side.
+
+    default_position_limit: int
+        Position limit for instruments that are not in position_limits. None disables the check for those instruments.
+
+    group_position_limits: typing.Dict[str, typing.Tuple[typing.List[str], int]]
+        Maximum absolute net position of a group of instruments, e.g. {'PHILIPS': (['PHILIPS_A', 'PHILIPS_B'], 200)},
+        including the volume of outstanding orders on the same side in any instrument of the group.
+
+    check_price_bands: bool
+        Reject orders priced outside the price change limit of the instrument around the last traded price.
+
+    check_tick_size: bool
+        Reject orders whose price is not a multiple of the tick size of the instrument.
+
+    check_paused: bool
+        Reject orders on paused instruments.
+    """
+    def __init__(self,
+                 max_order_volume: typing.Optional[int] = None,
+                 position_limits: typing.Optional[typing.Dict[str, int]] = None,
+                 default_position_limit: typing.Optional[int] = None,
+                 group_position_limits: typing.Optional[typing.Dict[str, typing.Tuple[typing.List[str], int]]] = None,
+                 check_price_bands: bool = True,
+                 check_tick_size: bool = True,
+                 check_paused: bool = True):
+        self.max_order_volume = max_order_volume
+        self.position_limits = position_limits or {}
+        self.default_position_limit = default_position_limit
+        self.group_position_limits = group_position_limits or {}
+        self.check_price_bands = check_price_bands
+        self.check_tick_size = check_tick_size
+        self.check_paused = check_paused
+
+
+class PreTradeRiskChecker:
+    """
+    Checks orders against the RiskLimits using the live state of the client, so obviously bad orders are rejected
+    without a round-trip to the exchange.
+
+    Positions come from the position accountant and outstanding volume from the order index of the exec client, both of
+    which are O(1) reads, so every check is cheap enough to run on every order.
+    """
+    def __init__(self,
+                 limits: RiskLimits,
+                 get_instruments: typing.Callable[[], typing.Dict[str, Instrument]],
+                 get_last_traded_price: typing.Callable[[str], float],
+                 exec_client):
+        self.limits = limits
+        self._get_instruments = get_instruments
+        self._get_last_traded_price = get_last_traded_price
+        self._exec_client = exec_client
+
+        # instrument_id -> list of (group instruments, limit), so an order only looks at the groups it is part of
+        self._groups_by_instrument_id = {}
+        for instruments, limit in self.limits.group_position_limits.values():
+            for instrument_id in instruments:
+                self._groups_by_instrument_id.setdefault(instrument_id, []).append((instruments, limit))
+
+    def check_insert(self, instrument_id: str, price: float, volume: int, side: str) -> None:
+        self.check_order_volume(instrument_id, volume)
+        instrument = self._get_instruments().get(instrument_id)
+        if instrument is not None:
+            if self.limits.check_paused:
+                self.check_paused(instrument)
+            if self.limits.check_tick_size:
+                self.check_tick_size(instrument, price)
+            if self.limits.check_price_bands:
+                self.check_price_band(instrument, price)
+        self.check_position_limits(instrument_id, volume, side)
+
+    def check_amend(self, instrument_id: str, order_id: int, volume: int) -> None:
+        self.check_order_volume(instrument_id, volume)
+        order = self._exec_client.get_order_index(instrument_id).get_order(order_id)
+        if order is not None and volume > order.volume:
+            # only the increase in volume adds exposure
+            self.check_position_limits(instrument_id, volume - order.volume, order.side)
+
+    def check_order_volume(self, instrument_id: str, volume: int) -> None:
+        if volume <= 0:
+            raise PreTradeRiskError(f"Order volume on '{instrument_id}' must be positive, got {volume}.")
+        max_order_volume = self.limits.max_order_volume
+        if max_order_volume is not None and volume > max_order_volume:
+            raise PreTradeRiskError(f"Order volume {volume} on '{instrument_id}' exceeds the maximum order volume {max_order_volume}.")
+
+    def check_paused(self, instrument: Instrument) -> None:
+        if instrument.paused:
+            raise PreTradeRiskError(f"Instrument '{instrument.instrument_id}' is paused.")
+
+    def check_tick_size(self, instrument: Instrument, price: float) -> None:
+        ticks = price / instrument.tick_size
+        if abs(ticks - round(ticks)) > 1e-6:
+            raise PreTradeRiskError(f"Price {price} on '{instrument.instrument_id}' is not a multiple of the tick size {instrument.tick_size}.")
+
+    def check_price_band(self, instrument: Instrument, price: float) -> None:
+        limit = instrument.price_change_limit
+        if limit is None:
+            return
+        last_traded_price = self._get_last_traded_price(instrument.instrument_id)
+        if not last_traded_price:
+            return
+        # only reject what is outside both the absolute and the relative limit, so we never reject an order the
+        # exchange would have accepted
+        max_change = max(limit.absolute_change, limit.relative_change * last_traded_price)
+        if abs(price - last_traded_price) > max_change:
+            raise PreTradeRiskError(f"Price {price} on '{instrument.instrument_id}' is more than {max_change} away from the last traded price {last_traded_price}.")
+
+    def check_position_limits(self, instrument_id: str, volume: int, side: str) -> None:
+        position_limit = self.limits.position_limits.get(instrument_id, self.limits.default_position_limit)
+        groups = self._groups_by_instrument_id.get(instrument_id)
+        if position_limit is None and groups is None:
+            return
+
+        signed_volume = volume if side == SIDE_BID else -volume
+        # An order is only rejected when it takes the exposure beyond the limit and further from flat than it was, so
+        # orders that reduce an exposure that is already over the limit, such as hedges, still go out.
+        if position_limit is not None:
+            current = self._worst_case_position(instrument_id, side)
+            exposure = current + signed_volume
+            if abs(exposure) > position_limit and abs(exposure) > abs(current):
+                raise PreTradeRiskError(f"Order of {volume} lots on '{instrument_id}' could take the position to {exposure}, "
+                                        f"beyond the position limit {position_limit}.")
+
+        if groups is not None:
+            for instruments, group_limit in groups:
+                current = sum(self._worst_case_position(i, side) for i in instruments)
+                exposure = current + signed_volume
+                if abs(exposure) > group_limit and abs(exposure) > abs(current):
+                    raise PreTradeRiskError(f"Order of {volume} lots on '{instrument_id}' could take the net position of {instruments} "
+                                            f"to {exposure}, beyond the group position limit {group_limit}.")
+
+    def _worst_case_position(self, instrument_id, side):
+        """
+        The position if all outstanding orders on the given side were to trade.
+        """
+        position = self._exec_client.get_position(instrument_id)
+        outstanding = self._exec_client.get_order_index(instrument_id).get_volume(side)
+        return position + outstanding if side == SIDE_BID else position - outstanding
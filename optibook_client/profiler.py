@@ -0,0 +1,226 @@
+import contextlib
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import typing
+from collections import Counter
+
+logger = logging.getLogger('client')
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for strategy iterations and the event loop of the client.
+
+    A sampler thread takes the stack of every thread that is being profiled every `interval` seconds and counts each
+    distinct stack. Nothing is traced, so the profiled code runs at full speed and the overhead is that of the sampler
+    thread, which only samples while something is being profiled and otherwise wakes up once per window.
+
+    Two kinds of targets can be profiled:
+
+    - iterations, e.g. one Trader.run: wrap them in `with profiler.iteration('Trader.run'):`. A fraction of the
+      iterations is sampled, the others only pay for one random number.
+    - threads that run continuously, e.g. the event loop thread: watch_thread samples them during a fraction of windows
+      of `window` seconds.
+
+    The counts are aggregated into the time per function, and can be dumped as collapsed stacks
+    ('root;module:function;... count' per line), which flamegraph.pl, speedscope and inferno read as is.
+    """
+    def __init__(self, fraction: float = 0.1, interval: float = 0.001, window: float = 0.1):
+        """
+        Parameters
+        ----------
+        fraction: float
+            Fraction of the iterations, and of the windows of watched threads, that is sampled.
+        interval: float
+            Seconds between two samples.
+        window: float
+            Length in seconds of the windows in which watched threads are or are not sampled.
+        """
+        assert 0 < fraction <= 1, "fraction must be in (0, 1]"
+        assert interval > 0, "interval must be positive"
+        self.fraction = fraction
+        self.interval = interval
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._active: typing.Dict[int, str] = {}
+        self._watched: typing.Dict[int, str] = {}
+        self._counts: typing.Counter[typing.Tuple[str, ...]] = Counter()
+        self._seconds: typing.Counter[typing.Tuple[str, ...]] = Counter()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+        # set by the signal handler of dump_on_signal, the file is written by the sampler thread
+        self._dump_request = None
+        self.nr_iterations = 0
+        self.nr_sampled_iterations = 0
+        self.nr_samples = 0
+
+    def start(self) -> None:
+        """
+        Starts the sampler thread. Called automatically by iteration and watch_thread.
+        """
+        if self._thread is None:
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @contextlib.contextmanager
+    def iteration(self, name: str = 'iteration'):
+        """
+        Profiles the body of the with statement on the calling thread, for a fraction of the calls.
+        """
+        self.nr_iterations += 1
+        if random.random() >= self.fraction:
+            yield
+            return
+        self.nr_sampled_iterations += 1
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = name
+        if self._thread is None:
+            self.start()
+        self._wakeup.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(thread_id, None)
+
+    def watch_thread(self, thread: threading.Thread, name: str = None) -> None:
+        """
+        Samples a thread that runs continuously, such as the event loop thread, during a fraction of the time.
+        """
+        with self._lock:
+            self._watched[thread.ident] = name or thread.name
+        self.start()
+        self._wakeup.set()
+
+    def unwatch_thread(self, thread: threading.Thread) -> None:
+        with self._lock:
+            self._watched.pop(thread.ident, None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        window_end = 0.0
+        watched = {}
+        last_sample_time = time.perf_counter()
+        while not self._stopped:
+            if self._dump_request is not None:
+                path, self._dump_request = self._dump_request, None
+                self.dump(path)
+            with self._lock:
+                targets = dict(self._active)
+                now = time.monotonic()
+                if now >= window_end:
+                    window_end = now + self.window
+                    # a new window, decide which watched threads are sampled in it
+                    watched = {i: name for i, name in self._watched.items() if random.random() < self.fraction}
+            targets.update((i, name) for i, name in watched.items() if i not in targets)
+            if not targets:
+                # nothing to sample until an iteration starts or the next window is drawn
+                self._wakeup.wait(window_end - now)
+                self._wakeup.clear()
+                last_sample_time = time.perf_counter()
+                continue
+            # The sampler only gets the GIL every few milliseconds when the profiled threads are busy, so a sample
+            # stands for the time since the previous one rather than for the interval.
+            sample_time = time.perf_counter()
+            elapsed = min(sample_time - last_sample_time, self.window)
+            last_sample_time = sample_time
+            frames = sys._current_frames()
+            stacks = [self._collapse(name, frames.get(i)) for i, name in targets.items() if i != own_id]
+            del frames
+            with self._lock:
+                for stack in stacks:
+                    if stack is not None:
+                        self._counts[stack] += 1
+                        self._seconds[stack] += elapsed
+                        self.nr_samples += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(root, frame):
+        if frame is None:
+            return None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            stack.append(f'{module}:{getattr(code, "co_qualname", code.co_name)}')
+            frame = frame.f_back
+        stack.append(root)
+        stack.reverse()
+        return tuple(stack)
+
+    def get_stacks(self) -> typing.Dict[typing.Tuple[str, ...], int]:
+        """
+        Returns the number of samples per distinct stack, outermost frame first.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def get_function_times(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+        Returns per function the estimated time in seconds spent in the function itself ('self') and including the
+        functions it called ('total'), sorted by total time. The times cover the sampled iterations and windows only.
+        """
+        with self._lock:
+            seconds = dict(self._seconds)
+        self_seconds = Counter()
+        total_seconds = Counter()
+        for stack, elapsed in seconds.items():
+            self_seconds[stack[-1]] += elapsed
+            for function in set(stack):
+                total_seconds[function] += elapsed
+        return {function: {'self': float(self_seconds[function]), 'total': total}
+                for function, total in total_seconds.most_common()}
+
+    def get_stats(self) -> typing.Dict[str, int]:
+        return {'iterations': self.nr_iterations, 'sampled_iterations': self.nr_sampled_iterations, 'samples': self.nr_samples}
+
+    def dump(self, path: str = None) -> str:
+        """
+        Returns the collapsed stacks, one 'frame;frame;... count' line per stack, and writes them to path if given.
+        """
+        lines = [f"{';'.join(stack)} {count}" for stack, count in sorted(self.get_stacks().items())]
+        text = '\n'.join(lines) + '\n' if lines else ''
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+            logger.info('Wrote %d profiled stacks to %s', len(lines), path)
+        return text
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._seconds.clear()
+            self.nr_samples = 0
+        self.nr_iterations = 0
+        self.nr_sampled_iterations = 0
+
+    def dump_on_signal(self, path: str, signum: int = getattr(signal, 'SIGUSR1', None)) -> None:
+        """
+        Dumps the collapsed stacks to path whenever the process receives signum, e.g. kill -USR1 <pid>.
+        Must be called from the main thread.
+
+        The handler only records the request, as it interrupts the main thread wherever it is, possibly while that holds
+        the lock of the profiler. The sampler thread writes the file within a window.
+        """
+        def request_dump(signum, frame):
+            self._dump_request = path
+
+        signal.signal(signum, request_dump)
+        self.start()
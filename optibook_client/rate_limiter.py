@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import typing
+from collections import deque
+
+logger = logging.getLogger('client')
+
+# Lower values are served first. Cancels and hedges are risk reducing, so they go before new quotes.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+ALL_PRIORITIES = [PRIORITY_HIGH, PRIORITY_NORMAL]
+
+
+class _Request:
+    __slots__ = ('future', 'priority', 'slot', 'enqueued_at')
+
+    def __init__(self, future, priority, slot, enqueued_at):
+        self.future = future
+        self.priority = priority
+        self.slot = slot
+        self.enqueued_at = enqueued_at
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of messages sent to the exchange, with a queue per priority.
+
+    Tokens are added at `rate` per second up to `burst`. A request takes a token immediately if one is available and no
+    request of the same or a higher priority is waiting, otherwise it waits in the queue of its priority. Queues are
+    served strictly by priority, first in first out within a priority.
+
+    A request can name a slot, e.g. (instrument_id, side) for a quote. A newer request for a slot that still has a request
+    waiting replaces it: the waiting request is dropped and acquire() returns False for it.
+
+    Must be used from the event loop of the client.
+    """
+    def __init__(self, rate: float, burst: int = None):
+        assert rate > 0, "rate must be positive"
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last_refill = None
+        self._queues = [deque() for _ in ALL_PRIORITIES]
+        self._waiting_by_slot: typing.Dict[typing.Hashable, _Request] = {}
+        self._drain_handle = None
+
+        self._queue_depth = [0 for _ in ALL_PRIORITIES]
+        self._nr_granted = [0 for _ in ALL_PRIORITIES]
+        self._nr_dropped = [0 for _ in ALL_PRIORITIES]
+        self._total_wait = [0.0 for _ in ALL_PRIORITIES]
+        self._max_wait = [0.0 for _ in ALL_PRIORITIES]
+
+    def _refill(self, now):
+        if self._last_refill is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, slot: typing.Hashable = None) -> bool:
+        """
+        Waits until a message may be sent.
+
+        Returns
+        -------
+        bool
+            True when the message may be sent, False when it was replaced by a newer request for the same slot.
+        """
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        self._refill(now)
+
+        if self._tokens >= 1 and not any(self._queue_depth[:priority + 1]):
+            self._tokens -= 1
+            self._nr_granted[priority] += 1
+            return True
+
+        request = _Request(loop.create_future(), priority, slot, now)
+        if slot is not None:
+            previous = self._waiting_by_slot.get(slot)
+            if previous is not None and not previous.future.done():
+                self._drop(previous)
+            self._waiting_by_slot[slot] = request
+        self._queues[priority].append(request)
+        self._queue_depth[priority] += 1
+        self._schedule_drain(loop)
+
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            if self._waiting_by_slot.get(slot) is request:
+                del self._waiting_by_slot[slot]
+            raise
+
+    def _drop(self, request):
+        request.future.set_result(False)
+        self._queue_depth[request.priority] -= 1
+        self._nr_dropped[request.priority] += 1
+        logger.debug('Rate limited request for slot %s was replaced by a newer one', request.slot)
+
+    def _schedule_drain(self, loop):
+        if self._drain_handle is None:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._drain_handle = loop.call_later(delay, self._drain, loop)
+
+    def _drain(self, loop):
+        self._drain_handle = None
+        now = loop.time()
+        self._refill(now)
+
+        for queue in self._queues:
+            while queue and self._tokens >= 1:
+                request = queue.popleft()
+                if request.future.done():
+                    # dropped requests were already taken off the depth, cancelled ones were not
+                    if request.future.cancelled():
+                        self._queue_depth[request.priority] -= 1
+                    continue
+                if request.slot is not None and self._waiting_by_slot.get(request.slot) is request:
+                    del self._waiting_by_slot[request.slot]
+                self._tokens -= 1
+                self._queue_depth[request.priority] -= 1
+                self._nr_granted[request.priority] += 1
+                wait = now - request.enqueued_at
+                self._total_wait[request.priority] += wait
+                if wait > self._max_wait[request.priority]:
+                    self._max_wait[request.priority] = wait
+                request.future.set_result(True)
+
+        if any(self._queues):
+            self._schedule_drain(loop)
+
+    def get_queue_depth(self, priority: int = None) -> int:
+        if priority is None:
+            return sum(self._queue_depth)
+        return self._queue_depth[priority]
+
+    def get_metrics(self) -> typing.Dict[int, typing.Dict[str, float]]:
+        """
+        Returns per priority the current queue depth, the number of granted and dropped requests and the mean and maximum
+        time in seconds that granted requests waited.
+        """
+        return {
+            p: {
+                'queue_depth': self._queue_depth[p],
+                'granted': self._nr_granted[p],
+                'dropped': self._nr_dropped[p],
+                'mean_wait': self._total_wait[p] / self._nr_granted[p] if self._nr_granted[p] else 0.0,
+                'max_wait': self._max_wait[p],
+            }
+            for p in ALL_PRIORITIES
+        }
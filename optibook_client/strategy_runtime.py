@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+import typing
+
+from .common_types import TopOfBook, Trade
+
+logger = logging.getLogger('client')
+
+
+class StrategyRuntime:
+    """
+    Runs a strategy on the events of an Exchange instead of on a fixed sleep.
+
+    The client calls the runtime from its event loop thread on every top of book and every private trade. Those callbacks
+    only record the event and wake up the strategy thread, which is the thread calling run(). That thread calls the
+    handlers of the strategy, which are free to use the blocking functions of the Exchange:
+
+    - on_trades(trades): with the private trades received since the previous call. Fills are handled before anything
+      else, so hedges go out first.
+    - on_book_update(instrument_ids): with the set of instruments whose book changed since the previous call.
+    - on_timer(): when no event arrived for timer_interval seconds, e.g. to refresh quotes that are about to expire.
+
+    Handlers the strategy does not define are skipped. Events that arrive while a handler runs are coalesced into the
+    next call, and book updates are debounced: after a book update the runtime waits until min_interval has passed since
+    the previous book handler started, so a burst of updates leads to a single decision on the latest state. Trades are
+    never delayed.
+    """
+    def __init__(self,
+                 exchange,
+                 strategy,
+                 instruments: typing.Optional[typing.Iterable[str]] = None,
+                 min_interval: float = 0.01,
+                 timer_interval: float = 1.0):
+        """
+        Parameters
+        ----------
+        exchange: Exchange
+            A connected Exchange.
+
+        strategy:
+            Object with any of the handlers on_trades, on_book_update and on_timer.
+
+        instruments: typing.Iterable[str]
+            Only book updates and trades on these instruments wake up the strategy. None for all instruments.
+
+        min_interval: float
+            Minimum time in seconds between two calls of on_book_update.
+
+        timer_interval: float
+            Time in seconds without events after which on_timer is called.
+        """
+        self._exchange = exchange
+        self._strategy = strategy
+        self._instruments = set(instruments) if instruments is not None else None
+        self.min_interval = min_interval
+        self.timer_interval = timer_interval
+
+        self._on_trades = getattr(strategy, 'on_trades', None)
+        self._on_book_update = getattr(strategy, 'on_book_update', None)
+        self._on_timer = getattr(strategy, 'on_timer', None)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._pending_trades: typing.List[Trade] = []
+        self._pending_books: typing.Set[str] = set()
+        self._first_pending_at = None
+
+        self._started_at = None
+        self._busy_time = 0.0
+        self._nr_events = 0
+        self._nr_coalesced = 0
+        self._nr_decisions = {'trades': 0, 'book_update': 0, 'timer': 0}
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._nr_latencies = 0
+        self._total_duration = 0.0
+        self._max_duration = 0.0
+
+    def _on_top_of_book(self, top_of_book: TopOfBook) -> None:
+        if self._instruments is not None and top_of_book.instrument_id not in self._instruments:
+            return
+        with self._lock:
+            self._nr_events += 1
+            if top_of_book.instrument_id in self._pending_books:
+                self._nr_coalesced += 1
+            else:
+                self._pending_books.add(top_of_book.instrument_id)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+        self._wakeup.set()
+
+    def _on_trade(self, trade: Trade) -> None:
+        if self._instruments is not None and trade.instrument_id not in self._instruments:
+            return
+        with self._lock:
+            self._nr_events += 1
+            self._pending_trades.append(trade)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+        self._wakeup.set()
+
+    def run(self) -> None:
+        """
+        Dispatches events to the strategy until stop() is called. Blocks the calling thread.
+        """
+        self._stopped.clear()
+        self._exchange.add_top_of_book_callback(self._on_top_of_book)
+        self._exchange.add_trade_callback(self._on_trade)
+        self._started_at = time.monotonic()
+        last_book_decision = 0.0
+        last_event = self._started_at
+
+        try:
+            while not self._stopped.is_set():
+                # cleared before looking at the pending events, so an event arriving after this is never missed
+                self._wakeup.clear()
+                now = time.monotonic()
+                with self._lock:
+                    has_trades = bool(self._pending_trades)
+                    has_books = bool(self._pending_books)
+                book_wait = last_book_decision + self.min_interval - now
+
+                if has_trades or (has_books and book_wait <= 0):
+                    with self._lock:
+                        trades, self._pending_trades = self._pending_trades, []
+                        if has_books and book_wait <= 0:
+                            books, self._pending_books = self._pending_books, set()
+                        else:
+                            books = set()
+                        first_pending_at = self._first_pending_at
+                        if not self._pending_books:
+                            self._first_pending_at = None
+
+                    if books:
+                        last_book_decision = now
+                    if trades and self._on_trades is not None:
+                        self._dispatch('trades', first_pending_at, self._on_trades, trades)
+                        first_pending_at = None
+                    if books and self._on_book_update is not None:
+                        self._dispatch('book_update', first_pending_at, self._on_book_update, books)
+                    last_event = time.monotonic()
+                    continue
+
+                if has_books:
+                    # debounce: more updates of the burst are merged until min_interval has passed
+                    self._wakeup.wait(book_wait)
+                    continue
+
+                timer_wait = last_event + self.timer_interval - now
+                if timer_wait <= 0:
+                    if self._on_timer is not None:
+                        self._dispatch('timer', None, self._on_timer)
+                    last_event = time.monotonic()
+                    continue
+
+                self._wakeup.wait(timer_wait)
+        finally:
+            self._exchange.remove_top_of_book_callback(self._on_top_of_book)
+            self._exchange.remove_trade_callback(self._on_trade)
+
+    def _dispatch(self, kind, first_pending_at, handler, *args):
+        started = time.monotonic()
+        if first_pending_at is not None:
+            latency = started - first_pending_at
+            self._total_latency += latency
+            self._nr_latencies += 1
+            if latency > self._max_latency:
+                self._max_latency = latency
+        try:
+            handler(*args)
+        except Exception:
+            logger.exception(f'Exception occurred in {kind} handler of the strategy')
+        duration = time.monotonic() - started
+        self._busy_time += duration
+        self._total_duration += duration
+        if duration > self._max_duration:
+            self._max_duration = duration
+        self._nr_decisions[kind] += 1
+
+    def stop(self) -> None:
+        """
+        Makes run() return after the handler that is currently running. Can be called from any thread.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+
+    def get_metrics(self) -> typing.Dict[str, typing.Any]:
+        """
+        Returns
+        -------
+        typing.Dict[str, typing.Any]
+            utilization: the fraction of time since run() started that was spent in handlers.
+            mean_latency, max_latency: seconds from the first event of a batch until its handler started.
+            mean_duration, max_duration: seconds spent in a single handler call.
+            events, coalesced: number of events received, and of book updates merged into an update already pending.
+            decisions: number of handler calls per kind.
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        nr_decisions = sum(self._nr_decisions.values())
+        return {
+            'utilization': self._busy_time / elapsed if elapsed else 0.0,
+            'mean_latency': self._total_latency / self._nr_latencies if self._nr_latencies else 0.0,
+            'max_latency': self._max_latency,
+            'mean_duration': self._total_duration / nr_decisions if nr_decisions else 0.0,
+            'max_duration': self._max_duration,
+            'events': self._nr_events,
+            'coalesced': self._nr_coalesced,
+            'decisions': dict(self._nr_decisions),
+        }
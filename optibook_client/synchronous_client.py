@@ -1,10 +1,17 @@
+import asyncio
 import logging
 import typing
 
 from . import exchange_client
-from .exchange_client import InfoClient, ExecClient
+from .exchange_client import InfoClient, ExecClient, OrderIndex
+from .metrics import ClientMetrics, MetricsRegistry, MetricsServer
+from .profiler import SamplingProfiler
 from .synchronous_wrapper import SynchronousWrapper
-from .common_types import PriceBook, PriceVolume, Trade, TradeTick, OrderStatus, Instrument
+from .pre_trade_risk import PreTradeRiskChecker, RiskLimits
+from .auto_hedger import AutoHedger
+from .rate_limiter import RateLimiter
+from .timer_wheel import Timer, TimerWheel
+from .common_types import PriceBook, PriceVolume, TopOfBook, Trade, TradeTick, OrderStatus, Instrument, ReplaceResult, ReconcileResult
 
 logger = logging.getLogger('client')
 
@@ -15,7 +22,9 @@ class Exchange:
                  info_port: int = None,
                  exec_port: int = None,
                  full_message_logging: bool = False,
-                 max_nr_trade_history: int = 100):
+                 max_nr_trade_history: int = 100,
+                 risk_limits: RiskLimits = None,
+                 max_messages_per_second: float = None):
         """
         Initiate an exchange client instance. This is the class you should use to interact with the exchange, i.e.
         send orders or delete orders, get the newest trades, etc.
@@ -33,6 +42,11 @@ class Exchange:
             exchange.
         max_nr_trade_history: int
             Keep at most this number of trades per instrument in history. Older trades will be removed automatically
+        risk_limits: RiskLimits
+            Optional, limits that every inserted and amended order is checked against locally before it is sent. An
+            order that breaches them raises a PreTradeRiskError instead of being sent to the exchange.
+        max_messages_per_second: float
+            Optional, limits the rate of inserts, amends and deletes sent to the exchange. See set_message_rate_limit.
         """
 
         if full_message_logging:
@@ -40,7 +54,132 @@ class Exchange:
 
         self._i = InfoClient(host=host, port=info_port, max_nr_trade_history=max_nr_trade_history)
         self._e = ExecClient(host=host, port=exec_port, max_nr_trade_history=max_nr_trade_history)
+        self._i.add_last_traded_price_callback(self._e.update_mark_price)
+        if risk_limits is not None:
+            self.set_risk_limits(risk_limits)
+        if max_messages_per_second is not None:
+            self.set_message_rate_limit(max_messages_per_second)
         self._wrapper = SynchronousWrapper([self._i, self._e])
+        self._timer_wheel = TimerWheel(self._wrapper.get_loop())
+        self._metrics_server = None
+
+    def set_risk_limits(self, risk_limits: typing.Optional[RiskLimits]) -> None:
+        """
+        Set the limits that every inserted and amended order is checked against locally, before it is sent to the
+        exchange. The checks cover order volume, position limits per instrument and per group of instruments (including
+        outstanding orders), price change limits around the last traded price, tick size and paused instruments.
+
+        Parameters
+        ----------
+        risk_limits: RiskLimits
+            The limits to check against, or None to disable the local checks.
+        """
+        if risk_limits is None:
+            self._e.set_risk_checker(None)
+        else:
+            self._e.set_risk_checker(PreTradeRiskChecker(risk_limits, self._i.get_instruments, self._i.get_last_traded_price, self._e))
+
+    def enable_auto_hedging(self, hedge_ratios: typing.Dict[str, float], hedge_instrument: str, slippage_ticks: int = 0,
+                            max_hedge_volume: int = None) -> None:
+        """
+        Hedge the net position of a group of instruments as soon as any of them trades. The hedge is an IOC on
+        hedge_instrument at the best opposite price of its last book, sent from the event loop of the client directly
+        when the fill arrives, so it goes out one round-trip after the fill. Volume of hedges that are still in flight is
+        taken into account, so a burst of fills is not hedged twice.
+
+        Parameters
+        ----------
+        hedge_ratios: typing.Dict[str, float]
+            Exposure per lot of each instrument of the group, e.g. {'PHILIPS_A': 1, 'PHILIPS_B': 1}.
+        hedge_instrument: str
+            The liquid instrument to hedge in. Must be part of hedge_ratios.
+        slippage_ticks: int
+            Number of ticks beyond the best opposite price the hedge may trade at.
+        max_hedge_volume: int
+            Maximum volume of a single hedge order, or None for no maximum.
+        """
+        instrument = self._i.get_instruments().get(hedge_instrument)
+        tick_size = instrument.tick_size if instrument is not None else 0.0
+        self._e.set_auto_hedger(AutoHedger(self._e, self._i.get_top_of_book, hedge_ratios, hedge_instrument,
+                                           tick_size=tick_size, slippage_ticks=slippage_ticks,
+                                           max_hedge_volume=max_hedge_volume))
+
+    def disable_auto_hedging(self) -> None:
+        """
+        Stop hedging on fills. Hedges that were already sent are not affected.
+        """
+        self._e.set_auto_hedger(None)
+
+    def hedge_now(self) -> None:
+        """
+        Hedge whatever exposure is left unhedged, e.g. because an earlier hedge IOC did not fully trade. Takes hedges in
+        flight into account like the hedges on fills do, so it is safe to call on every strategy iteration.
+        Does nothing if auto hedging is not enabled.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        auto_hedger = self._e.get_auto_hedger()
+        if auto_hedger is None:
+            return
+
+        async def hedge():
+            auto_hedger.hedge()
+
+        self._wrapper.run_on_loop(hedge())
+
+    def get_auto_hedging_metrics(self) -> typing.Optional[typing.Dict[str, float]]:
+        """
+        Returns the number and volume of hedges sent on fills, the volume still in flight and the time from fill to the
+        answer of its hedge, or None if auto hedging is not enabled.
+        """
+        auto_hedger = self._e.get_auto_hedger()
+        return auto_hedger.get_metrics() if auto_hedger is not None else None
+
+    def enable_metrics(self, registry: MetricsRegistry = None, port: int = None, host: str = '127.0.0.1') -> MetricsRegistry:
+        """
+        Keep metrics about the client: messages on the info feed per type, the number and latency of requests to the exec
+        port, rejected orders, (re)connections, the lag of the event loop and the position and PnL per instrument.
+
+        The position and PnL are read when the metrics are scraped, the other metrics only cost an addition when they
+        change. Strategies can add their own metrics to the returned registry.
+
+        Parameters
+        ----------
+        registry: MetricsRegistry
+            Optional, the registry to add the metrics to. A new one is made by default.
+        port: int
+            Optional, serve the metrics at http://host:port/metrics in the Prometheus text format, from a thread of its
+            own so scraping never runs on the event loop.
+        host: str
+            The address to serve the metrics on. Defaults to local connections only.
+
+        Returns
+        -------
+        MetricsRegistry
+            The registry with the metrics of the client.
+        """
+        if registry is None:
+            registry = MetricsRegistry()
+        metrics = ClientMetrics(registry)
+        self._i.set_metrics(metrics)
+        self._e.set_metrics(metrics)
+        metrics.start_loop_lag_probe(self._wrapper.get_loop())
+
+        def instrument_pnls(key):
+            return {(instrument_id,): pnl[key] for instrument_id, pnl in self._e.get_instrument_pnls().items()}
+
+        registry.gauge('optibook_position', 'Position per instrument, in lots.', ['instrument'],
+                       callback=lambda: instrument_pnls('volume'))
+        registry.gauge('optibook_realized_pnl', 'Realized PnL per instrument.', ['instrument'],
+                       callback=lambda: instrument_pnls('realized_pnl'))
+        registry.gauge('optibook_unrealized_pnl', 'Unrealized PnL per instrument, against the last traded price.', ['instrument'],
+                       callback=lambda: instrument_pnls('unrealized_pnl'))
+        registry.gauge('optibook_pnl', 'Total PnL, absent while an open position has no last traded price.',
+                       callback=self._e.get_pnl)
+
+        if port is not None and self._metrics_server is None:
+            self._metrics_server = MetricsServer(registry, host=host, port=port)
+            self._metrics_server.start()
+        return registry
 
     def is_connected(self) -> bool:
         """
@@ -80,11 +219,15 @@ Unable to authenticate with the server. Please double-check that your username a
 
     def disconnect(self) -> None:
         """
-        Disconnect from the exchange.
+        Disconnect from the exchange. Also stops serving the metrics, if enable_metrics started doing so.
         """
         self._wrapper.disconnect()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
             
-    def insert_order(self, instrument_id: str, *, price: float, volume: int, side: str, order_type: str = exchange_client.ORDER_TYPE_LIMIT) -> int:
+    def insert_order(self, instrument_id: str, *, price: float, volume: int, side: str, order_type: str = exchange_client.ORDER_TYPE_LIMIT,
+                     priority: int = None, slot: typing.Hashable = None) -> int:
         """
         Insert a limit or IOC order on an instrument.
 
@@ -101,21 +244,34 @@ Unable to authenticate with the server. Please double-check that your username a
         order_type: str
             'limit' or 'ioc', limit orders stay in the book while any remaining volume of an IOC that is not immediately
             matched is cancelled.
+        priority: int
+            Only used when a message rate limit is set. rate_limiter.PRIORITY_HIGH or rate_limiter.PRIORITY_NORMAL,
+            defaults to high for IOC orders and normal for limit orders.
+        slot: typing.Hashable
+            Only used when a message rate limit is set. If a later order names the same slot, e.g. (instrument_id, side)
+            for a quote, while this one is still waiting for the rate limiter, this order is dropped.
 
         Returns
         -------
         int
-            An order_id which can be used to e.g. delete or amend the limit order later.
+            An order_id which can be used to e.g. delete or amend the limit order later. None if the order was dropped
+            by the rate limiter in favour of a later order for the same slot.
+
+        Raises
+        ------
+        PreTradeRiskError
+            If risk limits are set and the order breaches them. The order is not sent to the exchange.
         """
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
         assert(side in exchange_client.ALL_SIDES), f"Invalid value ({side}) for parameter 'side'. Use synchronous_client.BID or synchronous_client.ASK"
         assert order_type in exchange_client.ALL_ORDER_TYPES, f"order_type must be one of {exchange_client.ALL_ORDER_TYPES}"
 
         return self._wrapper.run_on_loop(
-            self._e.insert_order(instrument_id=instrument_id, price=price, volume=volume, side=side, order_type=order_type)
+            self._e.insert_order(instrument_id=instrument_id, price=price, volume=volume, side=side, order_type=order_type,
+                                 priority=priority, slot=slot)
         )
 
-    def amend_order(self, instrument_id: str, *, order_id: str, volume: int) -> bool:
+    def amend_order(self, instrument_id: str, *, order_id: str, volume: int, priority: int = None, slot: typing.Hashable = None) -> bool:
         """
         Amend a specific outstanding limit order on an instrument. E.g. to change its volume.
 
@@ -127,16 +283,82 @@ Unable to authenticate with the server. Please double-check that your username a
             The order_id of the limit order to delete.
         volume: str
             The new volume to change the order to.
+        priority: int
+            Only used when a message rate limit is set. Defaults to high when the volume is reduced and normal otherwise.
+        slot: typing.Hashable
+            Only used when a message rate limit is set. See insert_order.
 
         Returns
         -------
         bool
             True if the amend was successful, otherwise false.
+
+        Raises
+        ------
+        PreTradeRiskError
+            If risk limits are set and the amended order breaches them. The amend is not sent to the exchange.
         """
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
 
         return self._wrapper.run_on_loop(
-            self._e.amend_order(instrument_id, order_id, volume)
+            self._e.amend_order(instrument_id, order_id, volume, priority=priority, slot=slot)
+        )
+
+    def replace_orders(self, replacements: typing.List[typing.Dict[str, typing.Any]]) -> typing.List[ReplaceResult]:
+        """
+        Replace several orders at once: every old order is deleted and its new order inserted concurrently, and all
+        replacements are sent together, so the whole batch costs a single round-trip instead of two per order.
+
+        Parameters
+        ----------
+        replacements: typing.List[typing.Dict[str, typing.Any]]
+            One dictionary per replacement with the keyword arguments of insert_order (instrument_id, price, volume,
+            side and optionally order_type, priority and slot) plus 'order_id', the order to delete. If order_id is None
+            the new order is only inserted.
+
+        Returns
+        -------
+        typing.List[ReplaceResult]
+            Per replacement, in the same order, whether the old order was deleted, the order_id of the new order and the
+            error if either leg failed. Errors are reported here instead of raised, so one failure does not hide the
+            outcome of the others.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+
+        async def replace_all():
+            return await asyncio.gather(*[
+                self._e.replace_order(**{'order_type': exchange_client.ORDER_TYPE_LIMIT, **r}) for r in replacements
+            ])
+
+        return self._wrapper.run_on_loop(replace_all())
+
+    def reconcile_orders(self, instrument_id: str, desired_orders: typing.Dict[str, typing.List[PriceVolume]]) -> ReconcileResult:
+        """
+        Make the outstanding limit orders on an instrument match the desired price levels, using as few messages as
+        possible. For every side in desired_orders:
+            - a level with outstanding orders that is still desired is kept; if only its volume differs, the oldest
+              order on the level is amended (any other orders on the level are deleted),
+            - outstanding orders on levels that are not desired anymore are deleted,
+            - desired levels without outstanding orders are inserted as new limit orders.
+        All of these are sent concurrently, so the whole reconciliation costs a single round-trip.
+
+        Parameters
+        ----------
+        instrument_id: str
+            The instrument_id of the instrument to reconcile the orders of.
+        desired_orders: typing.Dict[str, typing.List[PriceVolume]]
+            Maps 'bid' and/or 'ask' to the price levels and volumes that should be outstanding. Sides that are left out
+            are not touched, an empty list deletes all orders on that side.
+
+        Returns
+        -------
+        ReconcileResult
+            The number of inserts, amends and deletes that were sent, the new order ids and any errors.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+
+        return self._wrapper.run_on_loop(
+            self._e.reconcile_orders(instrument_id, desired_orders)
         )
 
     def delete_order(self, instrument_id: str, *, order_id: str) -> bool:
@@ -161,6 +383,30 @@ Unable to authenticate with the server. Please double-check that your username a
             self._e.delete_order(instrument_id, order_id)
         )
 
+    def set_message_rate_limit(self, messages_per_second: typing.Optional[float], burst: int = None) -> None:
+        """
+        Limit the number of inserts, amends and deletes sent to the exchange with a token bucket.
+
+        Requests that exceed the limit wait in a queue per priority. Deletes, IOC orders (hedges) and volume reductions
+        are served before new quotes, so risk reducing messages are not held up by quote refreshes.
+
+        Parameters
+        ----------
+        messages_per_second: float
+            The sustained number of messages per second, or None to remove the limit.
+        burst: int
+            The number of messages that may be sent at once after a quiet period. Defaults to one second worth of messages.
+        """
+        self._e.set_rate_limiter(RateLimiter(messages_per_second, burst) if messages_per_second else None)
+
+    def get_message_rate_limit_metrics(self) -> typing.Dict[int, typing.Dict[str, float]]:
+        """
+        Returns the metrics of the message rate limit per priority: queue depth, number of granted and dropped requests
+        and the mean and maximum time in seconds that requests waited. Empty if no rate limit is set.
+        """
+        rate_limiter = self._e.get_rate_limiter()
+        return rate_limiter.get_metrics() if rate_limiter is not None else {}
+
     def delete_orders(self, instrument_id: str) -> None:
         """
         Delete all outstanding orders on an instrument.
@@ -268,6 +514,32 @@ Unable to authenticate with the server. Please double-check that your username a
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
         return self._e.get_outstanding_orders(instrument_id)
 
+    def get_order_index(self, instrument_id: str) -> OrderIndex:
+        """
+        Returns the live, price ordered index of the client's outstanding limit orders on an instrument.
+
+        The index is updated in place as order updates arrive, so it only has to be requested once per instrument. It gives
+        the best own bid and ask, the outstanding volume per side and per price level and a version number that changes
+        whenever any of the orders change.
+
+        The index is changed on the event loop thread only. Its getters (get_best_order, get_best_price, get_volume,
+        get_order, get_orders, get_price_levels, version and len) are safe to call from any thread: get_orders and
+        get_price_levels return a copy of a snapshot that is replaced whole on every change. Separate calls may see
+        different versions of the index, so compare the version before and after when they have to be consistent.
+
+        Parameters
+        ----------
+        instrument_id: str
+            The instrument_id of the instrument to obtain the order index for.
+
+        Returns
+        -------
+        OrderIndex
+            The index of the client's outstanding limit orders on the instrument.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        return self._e.get_order_index(instrument_id)
+
     def get_last_price_book(self, instrument_id: str) -> PriceBook:
         """
         Returns the last received limit order book state for an instrument.
@@ -285,6 +557,24 @@ Unable to authenticate with the server. Please double-check that your username a
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
         return self._i.get_last_price_book(instrument_id)
 
+    def get_top_of_book(self, instrument_id: str) -> TopOfBook:
+        """
+        Returns the best bid and ask of the last received limit order book for an instrument, together with the mid price,
+        spread and micro price. These are computed once when the book is received, so this is cheap to call repeatedly.
+
+        Parameters
+        ----------
+        instrument_id: str
+            The instrument_id of the instrument to obtain the top of book for.
+
+        Returns
+        -------
+        TopOfBook
+             Returns the top of the last received limit order book for an instrument, or None if no book was received yet.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        return self._i.get_top_of_book(instrument_id)
+
     def get_positions(self) -> typing.Dict[str, int]:
         """
         Get your current positions.
@@ -312,6 +602,23 @@ Unable to authenticate with the server. Please double-check that your username a
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
         return self._e.get_positions_and_cash()
 
+    def get_position(self, instrument_id: str) -> int:
+        """
+        Get your current position in a single instrument, without building the dictionary of all positions.
+
+        Parameters
+        ----------
+        instrument_id: str
+            The instrument_id of the instrument to obtain the position for.
+
+        Returns
+        -------
+        int
+            The current amount of lots held in the instrument.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        return self._e.get_position(instrument_id)
+
     def get_cash(self) -> float:
         """
         Get your total cash position.
@@ -346,8 +653,13 @@ Unable to authenticate with the server. Please double-check that your username a
         """
 
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
-        if valuations is None:
-            valuations = dict()
+        if not valuations:
+            # the position accountant keeps the pnl against last traded prices up to date on every trade and tick
+            pnl = self._e.get_pnl()
+            if pnl is None:
+                logger.error("No public trade-tick found to evaluate all open positions against and no valuation provided. "
+                             "Unable to calculate PnL.")
+            return pnl
 
         positions = self._e.get_positions_and_cash()
         pnl = 0
@@ -372,6 +684,135 @@ Unable to authenticate with the server. Please double-check that your username a
 
         return pnl
 
+    def add_top_of_book_callback(self, callback: typing.Callable[[TopOfBook], None]) -> None:
+        """
+        Call callback(top_of_book) whenever a new limit order book is received for any instrument.
+
+        The callback runs on the event loop thread of the client, directly when the book arrives. It must be quick and
+        must not call the blocking functions of this class, as that would deadlock the loop. Hand the event over to
+        another thread (see strategy_runtime.StrategyRuntime) to act on it with this class.
+
+        Parameters
+        ----------
+        callback: typing.Callable[[TopOfBook], None]
+            The function to call with the top of the new book.
+        """
+        self._i.add_top_of_book_callback(callback)
+
+    def remove_top_of_book_callback(self, callback: typing.Callable[[TopOfBook], None]) -> None:
+        """
+        Stop calling a callback added with add_top_of_book_callback.
+        """
+        self._i.remove_top_of_book_callback(callback)
+
+    def add_trade_tick_callback(self, callback: typing.Callable[[TradeTick], None]) -> None:
+        """
+        Call callback(trade_tick) for every public trade tick received, on the event loop thread of the client.
+        See add_top_of_book_callback for what the callback may do.
+
+        Parameters
+        ----------
+        callback: typing.Callable[[TradeTick], None]
+            The function to call with every public trade.
+        """
+        self._i.add_trade_tick_callback(callback)
+
+    def remove_trade_tick_callback(self, callback: typing.Callable[[TradeTick], None]) -> None:
+        """
+        Stop calling a callback added with add_trade_tick_callback.
+        """
+        self._i.remove_trade_tick_callback(callback)
+
+    def add_trade_callback(self, callback: typing.Callable[[Trade], None]) -> None:
+        """
+        Call callback(trade) for every private trade (fill) received, on the event loop thread of the client, after the
+        positions have been updated for it. See add_top_of_book_callback for what the callback may do.
+
+        Parameters
+        ----------
+        callback: typing.Callable[[Trade], None]
+            The function to call with every private trade.
+        """
+        self._e.add_trade_callback(callback)
+
+    def remove_trade_callback(self, callback: typing.Callable[[Trade], None]) -> None:
+        """
+        Stop calling a callback added with add_trade_callback.
+        """
+        self._e.remove_trade_callback(callback)
+
+    def schedule_timer(self, delay: float, callback: typing.Callable, *args) -> Timer:
+        """
+        Run callback(*args) after delay seconds, within about a millisecond of the deadline.
+
+        The callback runs on the event loop thread of the client, not on the thread that scheduled it. It must not call
+        the blocking functions of this class (that would deadlock the loop), but it may return a coroutine of the
+        underlying clients, which is then run on the loop. Scheduling and cancelling are O(1), so thousands of timers
+        are fine.
+
+        Parameters
+        ----------
+        delay: float
+            Number of seconds after which to run the callback.
+        callback: typing.Callable
+            The function to run.
+
+        Returns
+        -------
+        Timer
+            A handle that can be passed to cancel_timer.
+        """
+        return self._timer_wheel.schedule(delay, callback, *args)
+
+    def cancel_timer(self, timer: Timer) -> None:
+        """
+        Cancel a timer returned by schedule_timer or schedule_orders_expiry. Cancelling a timer that already ran does
+        nothing.
+
+        Parameters
+        ----------
+        timer: Timer
+            The timer to cancel.
+        """
+        timer.cancel()
+
+    def schedule_orders_expiry(self, instrument_id: str, side: str, ttl: float) -> Timer:
+        """
+        Delete all outstanding orders on one side of an instrument once ttl seconds have passed, unless the returned timer
+        is cancelled before then. Use this to give quotes an exact time to live instead of checking their age in the
+        strategy loop.
+
+        Parameters
+        ----------
+        instrument_id: str
+            The instrument_id of the instrument to delete the orders of.
+        side: str
+            'bid' or 'ask', the side to delete the orders of.
+        ttl: float
+            Number of seconds after which the orders are deleted.
+
+        Returns
+        -------
+        Timer
+            A handle that can be passed to cancel_timer, e.g. when the quote is replaced before it expires.
+        """
+        assert side in exchange_client.ALL_SIDES, f"side must be one of {exchange_client.ALL_SIDES}"
+        return self._timer_wheel.schedule(ttl, self._e.delete_orders_on_side, instrument_id, side)
+
+    def profile_event_loop(self, profiler: SamplingProfiler) -> None:
+        """
+        Sample the event loop thread of the client with profiler, so the time spent handling feed messages, running
+        callbacks and timers, and waiting on RPCs shows up next to that of the strategy. The thread only exists while
+        connected, so call this after connect().
+
+        Parameters
+        ----------
+        profiler: SamplingProfiler
+            The profiler to add the event loop thread to, under the name 'event_loop'.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        profiler.watch_thread(self._wrapper.get_thread(), 'event_loop')
+
     def get_instruments(self) -> typing.Dict[str, Instrument]:
         """
         Returns all existing instruments on the exchange
@@ -384,6 +825,19 @@ Unable to authenticate with the server. Please double-check that your username a
         assert self.is_connected(), "Cannot call function until connected. Call connect() first"
         return self._i.get_instruments()
 
+    def get_instruments_version(self) -> int:
+        """
+        Returns a number that changes whenever an instrument is created or expires, so caches derived from
+        get_instruments() know when to rebuild without comparing all instruments.
+
+        Returns
+        -------
+        int
+            The version of the instrument definitions.
+        """
+        assert self.is_connected(), "Cannot call function until connected. Call connect() first"
+        return self._i.get_instruments_version()
+
     def __enter__(self):
         self.connect()
         return self
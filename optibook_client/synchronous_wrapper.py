@@ -19,6 +19,9 @@ class SynchronousWrapper:
     def get_loop(self):
         return self._loop
 
+    def get_thread(self):
+        return self._thread
+
     def is_connected(self) -> bool:
         return all([cl.is_connected() for cl in self._clients]) and self._loop.is_running()
 
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import typing
+
+logger = logging.getLogger('client')
+
+
+class Timer:
+    """
+    Handle of a scheduled timer. Cancelling only sets a flag, so it is O(1) and safe to do from any thread.
+    """
+    __slots__ = ('deadline', 'deadline_tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline: float, callback: typing.Callable, args: typing.Tuple):
+        self.deadline = deadline
+        self.deadline_tick = 0
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel running on an asyncio event loop.
+
+    A timer that expires at tick t is stored in slot t % nr_slots, so scheduling and cancelling are O(1) regardless of the
+    number of timers. While there are timers, the wheel ticks every `resolution` seconds and runs the callbacks of the
+    timers that expired in the slots it passed. Callbacks run on the loop thread; if one returns a coroutine it is
+    scheduled on the loop.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, resolution: float = 0.001, nr_slots: int = 1024):
+        self._loop = loop
+        self.resolution = resolution
+        self._slots: typing.List[typing.Dict[Timer, None]] = [{} for _ in range(nr_slots)]
+        self._nr_timers = 0
+        self._current_tick = None
+        self._tick_handle = None
+
+    def schedule(self, delay: float, callback: typing.Callable, *args) -> Timer:
+        """
+        Schedules callback(*args) to run after delay seconds. Can be called from any thread.
+        """
+        timer = Timer(self._loop.time() + delay, callback, args)
+        self._loop.call_soon_threadsafe(self._add, timer)
+        return timer
+
+    def _add(self, timer):
+        if timer.cancelled:
+            return
+        if self._current_tick is None:
+            self._current_tick = int(self._loop.time() / self.resolution)
+        # never put a timer in a slot that was already passed, it would wait a whole revolution
+        timer.deadline_tick = max(int(timer.deadline / self.resolution) + 1, self._current_tick + 1)
+        self._slots[timer.deadline_tick % len(self._slots)][timer] = None
+        self._nr_timers += 1
+        if self._tick_handle is None:
+            self._tick_handle = self._loop.call_at((self._current_tick + 1) * self.resolution, self._tick)
+
+    def _tick(self):
+        self._tick_handle = None
+        now_tick = int(self._loop.time() / self.resolution)
+        nr_slots = len(self._slots)
+        # when the loop was blocked for longer than a revolution, every slot has to be looked at once
+        first_tick = max(self._current_tick + 1, now_tick - nr_slots + 1)
+
+        for tick in range(first_tick, now_tick + 1):
+            slot = self._slots[tick % nr_slots]
+            if not slot:
+                continue
+            expired = [t for t in slot if t.cancelled or t.deadline_tick <= now_tick]
+            for timer in expired:
+                del slot[timer]
+                self._nr_timers -= 1
+                if not timer.cancelled:
+                    self._run(timer)
+        self._current_tick = now_tick
+
+        if self._nr_timers:
+            self._tick_handle = self._loop.call_at((now_tick + 1) * self.resolution, self._tick)
+        else:
+            self._current_tick = None
+
+    def _run(self, timer):
+        try:
+            f = timer.callback(*timer.args)
+            if asyncio.iscoroutine(f):
+                asyncio.ensure_future(f, loop=self._loop)
+        except Exception:
+            logger.exception('Exception occurred in timer callback')
+
+    def __len__(self):
+        return self._nr_timers
@@ -0,0 +1,205 @@
+"""
+Screens every pair of instruments for cointegration, hedge ratio and half-life of mean reversion.
+
+The hedge ratios and spreads of all pairs come from one covariance matrix, and the half-lives from one vectorized
+regression over all spreads. Only the Engle-Granger ADF tests are run per pair, spread over a process pool. Results are
+cached per pair and the contents of its two price columns, timestamps included, so screening the same data again, or
+after adding instruments, only tests the pairs that were not tested before, while corrected data is tested again.
+
+Run from the repository root with: python -m pairs_trading_strat.pair_screening <recorded data> [--freq 1s] [--top 20]
+"""
+import argparse
+import hashlib
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp
+from statsmodels.tsa.stattools import adfuller
+
+RESULT_COLUMNS = ['leg_a', 'leg_b', 'hedge_ratio', 'intercept', 'adf_statistic', 'pvalue', 'half_life']
+
+
+def load_mid_prices(source, freq=None):
+    """
+    Loads recorded prices and aligns them into one column per instrument.
+    Args:
+        source (str or pd.DataFrame): A csv or parquet file, or a DataFrame, with one row per observation and columns
+            'timestamp', 'instrument_id' and either 'mid_price', 'best_bid_price' and 'best_ask_price', or 'price'
+            (e.g. recorded trade ticks).
+        freq (str): Resample to this frequency, e.g. '1s', taking the last price of each interval. None keeps every
+            timestamp at which any instrument had an observation.
+    Returns:
+        (pd.DataFrame): Mid prices indexed by timestamp, one column per instrument, forward filled, starting at the first
+            timestamp at which all instruments have a price.
+    """
+    if isinstance(source, pd.DataFrame):
+        data = source
+    elif str(source).endswith('.parquet'):
+        data = pd.read_parquet(source)
+    else:
+        data = pd.read_csv(source)
+
+    if 'mid_price' in data:
+        prices = data['mid_price']
+    elif 'best_bid_price' in data and 'best_ask_price' in data:
+        prices = (data['best_bid_price'] + data['best_ask_price']) / 2
+    else:
+        prices = data['price']
+    long = pd.DataFrame({'timestamp': pd.to_datetime(data['timestamp']), 'instrument_id': data['instrument_id'], 'price': prices})
+    long = long.dropna(subset=['price'])
+
+    wide = long.pivot_table(index='timestamp', columns='instrument_id', values='price', aggfunc='last').sort_index()
+    if freq is not None:
+        wide = wide.resample(freq).last()
+    wide.columns.name = None
+    return wide.ffill().dropna()
+
+
+def pair_regressions(prices):
+    """
+    OLS of every instrument on every other instrument at once.
+    Args:
+        prices (np.ndarray): Aligned prices, one column per instrument.
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray, np.ndarray): Per pair (a, b) with a < b the index of a, the index of b, the
+            hedge ratio and the intercept of a = hedge_ratio * b + intercept.
+    """
+    means = prices.mean(axis=0)
+    centered = prices - means
+    covariance = centered.T @ centered
+    legs_a, legs_b = np.triu_indices(prices.shape[1], k=1)
+    variances_b = covariance[legs_b, legs_b]
+    hedge_ratios = np.divide(covariance[legs_a, legs_b], variances_b, out=np.zeros(len(legs_a)), where=variances_b > 0)
+    intercepts = means[legs_a] - hedge_ratios * means[legs_b]
+    return legs_a, legs_b, hedge_ratios, intercepts
+
+
+def half_lives(spreads):
+    """
+    Half-life of mean reversion of every column, from the regression of its change on its previous value.
+    Args:
+        spreads (np.ndarray): One spread per column.
+    Returns:
+        (np.ndarray): The half-life of each column in observations, 0 where a deviation is gone after one observation and
+            inf where it does not revert.
+    """
+    lagged = spreads[:-1] - spreads[:-1].mean(axis=0)
+    changes = np.diff(spreads, axis=0)
+    changes -= changes.mean(axis=0)
+    variances = (lagged * lagged).sum(axis=0)
+    slopes = np.divide((lagged * changes).sum(axis=0), variances, out=np.zeros(spreads.shape[1]), where=variances > 0)
+    reverting = (slopes < 0) & (slopes > -1)
+    result = np.where(slopes <= -1, 0.0, np.inf)
+    result[reverting] = -np.log(2) / np.log1p(slopes[reverting])
+    return result
+
+
+def _engle_granger_test(spread):
+    """
+    ADF test of the residuals of a cointegrating regression. The p-value is for two variables, like statsmodels coint,
+    as the residuals of an estimated hedge ratio look more stationary than a series tested on its own.
+    """
+    statistic = adfuller(spread, regression='c', autolag='AIC')[0]
+    return float(statistic), float(mackinnonp(statistic, regression='c', N=2))
+
+
+class PairScreener:
+    """
+    Screens all pairs of a price history, keeping the results of every pair and price data it has tested.
+    """
+
+    def __init__(self, max_workers=None, chunksize=8):
+        """
+        Args:
+            max_workers (int): Processes of the pool for the ADF tests, the number of CPUs if None, 1 to test in-process.
+            chunksize (int): Number of pairs sent to a worker at a time.
+        """
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+        self.chunksize = chunksize
+        self._cache: typing.Dict[tuple, tuple] = {}
+
+    @staticmethod
+    def _fingerprints(prices):
+        """
+        Digest of the timestamps and prices of every column, so a pair is only served from the cache for the same data.
+        """
+        return [hashlib.blake2b(pd.util.hash_pandas_object(prices[column], index=True).to_numpy().tobytes(),
+                                digest_size=16).digest()
+                for column in prices.columns]
+
+    def screen(self, prices, cutoff=None):
+        """
+        Args:
+            prices (pd.DataFrame): Aligned prices, one column per instrument, e.g. from load_mid_prices.
+            cutoff (float): Only return pairs with a p-value below this, all pairs if None.
+        Returns:
+            (pd.DataFrame): Per pair the columns of RESULT_COLUMNS, the most cointegrated pairs first.
+        """
+        instruments = list(prices.columns)
+        if len(instruments) < 2 or len(prices) < 3:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        values = prices.to_numpy(dtype=float)
+        fingerprints = self._fingerprints(prices)
+
+        legs_a, legs_b, hedge_ratios, intercepts = pair_regressions(values)
+        spreads = values[:, legs_a] - values[:, legs_b] * hedge_ratios - intercepts
+
+        keys = [(instruments[a], instruments[b], fingerprints[a], fingerprints[b])
+                for a, b in zip(legs_a.tolist(), legs_b.tolist())]
+        untested = [n for n, key in enumerate(keys) if key not in self._cache]
+        if untested:
+            columns = (spreads[:, n] for n in untested)
+            if self.max_workers > 1 and len(untested) > self.chunksize:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                    tests = list(pool.map(_engle_granger_test, columns, chunksize=self.chunksize))
+            else:
+                tests = [_engle_granger_test(column) for column in columns]
+            for n, test in zip(untested, tests):
+                self._cache[keys[n]] = test
+
+        tests = np.array([self._cache[key] for key in keys])
+        result = pd.DataFrame({
+            'leg_a': [instruments[a] for a in legs_a],
+            'leg_b': [instruments[b] for b in legs_b],
+            'hedge_ratio': hedge_ratios,
+            'intercept': intercepts,
+            'adf_statistic': tests[:, 0],
+            'pvalue': tests[:, 1],
+            'half_life': half_lives(spreads),
+        })
+        if cutoff is not None:
+            result = result[result['pvalue'] < cutoff]
+        return result.sort_values('pvalue', ignore_index=True)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+def screen_pairs(prices, cutoff=None, max_workers=None):
+    """
+    Screens all pairs of prices once, see PairScreener.screen.
+    """
+    return PairScreener(max_workers).screen(prices, cutoff)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen all pairs of recorded instruments for cointegration.")
+    parser.add_argument('source', help="csv or parquet file with timestamp, instrument_id and prices")
+    parser.add_argument('--freq', default=None, help="resample to this frequency, e.g. 1s")
+    parser.add_argument('--cutoff', type=float, default=None, help="only show pairs with a p-value below this")
+    parser.add_argument('--top', type=int, default=20, help="number of pairs to show")
+    parser.add_argument('--workers', type=int, default=None, help="processes for the ADF tests")
+    args = parser.parse_args()
+
+    prices = load_mid_prices(args.source, args.freq)
+    n = prices.shape[1]
+    print(f"{n} instruments, {len(prices)} observations, {n * (n - 1) // 2} pairs")
+    result = screen_pairs(prices, args.cutoff, args.workers)
+    print(result.head(args.top).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,11 @@ import pandas as pd
 import statsmodels
 import statsmodels.api as sm
 from statsmodels.tsa.stattools import coint, adfuller
+try:
+    from . import synthetic_market
+except ImportError:
+    # imported as a top level module, e.g. from the notebooks in this directory
+    import synthetic_market
 # import seaborn as sns; sns.set(style="whitegrid")
 
 
@@ -11,10 +16,9 @@ from statsmodels.tsa.stattools import coint, adfuller
 
 
 
-def generate_data(params):
-    mu = params[0]
-    sigma = params[1]
-    return np.random.normal(mu, sigma)
+def generate_data(params, size=None, rng=None):
+    # params may hold arrays, e.g. a mean per sample, to generate a whole series in one call
+    return synthetic_market.generate_data(params, size, rng)
     
     
 def adfuller_ts_test(ts, cutoff=0.01):
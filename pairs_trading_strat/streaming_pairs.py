@@ -0,0 +1,366 @@
+"""
+Streaming pairs engine: hedge ratio, spread z-score and stationarity of a pair, updated in O(1) per book update.
+
+The hedge ratio and intercept of A = beta * B + alpha are tracked by a Kalman filter with a random walk state, so they
+adapt to a drifting relation without refitting. The spread is the forecast error A - beta * B - alpha with beta and
+alpha from before the observation, as the filter absorbs part of every observation into its state. It feeds a rolling
+z-score and a rolling Dickey-Fuller regression (delta spread on lagged spread), which gives a cheap stationarity indicator
+and the half-life of mean reversion on every update. The full augmented Dickey-Fuller test of statsmodels runs every
+adf_interval observations on a worker thread, off the event loop.
+
+Run python -m pairs_trading_strat.streaming_pairs to check the engine on a synthetic cointegrated pair.
+"""
+import argparse
+import math
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from statsmodels.tsa.stattools import adfuller
+
+from volatility_risk_mgmt.rolling_stats import ZScore
+
+# 5% critical value of the Dickey-Fuller test with a constant, for large samples
+DF_CRITICAL_VALUE_5PCT = -2.86
+
+
+class KalmanHedgeRatio:
+    """
+    Kalman filter for y = beta * x + alpha, with beta and alpha following a random walk.
+    """
+
+    def __init__(self, delta=1e-7, observation_variance=1e-3, initial_beta=1.0, initial_alpha=0.0):
+        """
+        Args:
+            delta (float): How fast beta and alpha may drift. The state noise is delta / (1 - delta) per observation, for
+                alpha and for beta * x, so in the units of observation_variance whatever the price level of x.
+            observation_variance (float): Variance of the noise around the linear relation.
+            initial_beta (float): Hedge ratio to start from.
+            initial_alpha (float): Intercept to start from.
+        """
+        assert 0 < delta < 1, "delta must be between 0 and 1"
+        self.state_variance = delta / (1 - delta)
+        self.observation_variance = observation_variance
+        self.beta = initial_beta
+        self.alpha = initial_alpha
+        # covariance of (beta, alpha), large so the first observations dominate the initial guess
+        self._p00, self._p01, self._p11 = 1.0, 0.0, 1.0
+        self.forecast_error = 0.0
+        self.forecast_variance = 0.0
+        self.nr_updates = 0
+
+    def update(self, x, y):
+        """
+        Adds an observation.
+        Returns:
+            (float): The forecast error y - (beta * x + alpha) before the update.
+        """
+        q = self.state_variance
+        # the noise of beta is scaled to the price level, or a drift of beta would move beta * x by x times as much
+        p00, p01, p11 = self._p00 + (q / (x * x) if x else q), self._p01, self._p11 + q
+
+        error = y - (self.beta * x + self.alpha)
+        # h = (x, 1): P h' and h P h' + R, written out for the 2x2 case
+        ph0 = p00 * x + p01
+        ph1 = p01 * x + p11
+        s = ph0 * x + ph1 + self.observation_variance
+        k0, k1 = ph0 / s, ph1 / s
+
+        self.beta += k0 * error
+        self.alpha += k1 * error
+        self._p00 = p00 - k0 * ph0
+        self._p01 = p01 - k0 * ph1
+        self._p11 = p11 - k1 * ph1
+        self.forecast_error = error
+        self.forecast_variance = s
+        self.nr_updates += 1
+        return error
+
+
+class RollingDickeyFuller:
+    """
+    Regression of the change of a series on its previous value over the last `window` steps, updated in O(1).
+
+    A clearly negative slope means the series reverts to its mean. The t-statistic of the slope is the Dickey-Fuller
+    statistic without lags, which is compared to its critical value as a quick stationarity check.
+    """
+
+    def __init__(self, window):
+        """
+        Args:
+            window (int): Number of steps in the regression.
+        """
+        assert window > 2, "window must be larger than 2"
+        self.window = window
+        self._pairs = deque()
+        self._previous = None
+        self._mean_x = self._mean_y = 0.0
+        self._cxx = self._cxy = self._cyy = 0.0
+
+    def update(self, value):
+        """
+        Adds the next value of the series.
+        """
+        previous = self._previous
+        self._previous = value
+        if previous is None:
+            return
+        x, y = previous, value - previous
+        self._pairs.append((x, y))
+        n = len(self._pairs)
+        dx = x - self._mean_x
+        dy = y - self._mean_y
+        self._mean_x += dx / n
+        self._mean_y += dy / n
+        self._cxx += dx * (x - self._mean_x)
+        self._cxy += dx * (y - self._mean_y)
+        self._cyy += dy * (y - self._mean_y)
+        if n > self.window:
+            old_x, old_y = self._pairs.popleft()
+            n -= 1
+            dx = old_x - self._mean_x
+            self._mean_x -= dx / n
+            old_dy = old_y - self._mean_y
+            self._mean_y -= old_dy / n
+            self._cxx -= dx * (old_x - self._mean_x)
+            self._cxy -= dx * (old_y - self._mean_y)
+            self._cyy -= old_dy * (old_y - self._mean_y)
+        if self._cxx < 0.0:
+            self._cxx = 0.0
+
+    def __len__(self):
+        return len(self._pairs)
+
+    @property
+    def slope(self):
+        return self._cxy / self._cxx if self._cxx > 0 else 0.0
+
+    @property
+    def t_statistic(self):
+        """
+        The Dickey-Fuller statistic of the window, 0 until there are enough steps.
+        """
+        n = len(self._pairs)
+        if n < 3 or self._cxx <= 0:
+            return 0.0
+        slope = self._cxy / self._cxx
+        residual_variance = max(self._cyy - slope * self._cxy, 0.0) / (n - 2)
+        if residual_variance == 0.0:
+            return 0.0
+        return slope / math.sqrt(residual_variance / self._cxx)
+
+    @property
+    def half_life(self):
+        """
+        Steps it takes for a deviation to halve, inf if the series does not revert.
+        """
+        slope = self.slope
+        if not -1 < slope < 0:
+            return math.inf
+        return -math.log(2) / math.log(1 + slope)
+
+
+class StreamingPairsEngine:
+    """
+    Follows one pair of instruments from the top of book callbacks of an InfoClient or Exchange, e.g. PHILIPS_A against
+    PHILIPS_B. Every book update of either leg, once both have a mid price, is one synchronized observation of both mids.
+    """
+
+    def __init__(self, leg_a, leg_b, window=200, delta=1e-7, observation_variance=1e-3, critical_value=DF_CRITICAL_VALUE_5PCT,
+                 adf_interval=1000, adf_window=1000, adf_cutoff=0.05):
+        """
+        Args:
+            leg_a (str): The instrument id of the leg that is modelled, A = beta * B + alpha.
+            leg_b (str): The instrument id of the hedge leg.
+            window (int): Number of observations of the rolling z-score and Dickey-Fuller regression.
+            delta (float): Drift of the hedge ratio, see KalmanHedgeRatio.
+            observation_variance (float): Noise of the relation, see KalmanHedgeRatio.
+            critical_value (float): The Dickey-Fuller statistic below which the spread is considered stationary.
+            adf_interval (int): Number of observations between full ADF tests, 0 to never run them.
+            adf_window (int): Number of most recent spreads the full ADF test runs on.
+            adf_cutoff (float): The p-value of the full ADF test below which the spread is considered stationary.
+        """
+        self.leg_a = leg_a
+        self.leg_b = leg_b
+        self.critical_value = critical_value
+        self.adf_interval = adf_interval
+        self.adf_cutoff = adf_cutoff
+
+        self.kalman = KalmanHedgeRatio(delta, observation_variance)
+        self.z_score = ZScore(window)
+        self.dickey_fuller = RollingDickeyFuller(window)
+        self.spread = 0.0
+        self.nr_observations = 0
+
+        self._mid_a = None
+        self._mid_b = None
+        self._spreads = deque(maxlen=adf_window)
+        self._executor = None
+        self._adf_future = None
+        # (statistic, p-value, number of observations tested), replaced as a whole by the worker thread
+        self._adf_result = None
+
+    def subscribe(self, client):
+        """
+        Starts receiving the top of book updates of an InfoClient or Exchange.
+        """
+        client.add_top_of_book_callback(self.on_top_of_book)
+
+    def unsubscribe(self, client):
+        client.remove_top_of_book_callback(self.on_top_of_book)
+
+    def on_top_of_book(self, top_of_book):
+        instrument_id = top_of_book.instrument_id
+        if instrument_id == self.leg_a:
+            self._mid_a = top_of_book.mid_price
+        elif instrument_id == self.leg_b:
+            self._mid_b = top_of_book.mid_price
+        else:
+            return
+        if self._mid_a is not None and self._mid_b is not None:
+            self.update(self._mid_a, self._mid_b)
+
+    def update(self, price_a, price_b):
+        """
+        Adds a synchronized observation of both legs.
+        Returns:
+            (float): The z-score of the spread.
+        """
+        spread = self.spread = self.kalman.update(price_b, price_a)
+        z_score = self.z_score.update(spread)
+        self.dickey_fuller.update(spread)
+        self._spreads.append(spread)
+        self.nr_observations += 1
+        if self.adf_interval and self.nr_observations % self.adf_interval == 0:
+            self._start_adf_test()
+        return z_score
+
+    def _start_adf_test(self):
+        if self._adf_future is not None and not self._adf_future.done():
+            # the previous test is still running, skip this one rather than queue up
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='adf')
+        spreads = np.fromiter(self._spreads, dtype=float, count=len(self._spreads))
+        self._adf_future = self._executor.submit(self._run_adf_test, spreads)
+
+    def _run_adf_test(self, spreads):
+        statistic, pvalue = adfuller(spreads)[:2]
+        self._adf_result = (float(statistic), float(pvalue), len(spreads))
+
+    def close(self):
+        """
+        Stops the worker thread of the ADF tests.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def hedge_ratio(self):
+        return self.kalman.beta
+
+    @property
+    def intercept(self):
+        return self.kalman.alpha
+
+    @property
+    def is_stationary(self):
+        """
+        Whether the rolling Dickey-Fuller statistic of the spread is below the critical value.
+        """
+        return len(self.dickey_fuller) >= self.dickey_fuller.window and self.dickey_fuller.t_statistic < self.critical_value
+
+    def get_adf_result(self):
+        """
+        Returns:
+            (tuple): The statistic, p-value and sample size of the last full ADF test, or None if none finished yet.
+        """
+        return self._adf_result
+
+    def get_state(self):
+        """
+        Returns:
+            (dict): The current hedge ratio, intercept, spread, z-score and stationarity of the pair.
+        """
+        adf_result = self._adf_result
+        return {
+            'hedge_ratio': self.kalman.beta,
+            'intercept': self.kalman.alpha,
+            'spread': self.spread,
+            'z_score': self.z_score.last,
+            'df_statistic': self.dickey_fuller.t_statistic,
+            'half_life': self.dickey_fuller.half_life,
+            'is_stationary': self.is_stationary,
+            'adf_pvalue': adf_result[1] if adf_result is not None else None,
+            'adf_stationary': adf_result[1] < self.adf_cutoff if adf_result is not None else None,
+        }
+
+
+def check_synthetic_pair(n_steps=20000, seed=0, hedge_ratio=1.5, intercept=10.0, reversion=0.05, warmup=1000, **kwargs):
+    """
+    Runs the engine on a SyntheticMarket pair with a known hedge ratio and mean reverting spread.
+    Args:
+        n_steps (int): Number of observations.
+        seed (int): Seed of the market.
+        hedge_ratio (float): The hedge ratio the market is generated with.
+        intercept (float): The intercept the market is generated with.
+        reversion (float): Fraction of the injected spread that reverts each step.
+        warmup (int): Number of first observations left out of the comparison.
+        kwargs: Passed on to StreamingPairsEngine.
+    Returns:
+        (dict): The correlation of the spread with the injected spread and of the z-score with the z-score of the
+            injected spread over the same window, the final hedge ratio, the half-life of the engine against the true one
+            and the fraction of observations found stationary, by the engine and on the injected spread.
+    """
+    from pairs_trading_strat.synthetic_market import SyntheticMarket
+
+    market = SyntheticMarket(['A', 'B'], seed=seed, cointegrated={'A': ('B', hedge_ratio, intercept)}, reversion=reversion)
+    mids = market.mid_prices(n_steps)
+    true_spreads = mids[:, 0] - hedge_ratio * mids[:, 1] - intercept
+
+    engine = StreamingPairsEngine('A', 'B', adf_interval=0, **kwargs)
+    window = engine.dickey_fuller.window
+    true_z_scores = ZScore(window).update_batch(true_spreads)
+    true_dickey_fuller = RollingDickeyFuller(window)
+    spreads, z_scores, half_lives, stationary, true_stationary = [], [], [], [], []
+    for price_a, price_b, true_spread in zip(mids[:, 0].tolist(), mids[:, 1].tolist(), true_spreads.tolist()):
+        z_scores.append(engine.update(price_a, price_b))
+        spreads.append(engine.spread)
+        half_lives.append(engine.dickey_fuller.half_life)
+        stationary.append(engine.is_stationary)
+        true_dickey_fuller.update(true_spread)
+        true_stationary.append(true_dickey_fuller.t_statistic < engine.critical_value)
+
+    half_lives = np.array(half_lives[warmup:])
+    finite = np.isfinite(half_lives)
+    return {
+        'spread_correlation': float(np.corrcoef(spreads[warmup:], true_spreads[warmup:])[0, 1]),
+        'z_score_correlation': float(np.corrcoef(z_scores[warmup:], true_z_scores[warmup:])[0, 1]),
+        'hedge_ratio': engine.hedge_ratio,
+        'half_life': float(np.median(half_lives[finite])) if finite.any() else math.inf,
+        'true_half_life': -math.log(2) / math.log(1 - reversion),
+        'stationary_fraction': float(np.mean(stationary[warmup:])),
+        'true_stationary_fraction': float(np.mean(true_stationary[warmup:])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the z-score of the engine tracks the spread of a synthetic pair.")
+    parser.add_argument('--steps', type=int, default=20000, help="number of observations")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic market")
+    parser.add_argument('--delta', type=float, default=1e-7, help="drift of the hedge ratio, see KalmanHedgeRatio")
+    parser.add_argument('--min-correlation', type=float, default=0.8,
+                        help="fail if the z-score correlates less than this with that of the injected spread")
+    args = parser.parse_args()
+
+    result = check_synthetic_pair(args.steps, args.seed, delta=args.delta)
+    for key, value in result.items():
+        print(f"{key:>24}: {value:.4g}")
+    if result['z_score_correlation'] < args.min_correlation or not math.isfinite(result['half_life']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
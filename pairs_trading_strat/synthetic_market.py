@@ -0,0 +1,199 @@
+"""
+Vectorized synthetic market data for tests, benchmarks and backtests.
+
+SyntheticMarket generates, for a set of instruments, correlated random walk mid prices (with some instruments optionally
+cointegrated with another one), order book snapshots around those mids with random spreads and depth, and trade ticks
+against the best levels. Everything is generated as NumPy arrays, a whole block of steps per call, from a seeded
+generator, so the same seed always gives the same market. The to_price_books and to_trade_ticks functions turn the
+arrays into the PriceBook and TradeTick objects of the client where those are needed; only they need the client
+installed.
+"""
+import datetime
+
+import numpy as np
+from scipy.signal import lfilter
+
+
+def generate_data(params, size=None, rng=None):
+    """
+    Normal samples with mean params[0] and standard deviation params[1], both of which may be arrays.
+    Args:
+        params (tuple): The mean and standard deviation.
+        size (int or tuple): Shape of the output, one sample (or one per element of params) if None.
+        rng (np.random.Generator): Generator to draw from, NumPy's global one if None.
+    """
+    mu, sigma = params
+    if rng is None:
+        return np.random.normal(mu, sigma, size)
+    return rng.normal(mu, sigma, size)
+
+
+class SyntheticMarket:
+    """
+    Generator of a market in a number of instruments. Successive calls to generate continue from where the previous
+    one ended, so a long history can be generated in blocks.
+    """
+
+    def __init__(self, instrument_ids, seed=None, start_prices=100.0, volatility=0.0005, correlation=0.0,
+                 cointegrated=None, reversion=0.05, spread_volatility=0.05, tick_size=0.1, max_spread_ticks=4, depth=5,
+                 max_volume=50, trade_probability=0.2, step_seconds=0.1, start=None):
+        """
+        Args:
+            instrument_ids (list): The instruments to generate.
+            seed (int): Seed of the generator, None for a different market every time.
+            start_prices (float or array_like): Mid price of each instrument at the start.
+            volatility (float or array_like): Standard deviation of the log return of each instrument per step.
+            correlation (float or np.ndarray): Correlation of the log returns, one number for all pairs or a matrix.
+            cointegrated (dict): Per instrument id that follows another one a tuple (base_id, hedge_ratio, intercept). Its
+                mid is hedge_ratio * mid of base_id + intercept + a mean reverting spread, instead of a random walk.
+            reversion (float): Fraction of the spread of a cointegrated instrument that reverts each step.
+            spread_volatility (float): Standard deviation of the shocks to the spread of a cointegrated instrument.
+            tick_size (float): Price step of the order books.
+            max_spread_ticks (int): Maximum bid-ask spread in ticks, the spread is uniform between 1 and this.
+            depth (int): Number of price levels per side of the order books.
+            max_volume (int): Maximum volume at the best levels, deeper levels hold more.
+            trade_probability (float): Probability of a trade tick per instrument per step.
+            step_seconds (float): Time between steps.
+            start (datetime.datetime): Time of the first step, 2000-01-01 if None.
+        """
+        self.instrument_ids = list(instrument_ids)
+        n = len(self.instrument_ids)
+        self.rng = np.random.default_rng(seed)
+        self.volatility = np.broadcast_to(np.asarray(volatility, dtype=float), (n,))
+        if np.ndim(correlation) == 0:
+            correlation = np.full((n, n), float(correlation))
+            np.fill_diagonal(correlation, 1.0)
+        self._cholesky = np.linalg.cholesky(np.asarray(correlation, dtype=float))
+        self.tick_size = tick_size
+        self.max_spread_ticks = max_spread_ticks
+        self.depth = depth
+        self.max_volume = max_volume
+        self.trade_probability = trade_probability
+        self.step_seconds = step_seconds
+        self.reversion = reversion
+        self.spread_volatility = spread_volatility
+
+        index = {instrument_id: i for i, instrument_id in enumerate(self.instrument_ids)}
+        cointegrated = cointegrated or {}
+        self._followers = np.array([index[i] for i in cointegrated], dtype=int)
+        self._bases = np.array([index[base] for base, _, _ in cointegrated.values()], dtype=int)
+        self._hedge_ratios = np.array([ratio for _, ratio, _ in cointegrated.values()], dtype=float)
+        self._intercepts = np.array([intercept for _, _, intercept in cointegrated.values()], dtype=float)
+        assert not set(self._followers.tolist()) & set(self._bases.tolist()), "a base instrument cannot follow another one"
+
+        self._log_prices = np.log(np.broadcast_to(np.asarray(start_prices, dtype=float), (n,))).copy()
+        self._spreads = np.zeros(len(self._followers))
+        self._step = 0
+        self._start = np.datetime64(start or datetime.datetime(2000, 1, 1), 'us')
+
+    def mid_prices(self, n_steps):
+        """
+        Returns:
+            (np.ndarray): The next n_steps mid prices, shape (n_steps, number of instruments).
+        """
+        shocks = self.rng.standard_normal((n_steps, len(self.instrument_ids))) @ self._cholesky.T
+        log_prices = self._log_prices + np.cumsum(shocks * self.volatility, axis=0)
+        self._log_prices = log_prices[-1].copy()
+        mids = np.exp(log_prices)
+
+        if len(self._followers):
+            # the spread of each follower is an AR(1) process, filtered for all followers and steps at once
+            decay = 1 - self.reversion
+            noise = self.rng.normal(0.0, self.spread_volatility, (n_steps, len(self._followers)))
+            spreads = lfilter([1.0], [1.0, -decay], noise, axis=0, zi=(decay * self._spreads)[None, :])[0]
+            self._spreads = spreads[-1].copy()
+            mids[:, self._followers] = self._hedge_ratios * mids[:, self._bases] + self._intercepts + spreads
+        return mids
+
+    def order_books(self, mids):
+        """
+        Order books around mid prices.
+        Args:
+            mids (np.ndarray): Mid prices, shape (steps, instruments).
+        Returns:
+            (dict): 'bid_prices', 'bid_volumes', 'ask_prices' and 'ask_volumes', each of shape (steps, instruments, depth),
+                best level first.
+        """
+        shape = mids.shape
+        spread_ticks = self.rng.integers(1, self.max_spread_ticks + 1, shape)
+        best_bid_ticks = np.floor(mids / self.tick_size - spread_ticks / 2)
+        levels = np.arange(self.depth)
+        bid_ticks = best_bid_ticks[..., None] - levels
+        ask_ticks = (best_bid_ticks + spread_ticks)[..., None] + levels
+        # deeper levels hold more volume on average
+        volume_scale = (1 + levels) * self.max_volume
+        return {
+            'bid_prices': np.round(bid_ticks * self.tick_size, 10),
+            'bid_volumes': 1 + (self.rng.random(shape + (self.depth,)) * volume_scale).astype(np.int64),
+            'ask_prices': np.round(ask_ticks * self.tick_size, 10),
+            'ask_volumes': 1 + (self.rng.random(shape + (self.depth,)) * volume_scale).astype(np.int64),
+        }
+
+    def trade_ticks(self, books):
+        """
+        Trade ticks against the best levels of order books, at most one per instrument per step.
+        Args:
+            books (dict): Order books from order_books.
+        Returns:
+            (dict): Per trade 'step', 'instrument' (index into instrument_ids), 'price', 'volume' and 'aggressor_is_bid',
+                in order of step.
+        """
+        shape = books['bid_prices'].shape[:2]
+        steps, instruments = np.nonzero(self.rng.random(shape) < self.trade_probability)
+        aggressor_is_bid = self.rng.random(len(steps)) < 0.5
+        best_ask_price = books['ask_prices'][steps, instruments, 0]
+        best_bid_price = books['bid_prices'][steps, instruments, 0]
+        available = np.where(aggressor_is_bid, books['ask_volumes'][steps, instruments, 0], books['bid_volumes'][steps, instruments, 0])
+        return {
+            'step': steps,
+            'instrument': instruments,
+            'price': np.where(aggressor_is_bid, best_ask_price, best_bid_price),
+            'volume': self.rng.integers(1, available + 1),
+            'aggressor_is_bid': aggressor_is_bid,
+        }
+
+    def generate(self, n_steps):
+        """
+        Generates the next n_steps of the market.
+        Returns:
+            (dict): 'timestamps' (np.datetime64 per step), 'mids', 'books' (see order_books) and 'trades' (see trade_ticks,
+                with 'step' relative to this block).
+        """
+        timestamps = self._start + ((self._step + np.arange(n_steps)) * self.step_seconds * 1e6).astype('timedelta64[us]')
+        self._step += n_steps
+        mids = self.mid_prices(n_steps)
+        books = self.order_books(mids)
+        return {'timestamps': timestamps, 'mids': mids, 'books': books, 'trades': self.trade_ticks(books)}
+
+
+def to_price_books(market, data):
+    """
+    Yields the order books of a block generated by market.generate as PriceBook objects, per step per instrument.
+    """
+    # imported here, so the arrays can be generated without the client installed
+    from optibook.common_types import PriceBook, PriceVolume
+
+    books = data['books']
+    bid_prices, bid_volumes = books['bid_prices'].tolist(), books['bid_volumes'].tolist()
+    ask_prices, ask_volumes = books['ask_prices'].tolist(), books['ask_volumes'].tolist()
+    for step, timestamp in enumerate(data['timestamps'].tolist()):
+        for i, instrument_id in enumerate(market.instrument_ids):
+            yield PriceBook(timestamp=timestamp, instrument_id=instrument_id,
+                            bids=[PriceVolume(p, v) for p, v in zip(bid_prices[step][i], bid_volumes[step][i])],
+                            asks=[PriceVolume(p, v) for p, v in zip(ask_prices[step][i], ask_volumes[step][i])])
+
+
+def to_trade_ticks(market, data):
+    """
+    Yields the trades of a block generated by market.generate as TradeTick objects.
+    """
+    from optibook.common_types import TradeTick
+
+    trades = data['trades']
+    timestamps = data['timestamps'].tolist()
+    for trade_nr, (step, i, price, volume, aggressor_is_bid) in enumerate(zip(
+            trades['step'].tolist(), trades['instrument'].tolist(), trades['price'].tolist(), trades['volume'].tolist(),
+            trades['aggressor_is_bid'].tolist())):
+        yield TradeTick(timestamp=timestamps[step], instrument_id=market.instrument_ids[i], price=price, volume=volume,
+                        aggressor_side='bid' if aggressor_is_bid else 'ask', buyer='synthetic', seller='synthetic',
+                        trade_nr=trade_nr)
@@ -0,0 +1,2 @@
+from .rolling_stats import RollingMeanVariance, EWMA, RollingMinMax, ZScore, rolling_mean_variance, rolling_min_max
+from .realized_vol import Bar, RealizedVolatility, RealizedVolatilityEngine
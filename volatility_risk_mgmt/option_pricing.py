@@ -0,0 +1,271 @@
+"""
+Vectorized Black-Scholes pricing, greeks and implied volatility for whole option chains.
+
+All functions take NumPy arrays (or scalars, broadcast against each other) with one element per option, so a chain of
+hundreds of options is priced in a single pass. Times are in years, rates and volatilities are annualized.
+"""
+import math
+import time
+
+import numpy as np
+from scipy.special import ndtr
+
+from optibook.common_types import InstrumentType, OptionKind
+
+SECONDS_PER_YEAR = 365.0 * 24 * 60 * 60
+# options this close to expiry are priced with this time to expiry, so greeks stay finite
+MIN_TIME_TO_EXPIRY = 1e-9
+INV_SQRT_2PI = 1 / math.sqrt(2 * math.pi)
+
+
+def _d1_d2(spot, strike, time_to_expiry, volatility, rate):
+    sqrt_t = np.sqrt(time_to_expiry)
+    vol_sqrt_t = volatility * sqrt_t
+    d1 = (np.log(spot / strike) + (rate + 0.5 * volatility * volatility) * time_to_expiry) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t, sqrt_t
+
+
+def black_scholes_price(spot, strike, time_to_expiry, volatility, rate, is_call):
+    """
+    Args:
+        spot (array_like): Price of the underlying.
+        strike (array_like): Strike of each option.
+        time_to_expiry (array_like): Time to expiry in years.
+        volatility (array_like): Annualized volatility.
+        rate (array_like): Continuously compounded interest rate.
+        is_call (array_like): True for calls, False for puts.
+    Returns:
+        (np.ndarray): The price of each option.
+    """
+    time_to_expiry = np.maximum(time_to_expiry, MIN_TIME_TO_EXPIRY)
+    d1, d2, _ = _d1_d2(spot, strike, time_to_expiry, volatility, rate)
+    discounted_strike = strike * np.exp(-rate * time_to_expiry)
+    call = spot * ndtr(d1) - discounted_strike * ndtr(d2)
+    # put-call parity is cheaper than a second pair of ndtr calls
+    return np.where(is_call, call, call - spot + discounted_strike)
+
+
+def black_scholes_greeks(spot, strike, time_to_expiry, volatility, rate, is_call):
+    """
+    Prices and greeks in one pass. Arguments as for black_scholes_price.
+    Returns:
+        (dict): Arrays 'price', 'delta', 'gamma', 'vega' (per 1.00 of volatility), 'theta' (per year) and 'rho'.
+    """
+    time_to_expiry = np.maximum(time_to_expiry, MIN_TIME_TO_EXPIRY)
+    d1, d2, sqrt_t = _d1_d2(spot, strike, time_to_expiry, volatility, rate)
+    discount = np.exp(-rate * time_to_expiry)
+    discounted_strike = strike * discount
+    n_d1 = ndtr(d1)
+    n_d2 = ndtr(d2)
+    pdf_d1 = INV_SQRT_2PI * np.exp(-0.5 * d1 * d1)
+
+    call_price = spot * n_d1 - discounted_strike * n_d2
+    gamma = pdf_d1 / (spot * volatility * sqrt_t)
+    vega = spot * pdf_d1 * sqrt_t
+    decay = -spot * pdf_d1 * volatility / (2 * sqrt_t)
+    call_theta = decay - rate * discounted_strike * n_d2
+    call_rho = discounted_strike * time_to_expiry * n_d2
+
+    return {
+        'price': np.where(is_call, call_price, call_price - spot + discounted_strike),
+        'delta': np.where(is_call, n_d1, n_d1 - 1),
+        'gamma': gamma,
+        'vega': vega,
+        'theta': np.where(is_call, call_theta, call_theta + rate * discounted_strike),
+        'rho': np.where(is_call, call_rho, call_rho - discounted_strike * time_to_expiry),
+    }
+
+
+def implied_volatility(price, spot, strike, time_to_expiry, rate, is_call, tol=1e-8, max_iter=50, min_vol=1e-4, max_vol=5.0):
+    """
+    Solves the volatilities at which the options are worth the given prices, all options at once.
+
+    Every option keeps a bracket [lo, hi] around its solution. It takes a Newton step from the point of inflection of
+    its price in volatility, and a bisection step whenever Newton would leave the bracket or vega vanishes, so it
+    converges quadratically where Newton works and never diverges where it does not. Options that converged are dropped
+    from the next iteration.
+
+    Args:
+        price (array_like): Price of each option.
+        spot, strike, time_to_expiry, rate, is_call: As for black_scholes_price.
+        tol (float): Absolute price error at which an option has converged.
+        max_iter (int): Maximum number of iterations.
+        min_vol (float): Lower end of the volatility bracket.
+        max_vol (float): Upper end of the volatility bracket.
+    Returns:
+        (np.ndarray): The implied volatility of each option, NaN where the price is outside the no-arbitrage bounds or
+            the solution is outside [min_vol, max_vol].
+    """
+    price, spot, strike, time_to_expiry, rate, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=float), np.asarray(spot, dtype=float), np.asarray(strike, dtype=float),
+        np.asarray(time_to_expiry, dtype=float), np.asarray(rate, dtype=float), np.asarray(is_call, dtype=bool))
+    shape = price.shape
+    price, spot, strike, time_to_expiry, rate, is_call = (a.ravel() for a in (price, spot, strike, time_to_expiry, rate, is_call))
+    result = np.full(price.shape, np.nan)
+
+    discounted_strike = strike * np.exp(-rate * time_to_expiry)
+    intrinsic = np.where(is_call, np.maximum(spot - discounted_strike, 0.0), np.maximum(discounted_strike - spot, 0.0))
+    upper = np.where(is_call, spot, discounted_strike)
+    valid = np.isfinite(price) & (time_to_expiry > 0) & (price > intrinsic) & (price < upper)
+    idx = np.flatnonzero(valid)
+    if idx.size == 0:
+        return result.reshape(shape)
+
+    p, s, k, t, r, c = price[idx], spot[idx], strike[idx], time_to_expiry[idx], rate[idx], is_call[idx]
+    log_moneyness = np.log(s / k) + r * t
+    lo = np.full(idx.size, min_vol)
+    hi = np.full(idx.size, max_vol)
+    # price is convex in volatility below and concave above this point, so Newton from here converges monotonically
+    sigma = np.sqrt(2 * np.abs(log_moneyness) / t)
+    sigma = np.where(sigma > min_vol, sigma, math.sqrt(2 * math.pi) * p / (s * np.sqrt(t)))
+    sigma = np.clip(sigma, min_vol, max_vol)
+
+    for _ in range(max_iter):
+        sqrt_t = np.sqrt(t)
+        d1 = (log_moneyness + 0.5 * sigma * sigma * t) / (sigma * sqrt_t)
+        d2 = d1 - sigma * sqrt_t
+        dk = k * np.exp(-r * t)
+        call = s * ndtr(d1) - dk * ndtr(d2)
+        diff = np.where(c, call, call - s + dk) - p
+        vega = s * INV_SQRT_2PI * np.exp(-0.5 * d1 * d1) * sqrt_t
+
+        done = np.abs(diff) < tol
+        if done.any():
+            result[idx[done]] = sigma[done]
+            keep = ~done
+            idx, p, s, k, t, r, c, log_moneyness, lo, hi, sigma, diff, vega = (
+                a[keep] for a in (idx, p, s, k, t, r, c, log_moneyness, lo, hi, sigma, diff, vega))
+            if idx.size == 0:
+                break
+
+        too_high = diff > 0
+        hi = np.where(too_high, sigma, hi)
+        lo = np.where(too_high, lo, sigma)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = sigma - diff / vega
+        use_bisection = ~((newton > lo) & (newton < hi)) | (vega < 1e-12)
+        sigma = np.where(use_bisection, 0.5 * (lo + hi), newton)
+
+    return result.reshape(shape)
+
+
+class OptionChain:
+    """
+    The options on one underlying as arrays, in a fixed order, for the vectorized functions above.
+
+    Attributes:
+        instrument_ids (list): The option instrument ids, in the order of the arrays.
+        strikes (np.ndarray): Strike of each option.
+        is_call (np.ndarray): True for calls, False for puts.
+        expiries (np.ndarray): Expiry of each option, in seconds since the epoch.
+        expiry_index (np.ndarray): Per option the index of its expiry in unique_expiries.
+        unique_expiries (np.ndarray): The distinct expiries in ascending order, in seconds since the epoch.
+    """
+
+    def __init__(self, underlying_id, instruments):
+        """
+        Args:
+            underlying_id (str): The instrument id of the underlying.
+            instruments (list): The option Instruments on the underlying.
+        """
+        # sorted by expiry, then strike, so every expiry is a contiguous slice
+        instruments = sorted(instruments, key=lambda i: (i.expiry, i.strike, i.option_kind != OptionKind.CALL))
+        self.underlying_id = underlying_id
+        self.instrument_ids = [i.instrument_id for i in instruments]
+        self.position_by_instrument_id = {instrument_id: n for n, instrument_id in enumerate(self.instrument_ids)}
+        self.strikes = np.array([i.strike for i in instruments], dtype=float)
+        self.is_call = np.array([i.option_kind == OptionKind.CALL for i in instruments], dtype=bool)
+        self.expiries = np.array([i.expiry.timestamp() for i in instruments], dtype=float)
+        self.unique_expiries, self.expiry_index = np.unique(self.expiries, return_inverse=True)
+
+    @staticmethod
+    def from_instruments(underlying_id, instruments):
+        """
+        Args:
+            underlying_id (str): The instrument id of the underlying.
+            instruments (dict): All instruments, e.g. from get_instruments().
+        Returns:
+            (OptionChain): The chain of the options on the underlying.
+        """
+        return OptionChain(underlying_id, [
+            i for i in instruments.values()
+            if i.instrument_type == InstrumentType.OPTION and i.base_instrument_id == underlying_id
+            and i.expiry is not None and i.strike is not None
+        ])
+
+    def time_to_expiry(self, now=None):
+        """
+        Args:
+            now (float): The current time in seconds since the epoch, the wall clock if None.
+        Returns:
+            (np.ndarray): Time to expiry of each option in years, 0 for expired options.
+        """
+        now = time.time() if now is None else now
+        return np.maximum(self.expiries - now, 0.0) / SECONDS_PER_YEAR
+
+    def __len__(self):
+        return len(self.instrument_ids)
+
+
+class OptionPricer:
+    """
+    Prices the option chain of one underlying, keeping the chain cached until the instruments of the client change.
+    """
+
+    def __init__(self, client, underlying_id, rate=0.0):
+        """
+        Args:
+            client (Exchange): Anything with get_instruments() and get_instruments_version().
+            underlying_id (str): The instrument id of the underlying.
+            rate (float): Continuously compounded interest rate.
+        """
+        self._client = client
+        self.underlying_id = underlying_id
+        self.rate = rate
+        self._chain = None
+        self._chain_version = None
+
+    def get_chain(self):
+        """
+        Returns:
+            (OptionChain): The chain, rebuilt only when instruments were created or expired.
+        """
+        version = self._client.get_instruments_version()
+        if self._chain is None or version != self._chain_version:
+            self._chain = OptionChain.from_instruments(self.underlying_id, self._client.get_instruments())
+            self._chain_version = version
+        return self._chain
+
+    def price(self, spot, volatilities, now=None):
+        """
+        Args:
+            spot (float): Price of the underlying.
+            volatilities (array_like): Volatility of each option in chain order, or one for all.
+            now (float): The current time in seconds since the epoch, the wall clock if None.
+        Returns:
+            (np.ndarray): The price of each option in chain order.
+        """
+        chain = self.get_chain()
+        return black_scholes_price(spot, chain.strikes, chain.time_to_expiry(now), volatilities, self.rate, chain.is_call)
+
+    def greeks(self, spot, volatilities, now=None):
+        """
+        Arguments as for price.
+        Returns:
+            (dict): Arrays of price and greeks of each option in chain order, see black_scholes_greeks.
+        """
+        chain = self.get_chain()
+        return black_scholes_greeks(spot, chain.strikes, chain.time_to_expiry(now), volatilities, self.rate, chain.is_call)
+
+    def implied_volatilities(self, spot, option_prices, now=None, **kwargs):
+        """
+        Args:
+            spot (float): Price of the underlying.
+            option_prices (array_like): Price of each option in chain order, NaN where there is none.
+            now (float): The current time in seconds since the epoch, the wall clock if None.
+            kwargs: Passed on to implied_volatility.
+        Returns:
+            (np.ndarray): The implied volatility of each option in chain order.
+        """
+        chain = self.get_chain()
+        return implied_volatility(option_prices, spot, chain.strikes, chain.time_to_expiry(now), self.rate, chain.is_call, **kwargs)
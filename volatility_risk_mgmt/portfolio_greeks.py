@@ -0,0 +1,137 @@
+"""
+Delta, gamma, vega and theta of the position in an underlying and all its options, kept up to date from the event stream.
+"""
+import time
+
+import numpy as np
+
+from .option_pricing import OptionPricer, black_scholes_greeks
+
+GREEKS = ('delta', 'gamma', 'vega', 'theta')
+
+
+class PortfolioGreeks:
+    """
+    Risk totals of one underlying and its options.
+
+    The greeks per unit of every option are evaluated for the whole chain at once, and only again when the mid of the
+    underlying moved more than move_threshold (relative) since, or the evaluation is older than max_age. In between, a fill
+    adds its volume times the greeks per unit of its instrument to the totals, which is O(1). The totals are replaced as
+    one tuple, so they can be read from any thread at any moment.
+    """
+
+    def __init__(self, client, underlying_id, volatility=0.3, rate=0.0, move_threshold=0.001, max_age=60.0):
+        """
+        Args:
+            client (Exchange): Source of the instruments and positions.
+            underlying_id (str): The instrument id of the underlying.
+            volatility (float or callable): Volatility of all options, or a function (chain, spot, now) returning the
+                volatility of each option in chain order, e.g. from a VolSurface.
+            rate (float): Continuously compounded interest rate.
+            move_threshold (float): Relative move of the underlying after which the greeks are evaluated again.
+            max_age (float): Seconds after which the greeks are evaluated again on the next book update, as time decay
+                changes them too.
+        """
+        self._client = client
+        self.underlying_id = underlying_id
+        self.pricer = OptionPricer(client, underlying_id, rate)
+        self.volatility = volatility
+        self.move_threshold = move_threshold
+        self.max_age = max_age
+
+        self._chain = None
+        self._positions = None
+        self._underlying_position = 0
+        self._unit_greeks = None
+        self._spot = None
+        self._evaluated_at = None
+        self._totals = (0.0, 0.0, 0.0, 0.0)
+        self.nr_evaluations = 0
+
+    def subscribe(self, exchange):
+        """
+        Starts following the fills and the book of the underlying of an Exchange.
+        """
+        exchange.add_trade_callback(self.on_trade)
+        exchange.add_top_of_book_callback(self.on_top_of_book)
+
+    def unsubscribe(self, exchange):
+        exchange.remove_trade_callback(self.on_trade)
+        exchange.remove_top_of_book_callback(self.on_top_of_book)
+
+    def _sync_chain(self):
+        chain = self.pricer.get_chain()
+        if chain is not self._chain:
+            self._chain = chain
+            positions = self._client.get_positions()
+            self._positions = np.array([positions.get(i, 0) for i in chain.instrument_ids], dtype=float)
+            self._underlying_position = positions.get(self.underlying_id, 0)
+            self._unit_greeks = None
+        return chain
+
+    def on_top_of_book(self, top_of_book):
+        """
+        Evaluates the greeks again if the underlying moved enough.
+        """
+        if top_of_book.instrument_id != self.underlying_id or top_of_book.mid_price is None:
+            return
+        spot = top_of_book.mid_price
+        if (self._unit_greeks is None or self._spot is None
+                or abs(spot / self._spot - 1) > self.move_threshold
+                or time.time() - self._evaluated_at > self.max_age
+                or self.pricer.get_chain() is not self._chain):
+            self.evaluate(spot)
+
+    def on_trade(self, trade):
+        """
+        Adds a fill to the positions and the totals.
+        """
+        volume = trade.volume if trade.side == 'bid' else -trade.volume
+        if trade.instrument_id == self.underlying_id:
+            self._underlying_position += volume
+            delta, gamma, vega, theta = self._totals
+            self._totals = (delta + volume, gamma, vega, theta)
+            return
+        if self._chain is None:
+            return
+        n = self._chain.position_by_instrument_id.get(trade.instrument_id)
+        if n is None:
+            return
+        self._positions[n] += volume
+        if self._unit_greeks is not None:
+            unit_delta, unit_gamma, unit_vega, unit_theta = self._unit_greeks[:, n].tolist()
+            delta, gamma, vega, theta = self._totals
+            self._totals = (delta + volume * unit_delta, gamma + volume * unit_gamma, vega + volume * unit_vega, theta + volume * unit_theta)
+
+    def evaluate(self, spot, now=None):
+        """
+        Evaluates the greeks per unit of the whole chain at spot, and the totals from them.
+        """
+        chain = self._sync_chain()
+        now = time.time() if now is None else now
+        volatility = self.volatility(chain, spot, now) if callable(self.volatility) else self.volatility
+        greeks = black_scholes_greeks(spot, chain.strikes, chain.time_to_expiry(now), volatility, self.pricer.rate, chain.is_call)
+        self._unit_greeks = np.vstack([greeks[g] for g in GREEKS])
+        self._spot = spot
+        self._evaluated_at = now
+        self.nr_evaluations += 1
+
+        totals = self._unit_greeks @ self._positions
+        self._totals = (float(totals[0]) + self._underlying_position, float(totals[1]), float(totals[2]), float(totals[3]))
+
+    def get_net_delta(self):
+        return self._totals[0]
+
+    def get_totals(self):
+        """
+        Returns:
+            (dict): Net delta (in units of the underlying), gamma, vega (per 1.00 of volatility) and theta (per year).
+        """
+        return dict(zip(GREEKS, self._totals))
+
+    def get_spot(self):
+        """
+        Returns:
+            (float): The price of the underlying the greeks were last evaluated at.
+        """
+        return self._spot
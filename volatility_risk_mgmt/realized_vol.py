@@ -0,0 +1,269 @@
+"""
+Realized volatility estimators fed from the market data stream of the client.
+
+Mid prices from every top of book, and trade prices while there is no mid, are aggregated into bars of a fixed length
+per instrument and horizon. Every closed bar updates all estimators in O(1):
+
+- close-to-close: sample variance of the log returns between bar closes.
+- Parkinson: from the high and low of each bar.
+- Garman-Klass: from the open, high, low and close of each bar.
+- bipower variation: from products of consecutive absolute returns, robust to jumps.
+- GARCH(1,1): one-step-ahead forecast of the variance of the next bar.
+
+All estimates are variances of the log return over one bar. A return between bar closes that are several bars apart,
+because no prices came in between, is scaled down to one bar. Use RealizedVolatility.to_volatility to scale them to
+another horizon.
+"""
+import math
+import time
+import typing
+
+from .rolling_stats import RollingMeanVariance
+
+LOG_2 = math.log(2)
+PARKINSON_FACTOR = 1 / (4 * LOG_2)
+GARMAN_KLASS_FACTOR = 2 * LOG_2 - 1
+BIPOWER_FACTOR = math.pi / 2
+
+
+class Bar:
+    """
+    Open, high, low and close of the prices in one interval, and the traded volume.
+    """
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, start, price):
+        self.start = start
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = 0
+
+    def add(self, price):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+
+    def __repr__(self):
+        return f"[bar] start={self.start}, o={self.open}, h={self.high}, l={self.low}, c={self.close}, v={self.volume}"
+
+
+class RealizedVolatility:
+    """
+    Estimators of the variance of one instrument on bars of one length.
+    """
+
+    def __init__(self, bar_seconds, window=60, garch_alpha=0.05, garch_beta=0.9, garch_omega=None):
+        """
+        Args:
+            bar_seconds (float): Length of a bar in seconds.
+            window (int): Number of bars the rolling estimators look back.
+            garch_alpha (float): Weight of the last squared return in the GARCH forecast.
+            garch_beta (float): Weight of the previous forecast in the GARCH forecast.
+            garch_omega (float): Constant of the GARCH forecast. None to target the mean squared return seen so far.
+        """
+        assert bar_seconds > 0, "bar_seconds must be positive"
+        assert garch_alpha >= 0 and garch_beta >= 0 and garch_alpha + garch_beta < 1, "GARCH(1,1) must be stationary"
+        self.bar_seconds = bar_seconds
+        self.window = window
+        self.garch_alpha = garch_alpha
+        self.garch_beta = garch_beta
+        self.garch_omega = garch_omega
+
+        self.bar = None
+        self.last_bar = None
+        self.nr_bars = 0
+        self._last_return = None
+
+        self._returns = RollingMeanVariance(window, ddof=1)
+        self._parkinson = RollingMeanVariance(window)
+        self._garman_klass = RollingMeanVariance(window)
+        self._bipower = RollingMeanVariance(window)
+        self._nr_returns = 0
+        self._sum_squared_returns = 0.0
+        self._garch_variance = None
+
+    def on_price(self, timestamp, price, volume=0):
+        """
+        Adds a price observed at timestamp (in seconds), closing the current bar first if timestamp is past its end.
+        """
+        bar = self.bar
+        if bar is not None and timestamp >= bar.start + self.bar_seconds:
+            self._close_bar(bar)
+            bar = None
+        if bar is None:
+            bar = self.bar = Bar(timestamp - timestamp % self.bar_seconds, price)
+        else:
+            bar.add(price)
+        bar.volume += volume
+
+    def on_volume(self, timestamp, volume):
+        """
+        Adds traded volume to the current bar without changing its prices.
+        """
+        if self.bar is not None and timestamp < self.bar.start + self.bar_seconds:
+            self.bar.volume += volume
+
+    def _close_bar(self, bar):
+        previous = self.last_bar
+        self.last_bar = bar
+        self.nr_bars += 1
+
+        log_high_low = math.log(bar.high / bar.low)
+        log_close_open = math.log(bar.close / bar.open)
+        self._parkinson.update(PARKINSON_FACTOR * log_high_low * log_high_low)
+        self._garman_klass.update(0.5 * log_high_low * log_high_low - GARMAN_KLASS_FACTOR * log_close_open * log_close_open)
+
+        if previous is None:
+            return
+        r = math.log(bar.close / previous.close)
+        # the return since the previous close spans the empty bars in between too, scale its variance to one bar
+        nr_bars = round((bar.start - previous.start) / self.bar_seconds)
+        if nr_bars > 1:
+            r /= math.sqrt(nr_bars)
+        self._returns.update(r)
+        if self._last_return is not None:
+            self._bipower.update(BIPOWER_FACTOR * abs(r) * abs(self._last_return))
+        self._last_return = r
+
+        squared = r * r
+        self._nr_returns += 1
+        self._sum_squared_returns += squared
+        omega = self.garch_omega
+        if omega is None:
+            # variance targeting: the forecast reverts to the mean squared return
+            omega = (1 - self.garch_alpha - self.garch_beta) * self._sum_squared_returns / self._nr_returns
+        if self._garch_variance is None:
+            self._garch_variance = squared
+        self._garch_variance = omega + self.garch_alpha * squared + self.garch_beta * self._garch_variance
+
+    @property
+    def close_to_close(self):
+        return self._returns.variance
+
+    @property
+    def parkinson(self):
+        return self._parkinson.mean
+
+    @property
+    def garman_klass(self):
+        return max(self._garman_klass.mean, 0.0)
+
+    @property
+    def bipower(self):
+        return self._bipower.mean
+
+    @property
+    def garch(self):
+        return self._garch_variance if self._garch_variance is not None else 0.0
+
+    def get_estimates(self):
+        """
+        Returns:
+            (dict): Per estimator the variance of the log return over one bar.
+        """
+        return {
+            'close_to_close': self.close_to_close,
+            'parkinson': self.parkinson,
+            'garman_klass': self.garman_klass,
+            'bipower': self.bipower,
+            'garch': self.garch,
+        }
+
+    def to_volatility(self, variance, horizon_seconds):
+        """
+        Scales a variance over one bar to the standard deviation of the log return over horizon_seconds.
+        """
+        return math.sqrt(variance * horizon_seconds / self.bar_seconds)
+
+
+class RealizedVolatilityEngine:
+    """
+    Keeps a RealizedVolatility per instrument and bar length, fed by the top of book and trade tick callbacks of an
+    InfoClient or Exchange. The callbacks run on the event loop thread of the client and do O(1) work per event.
+
+    Both feeds are timed on arrival by the same clock, as the timestamps of the client are not comparable: a top of book
+    carries the local time it was received, a trade tick the exchange time truncated to whole seconds.
+    """
+
+    def __init__(self, bar_seconds=(1.0, 10.0), window=60, instruments=None, clock=time.time, **garch_kwargs):
+        """
+        Args:
+            bar_seconds (tuple): The bar lengths in seconds to keep estimators for.
+            window (int): Number of bars the rolling estimators look back.
+            instruments (list): The instruments to keep estimators for, None for all instruments.
+            clock (callable): Returns the current time in seconds. Pass the simulated time when replaying data.
+            garch_kwargs: Parameters of the GARCH forecast, see RealizedVolatility.
+        """
+        self.bar_seconds = tuple(bar_seconds)
+        self.window = window
+        self.instruments = set(instruments) if instruments is not None else None
+        self._clock = clock
+        self._garch_kwargs = garch_kwargs
+        self._estimators: typing.Dict[str, typing.List[RealizedVolatility]] = {}
+        self._has_mid: typing.Dict[str, bool] = {}
+
+    def subscribe(self, client):
+        """
+        Starts receiving top of book updates and trade ticks from an InfoClient or Exchange.
+        """
+        client.add_top_of_book_callback(self.on_top_of_book)
+        client.add_trade_tick_callback(self.on_trade_tick)
+
+    def unsubscribe(self, client):
+        client.remove_top_of_book_callback(self.on_top_of_book)
+        client.remove_trade_tick_callback(self.on_trade_tick)
+
+    def _get_estimators(self, instrument_id):
+        estimators = self._estimators.get(instrument_id)
+        if estimators is None:
+            estimators = self._estimators[instrument_id] = [
+                RealizedVolatility(s, self.window, **self._garch_kwargs) for s in self.bar_seconds
+            ]
+        return estimators
+
+    def on_top_of_book(self, top_of_book):
+        instrument_id = top_of_book.instrument_id
+        if self.instruments is not None and instrument_id not in self.instruments:
+            return
+        mid = top_of_book.mid_price
+        if mid is None:
+            return
+        self._has_mid[instrument_id] = True
+        timestamp = self._clock()
+        for estimator in self._get_estimators(instrument_id):
+            estimator.on_price(timestamp, mid)
+
+    def on_trade_tick(self, trade_tick):
+        instrument_id = trade_tick.instrument_id
+        if self.instruments is not None and instrument_id not in self.instruments:
+            return
+        timestamp = self._clock()
+        if self._has_mid.get(instrument_id):
+            for estimator in self._get_estimators(instrument_id):
+                estimator.on_volume(timestamp, trade_tick.volume)
+        else:
+            # without a two sided book the trades are the only prices there are
+            for estimator in self._get_estimators(instrument_id):
+                estimator.on_price(timestamp, trade_tick.price, trade_tick.volume)
+
+    def get(self, instrument_id, bar_seconds):
+        """
+        Returns:
+            (RealizedVolatility): The estimators of the instrument on bars of bar_seconds, or None if there is no data yet.
+        """
+        estimators = self._estimators.get(instrument_id)
+        if estimators is None:
+            return None
+        return estimators[self.bar_seconds.index(bar_seconds)]
+
+    def get_estimates(self, instrument_id, bar_seconds):
+        """
+        Returns:
+            (dict): Per estimator the variance of the log return over one bar, or None if there is no data yet.
+        """
+        estimator = self.get(instrument_id, bar_seconds)
+        return estimator.get_estimates() if estimator is not None else None
@@ -0,0 +1,371 @@
+"""
+Streaming statistics that update in O(1) per sample.
+
+Every class has update(x) for live samples and update_batch(values) for backfilling history with NumPy. update_batch
+returns the statistic after each sample, exactly like calling update for every value would, and leaves the object in the
+same state, so history can be loaded in one call and then continued sample by sample.
+"""
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RollingMeanVariance:
+    """
+    Mean and variance over the last `window` samples, updated with Welford's algorithm.
+    Until the window is full the statistics are over the samples seen so far.
+    """
+
+    def __init__(self, window, ddof=0):
+        """
+        Args:
+            window (int): Number of samples in the window.
+            ddof (int): Delta degrees of freedom of the variance, 0 like np.var, 1 like pandas.
+        """
+        assert window > 0, "window must be positive"
+        self.window = window
+        self.ddof = ddof
+        self._values = deque(maxlen=window)
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, x):
+        """
+        Adds a sample, dropping the oldest one if the window is full.
+        Args:
+            x (float): The new sample.
+        Returns:
+            (float): The variance after adding the sample.
+        """
+        values = self._values
+        if len(values) == self.window:
+            old = values[0]
+            values.append(x)
+            delta = x - old
+            new_mean = self._mean + delta / self.window
+            self._m2 += delta * (x - new_mean + old - self._mean)
+            self._mean = new_mean
+        else:
+            values.append(x)
+            delta = x - self._mean
+            self._mean += delta / len(values)
+            self._m2 += delta * (x - self._mean)
+        if self._m2 < 0.0:
+            # rounding can take a constant window slightly below zero
+            self._m2 = 0.0
+        return self.variance
+
+    def update_batch(self, values):
+        """
+        Adds many samples at once.
+        Args:
+            values (array_like): The new samples, oldest first.
+        Returns:
+            (np.ndarray, np.ndarray): The mean and the variance after each sample.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return np.empty(0), np.empty(0)
+        history = np.fromiter(self._values, dtype=float, count=len(self._values))
+        series = np.concatenate([history, values])
+        means, variances = rolling_mean_variance(series, self.window, self.ddof)
+
+        self._values.extend(values[-self.window:].tolist())
+        window_values = np.fromiter(self._values, dtype=float, count=len(self._values))
+        self._mean = float(window_values.mean())
+        self._m2 = float(((window_values - self._mean) ** 2).sum())
+        return means[len(history):], variances[len(history):]
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def variance(self):
+        n = len(self._values) - self.ddof
+        return self._m2 / n if n > 0 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class EWMA:
+    """
+    Exponentially weighted moving mean and variance.
+    Each sample gets weight alpha, the previous statistics are decayed by (1 - alpha).
+    """
+
+    def __init__(self, alpha=None, halflife=None, span=None):
+        """
+        Exactly one of the arguments must be given.
+        Args:
+            alpha (float): Weight of the newest sample, between 0 and 1.
+            halflife (float): Number of samples after which the weight of a sample has halved.
+            span (float): Span like pandas' ewm, alpha = 2 / (span + 1).
+        """
+        assert sum(a is not None for a in (alpha, halflife, span)) == 1, "give exactly one of alpha, halflife and span"
+        if halflife is not None:
+            alpha = 1 - 0.5 ** (1 / halflife)
+        elif span is not None:
+            alpha = 2 / (span + 1)
+        assert 0 < alpha <= 1, "alpha must be in (0, 1]"
+        self.alpha = alpha
+        self._mean = None
+        self._variance = 0.0
+
+    def update(self, x):
+        """
+        Adds a sample.
+        Args:
+            x (float): The new sample.
+        Returns:
+            (float): The mean after adding the sample.
+        """
+        if self._mean is None:
+            self._mean = x
+            return x
+        diff = x - self._mean
+        increment = self.alpha * diff
+        self._mean += increment
+        self._variance = (1 - self.alpha) * (self._variance + diff * increment)
+        return self._mean
+
+    def update_batch(self, values):
+        """
+        Adds many samples at once.
+        Args:
+            values (array_like): The new samples, oldest first.
+        Returns:
+            (np.ndarray, np.ndarray): The mean and the variance after each sample.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return np.empty(0), np.empty(0)
+        if self._mean is None:
+            self._mean = float(values[0])
+            rest_means, rest_variances = self.update_batch(values[1:])
+            return np.concatenate([[values[0]], rest_means]), np.concatenate([[0.0], rest_variances])
+
+        decay = 1 - self.alpha
+        means = _exponential_filter(self.alpha * values, decay, self._mean)
+        previous_means = np.concatenate([[self._mean], means[:-1]])
+        diffs = values - previous_means
+        variances = _exponential_filter(decay * self.alpha * diffs * diffs, decay, self._variance)
+
+        self._mean = float(means[-1])
+        self._variance = float(variances[-1])
+        return means, variances
+
+    @property
+    def mean(self):
+        return self._mean if self._mean is not None else 0.0
+
+    @property
+    def variance(self):
+        return self._variance
+
+    @property
+    def std(self):
+        return math.sqrt(self._variance)
+
+
+class RollingMinMax:
+    """
+    Minimum and maximum over the last `window` samples, kept in monotonic deques.
+    Every sample enters and leaves each deque once, so an update is O(1) amortized.
+    """
+
+    def __init__(self, window):
+        """
+        Args:
+            window (int): Number of samples in the window.
+        """
+        assert window > 0, "window must be positive"
+        self.window = window
+        self._count = 0
+        # (index, value) pairs, increasing values in _mins and decreasing values in _maxs
+        self._mins = deque()
+        self._maxs = deque()
+
+    def update(self, x):
+        """
+        Adds a sample, dropping the oldest one if the window is full.
+        Args:
+            x (float): The new sample.
+        Returns:
+            (float, float): The minimum and maximum after adding the sample.
+        """
+        index = self._count
+        self._count += 1
+        return self._push(index, x)
+
+    def _push(self, index, x):
+        mins, maxs = self._mins, self._maxs
+        while mins and mins[-1][1] >= x:
+            mins.pop()
+        mins.append((index, x))
+        while maxs and maxs[-1][1] <= x:
+            maxs.pop()
+        maxs.append((index, x))
+        oldest = index - self.window
+        if mins[0][0] <= oldest:
+            mins.popleft()
+        if maxs[0][0] <= oldest:
+            maxs.popleft()
+        return mins[0][1], maxs[0][1]
+
+    def update_batch(self, values):
+        """
+        Adds many samples at once.
+        Args:
+            values (array_like): The new samples, oldest first.
+        Returns:
+            (np.ndarray, np.ndarray): The minimum and maximum after each sample.
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return np.empty(0), np.empty(0)
+        # the samples still in the window are the ones in the deques, or dominated by one that is
+        history_start = max(0, self._count - self.window + 1)
+        history = np.full(self._count - history_start, np.nan)
+        for index, value in self._mins:
+            history[index - history_start] = value
+        for index, value in self._maxs:
+            history[index - history_start] = value
+        series = np.concatenate([history, values])
+        # only windows ending at a new sample are needed, and those always contain a value
+        mins, maxs = _rolling_min_max(series, self.window, len(history))
+
+        # rebuild the deques from the last window of samples
+        tail = series[-self.window:]
+        self._count += len(values)
+        self._mins.clear()
+        self._maxs.clear()
+        for index, x in enumerate(tail.tolist(), self._count - len(tail)):
+            if not math.isnan(x):
+                self._push(index, x)
+        return mins, maxs
+
+    @property
+    def min(self):
+        return self._mins[0][1] if self._mins else None
+
+    @property
+    def max(self):
+        return self._maxs[0][1] if self._maxs else None
+
+
+class ZScore:
+    """
+    Number of standard deviations a sample is away from the rolling mean of the window it is part of.
+    """
+
+    def __init__(self, window, ddof=0):
+        """
+        Args:
+            window (int): Number of samples in the window.
+            ddof (int): Delta degrees of freedom of the standard deviation.
+        """
+        self.stats = RollingMeanVariance(window, ddof)
+        self.last = 0.0
+
+    def update(self, x):
+        """
+        Adds a sample.
+        Args:
+            x (float): The new sample.
+        Returns:
+            (float): The z-score of the sample, 0 while the window has no variance.
+        """
+        self.stats.update(x)
+        std = self.stats.std
+        self.last = (x - self.stats.mean) / std if std > 0 else 0.0
+        return self.last
+
+    def update_batch(self, values):
+        """
+        Adds many samples at once.
+        Args:
+            values (array_like): The new samples, oldest first.
+        Returns:
+            (np.ndarray): The z-score of each sample.
+        """
+        values = np.asarray(values, dtype=float)
+        means, variances = self.stats.update_batch(values)
+        stds = np.sqrt(variances)
+        z_scores = np.divide(values - means, stds, out=np.zeros_like(values), where=stds > 0)
+        if z_scores.size:
+            self.last = float(z_scores[-1])
+        return z_scores
+
+
+def rolling_mean_variance(values, window, ddof=0):
+    """
+    Rolling mean and variance of a whole series, over partial windows at the start.
+    Args:
+        values (np.ndarray): The series.
+        window (int): Number of samples in the window.
+        ddof (int): Delta degrees of freedom of the variance.
+    Returns:
+        (np.ndarray, np.ndarray): The mean and variance at each sample.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return np.empty(0), np.empty(0)
+    # shifting by a typical value keeps the sums of squares from cancelling out
+    shifted = values - values.mean()
+    sums = np.cumsum(shifted)
+    squares = np.cumsum(shifted * shifted)
+    sums[window:] = sums[window:] - sums[:-window]
+    squares[window:] = squares[window:] - squares[:-window]
+    counts = np.minimum(np.arange(1, values.size + 1), window)
+
+    means = sums / counts
+    m2 = np.maximum(squares - sums * means, 0.0)
+    dof = counts - ddof
+    variances = np.divide(m2, dof, out=np.zeros_like(m2), where=dof > 0)
+    return means + values.mean(), variances
+
+
+def rolling_min_max(values, window):
+    """
+    Rolling minimum and maximum of a whole series, over partial windows at the start. NaNs are ignored.
+    Args:
+        values (np.ndarray): The series.
+        window (int): Number of samples in the window.
+    Returns:
+        (np.ndarray, np.ndarray): The minimum and maximum at each sample.
+    """
+    return _rolling_min_max(np.asarray(values, dtype=float), window, 0)
+
+
+def _rolling_min_max(values, window, start):
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = sliding_window_view(padded, window)[start:]
+    return np.nanmin(windows, axis=1), np.nanmax(windows, axis=1)
+
+
+def _exponential_filter(inputs, decay, initial):
+    """
+    Computes y[t] = decay * y[t - 1] + inputs[t] with y[-1] = initial, vectorized per block.
+    Within a block y is a cumulative sum scaled by powers of decay; blocks are short enough for those powers to stay finite.
+    """
+    outputs = np.empty_like(inputs)
+    if decay == 0.0:
+        outputs[:] = inputs
+        return outputs
+    block = max(1, min(len(inputs), int(600 / -math.log(decay)) if decay < 1 else len(inputs)))
+    powers = decay ** np.arange(1, block + 1)
+    previous = initial
+    for start in range(0, len(inputs), block):
+        chunk = inputs[start:start + block]
+        p = powers[:len(chunk)]
+        outputs[start:start + len(chunk)] = p * (previous + np.cumsum(chunk / p))
+        previous = outputs[start + len(chunk) - 1]
+    return outputs
@@ -0,0 +1,250 @@
+"""
+Portfolio PnL over a grid of price and volatility shocks, for all positions at once.
+
+For every instrument with a position the PnL of one lot in every scenario is kept as a row of a matrix, so the PnL of
+the portfolio in all scenarios is a single vector-matrix product of the positions with that matrix. A fill only adds its
+volume times the row of its instrument. The matrix itself is rebuilt when a reference price moved or an instrument without
+a row was traded.
+"""
+import itertools
+import logging
+import time
+
+import numpy as np
+
+from optibook.common_types import InstrumentType, OptionKind
+from .option_pricing import SECONDS_PER_YEAR, black_scholes_price
+
+logger = logging.getLogger(__name__)
+
+
+class _Grid:
+    """
+    Everything one rebuild produces, replaced as a whole so a reader never sees the rows of one rebuild with the
+    positions of another.
+    """
+    __slots__ = ('instrument_ids', 'row_by_instrument_id', 'positions', 'unit_pnl', 'reference_prices', 'pnl')
+
+    def __init__(self, instrument_ids, positions, unit_pnl, reference_prices, pnl):
+        self.instrument_ids = instrument_ids
+        self.row_by_instrument_id = {instrument_id: row for row, instrument_id in enumerate(instrument_ids)}
+        self.positions = positions
+        self.unit_pnl = unit_pnl
+        self.reference_prices = reference_prices
+        self.pnl = pnl
+
+
+class ScenarioRiskGrid:
+    """
+    Shock ladder of the whole portfolio.
+
+    A scenario is a relative price shock, applied to every underlying at the same time, combined with an absolute shock
+    of the volatility of all options. Spots and futures only feel the price shock.
+
+    Once subscribed, the grid is only changed on the event loop thread: a fill in an instrument without a row rebuilds it
+    right away, and so does a book in which a reference price moved more than move_threshold. The state is replaced as
+    one object, so the getters can be called from any thread at any moment.
+    """
+
+    def __init__(self, client, price_shocks=None, vol_shocks=(-0.05, 0.0, 0.05), report_shocks=(-0.05, -0.02, 0.02, 0.05),
+                 volatility=0.3, rate=0.0, move_threshold=0.001):
+        """
+        Args:
+            client (Exchange): Source of the instruments, positions and books.
+            price_shocks (array_like): Relative price shocks, e.g. -0.1 for a 10% drop. From -10% to +10% by default.
+            vol_shocks (array_like): Absolute volatility shocks, e.g. 0.05 for 5 vol points up. Must include 0.
+            report_shocks (array_like): Price shocks to report the loss at, without a vol shock. Must be in price_shocks.
+            volatility (float or dict): Volatility of all options, or per option instrument id. Options missing from the
+                dict are left out of the scenarios with a warning.
+            rate (float): Continuously compounded interest rate.
+            move_threshold (float): Relative move of a reference price after which the matrix is rebuilt.
+        """
+        self._client = client
+        self.price_shocks = np.asarray(price_shocks if price_shocks is not None else np.linspace(-0.1, 0.1, 21), dtype=float)
+        self.vol_shocks = np.asarray(vol_shocks, dtype=float)
+        assert np.any(np.isclose(self.vol_shocks, 0.0)), "vol_shocks must include 0"
+        self.report_shocks = list(report_shocks)
+        self.volatility = volatility
+        self.rate = rate
+        self.move_threshold = move_threshold
+
+        # scenario s is price shock s // len(vol_shocks) with vol shock s % len(vol_shocks)
+        self._scenario_price_shocks = np.repeat(self.price_shocks, len(self.vol_shocks))
+        self._scenario_vol_shocks = np.tile(self.vol_shocks, len(self.price_shocks))
+        self._zero_vol_shock = int(np.argmin(np.abs(self.vol_shocks)))
+
+        n_scenarios = len(self._scenario_price_shocks)
+        self._grid = _Grid([], np.zeros(0), np.zeros((0, n_scenarios)), {}, np.zeros(n_scenarios))
+        self._stale = True
+        self._subscribed = False
+        self.nr_rebuilds = 0
+
+    def subscribe(self, exchange):
+        """
+        Starts following the fills and books of an Exchange. The grid is rebuilt by the first book that arrives.
+        """
+        self._subscribed = True
+        self._stale = True
+        exchange.add_trade_callback(self.on_trade)
+        exchange.add_top_of_book_callback(self.on_top_of_book)
+
+    def unsubscribe(self, exchange):
+        exchange.remove_trade_callback(self.on_trade)
+        exchange.remove_top_of_book_callback(self.on_top_of_book)
+        self._subscribed = False
+
+    def _reference_price(self, instrument_id):
+        top_of_book = self._client.get_top_of_book(instrument_id)
+        if top_of_book is None:
+            return None
+        if top_of_book.mid_price is not None:
+            return top_of_book.mid_price
+        return top_of_book.best_bid_price if top_of_book.best_bid_price is not None else top_of_book.best_ask_price
+
+    def rebuild(self, now=None):
+        """
+        Takes the positions from the client and rebuilds the PnL per lot of every instrument at the current prices.
+        Once subscribed, only call this from the event loop thread, i.e. from a callback, or fills may be lost.
+        """
+        now = time.time() if now is None else now
+        instruments = self._client.get_instruments()
+        # flat instruments keep their row, so trading them again does not need a rebuild
+        positions = {i: p['volume'] for i, p in self._client.get_positions_and_cash().items()}
+        instrument_ids = sorted(positions)
+
+        # price of each underlying, an option's underlying is its base instrument
+        underlying_ids = []
+        for instrument_id in instrument_ids:
+            instrument = instruments.get(instrument_id)
+            is_option = instrument is not None and instrument.instrument_type == InstrumentType.OPTION
+            underlying_ids.append(instrument.base_instrument_id if is_option else instrument_id)
+        reference_prices = {u: self._reference_price(u) for u in set(underlying_ids)}
+        for u, price in reference_prices.items():
+            if price is None:
+                logger.warning(f"No price for '{u}', positions on it are left out of the scenarios.")
+
+        n_scenarios = len(self._scenario_price_shocks)
+        unit_pnl = np.zeros((len(instrument_ids), n_scenarios))
+        option_rows, strikes, expiries, is_call, spots, vols = [], [], [], [], [], []
+        for row, (instrument_id, underlying_id) in enumerate(zip(instrument_ids, underlying_ids)):
+            spot = reference_prices[underlying_id]
+            if spot is None:
+                continue
+            if underlying_id == instrument_id:
+                unit_pnl[row] = spot * self._scenario_price_shocks
+                continue
+            instrument = instruments[instrument_id]
+            if isinstance(self.volatility, dict):
+                if instrument_id not in self.volatility:
+                    logger.warning(f"No volatility for '{instrument_id}', its position is left out of the scenarios.")
+                    continue
+                vols.append(self.volatility[instrument_id])
+            else:
+                vols.append(self.volatility)
+            option_rows.append(row)
+            strikes.append(instrument.strike)
+            expiries.append(instrument.expiry.timestamp())
+            is_call.append(instrument.option_kind == OptionKind.CALL)
+            spots.append(spot)
+
+        if option_rows:
+            # options along the rows, scenarios along the columns, all priced in one call
+            spots = np.array(spots)[:, None]
+            strikes = np.array(strikes)[:, None]
+            time_to_expiry = (np.maximum(np.array(expiries) - now, 0.0) / SECONDS_PER_YEAR)[:, None]
+            vols = np.array(vols)[:, None]
+            is_call = np.array(is_call)[:, None]
+            base = black_scholes_price(spots, strikes, time_to_expiry, vols, self.rate, is_call)
+            shocked = black_scholes_price(spots * (1 + self._scenario_price_shocks), strikes, time_to_expiry,
+                                          np.maximum(vols + self._scenario_vol_shocks, 1e-4), self.rate, is_call)
+            unit_pnl[option_rows] = np.nan_to_num(shocked - base)
+
+        positions = np.array([positions[i] for i in instrument_ids], dtype=float)
+        self._grid = _Grid(instrument_ids, positions, unit_pnl, reference_prices, positions @ unit_pnl)
+        self._stale = False
+        self.nr_rebuilds += 1
+
+    def on_trade(self, trade):
+        """
+        Adds a fill to the scenario PnL. A fill in an instrument without a row rebuilds the grid, the client has booked
+        the fill in its positions before the trade callbacks run.
+        """
+        grid = self._grid
+        row = grid.row_by_instrument_id.get(trade.instrument_id)
+        if row is None:
+            self.rebuild()
+            return
+        volume = trade.volume if trade.side == 'bid' else -trade.volume
+        positions = grid.positions.copy()
+        positions[row] += volume
+        self._grid = _Grid(grid.instrument_ids, positions, grid.unit_pnl, grid.reference_prices,
+                           grid.pnl + volume * grid.unit_pnl[row])
+
+    def on_top_of_book(self, top_of_book):
+        """
+        Rebuilds the grid if the reference price of the instrument of the book moved more than move_threshold.
+        """
+        reference_prices = self._grid.reference_prices
+        if self._stale:
+            self.rebuild()
+        elif top_of_book.instrument_id in reference_prices and self._has_moved(
+                reference_prices[top_of_book.instrument_id], self._reference_price(top_of_book.instrument_id)):
+            self.rebuild()
+
+    def _has_moved(self, price, current):
+        if price is None or current is None:
+            return price != current
+        return abs(current / price - 1) > self.move_threshold
+
+    def refresh(self):
+        """
+        Rebuilds if any reference price moved more than move_threshold since the last rebuild. For a grid that is not
+        subscribed to an Exchange and is fed its fills by hand; a subscribed grid keeps itself up to date.
+        Returns:
+            (bool): True if the grid was rebuilt.
+        """
+        assert not self._subscribed, "A subscribed grid is rebuilt on the event loop thread, do not refresh it"
+        if self._stale or any(self._has_moved(price, self._reference_price(underlying_id))
+                              for underlying_id, price in self._grid.reference_prices.items()):
+            self.rebuild()
+            return True
+        return False
+
+    def get_pnl_grid(self):
+        """
+        Returns:
+            (np.ndarray): PnL of the portfolio per price shock (rows) and vol shock (columns).
+        """
+        return self._grid.pnl.reshape(len(self.price_shocks), len(self.vol_shocks))
+
+    def get_worst_case_loss(self):
+        """
+        Returns:
+            (float): The largest loss over all scenarios, 0 if no scenario loses money.
+        """
+        pnl = self._grid.pnl
+        return max(0.0, -float(pnl.min())) if pnl.size else 0.0
+
+    def get_losses_at_report_shocks(self):
+        """
+        Returns:
+            (dict): Per report shock the loss (positive) or gain (negative) of the portfolio without a vol shock.
+        """
+        grid = self.get_pnl_grid()
+        losses = {}
+        for shock in self.report_shocks:
+            row = int(np.argmin(np.abs(self.price_shocks - shock)))
+            losses[shock] = -float(grid[row, self._zero_vol_shock])
+        return losses
+
+    def get_report(self):
+        """
+        Returns:
+            (dict): The worst case loss, the losses at the report shocks and the full grid as nested lists.
+        """
+        return {
+            'worst_case_loss': self.get_worst_case_loss(),
+            'losses': self.get_losses_at_report_shocks(),
+            'grid': self.get_pnl_grid().tolist(),
+            'scenarios': list(itertools.product(self.price_shocks.tolist(), self.vol_shocks.tolist())),
+        }
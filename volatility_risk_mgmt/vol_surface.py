@@ -0,0 +1,244 @@
+"""
+Implied volatility surface per underlying, with an SVI smile per expiry that is refitted incrementally.
+
+The raw SVI parametrization gives the total implied variance w = iv^2 * T at log-moneyness k = ln(K / F) as
+
+    w(k) = a + b * (rho * (k - m) + sqrt((k - m)^2 + sigma^2))
+
+Each expiry is fitted by least squares on the implied vols of its options, warm-started from its previous parameters,
+with two penalties that keep the surface smooth: one pulling the parameters towards the previous fit, so a single noisy
+book does not make the smile jump, and one against total variance decreasing from one expiry to the next (calendar
+arbitrage). Only expiries whose option prices changed, or all of them after a large move of the underlying, are refitted.
+"""
+import typing
+
+import numpy as np
+from scipy.optimize import least_squares
+
+from .option_pricing import OptionPricer, implied_volatility
+
+# a, b, rho, m, sigma
+SVI_LOWER_BOUNDS = np.array([-1.0, 0.0, -0.999, -2.0, 1e-4])
+SVI_UPPER_BOUNDS = np.array([5.0, 10.0, 0.999, 2.0, 5.0])
+
+
+def svi_total_variance(k, params):
+    """
+    Args:
+        k (array_like): Log-moneyness ln(K / F).
+        params (array_like): The raw SVI parameters (a, b, rho, m, sigma).
+    Returns:
+        (np.ndarray): Total implied variance at k.
+    """
+    a, b, rho, m, sigma = params
+    x = np.asarray(k) - m
+    return a + b * (rho * x + np.sqrt(x * x + sigma * sigma))
+
+
+def initial_svi_params(k, w):
+    """
+    A rough fit to start from when there is no previous one: a symmetric smile through the ATM total variance.
+    """
+    order = np.argsort(k)
+    atm = float(np.interp(0.0, k[order], w[order]))
+    b, sigma = 0.1, 0.1
+    return np.array([atm - b * sigma, b, 0.0, 0.0, sigma])
+
+
+def fit_svi(k, w, initial, prior=None, prior_weight=0.0, floor_k=None, floor_w=None, floor_weight=0.0, max_nfev=200):
+    """
+    Fits raw SVI parameters to total variances.
+    Args:
+        k (np.ndarray): Log-moneyness of the quotes.
+        w (np.ndarray): Total implied variance of the quotes.
+        initial (np.ndarray): Parameters to start from.
+        prior (np.ndarray): Parameters to stay close to, e.g. the previous fit.
+        prior_weight (float): Weight of the distance to prior.
+        floor_k (np.ndarray): Log-moneyness grid on which the total variance should not fall below floor_w.
+        floor_w (np.ndarray): The total variance of the previous expiry on floor_k.
+        floor_weight (float): Weight of falling below floor_w.
+        max_nfev (int): Maximum number of function evaluations.
+    Returns:
+        (np.ndarray): The fitted parameters.
+    """
+    initial = np.clip(initial, SVI_LOWER_BOUNDS + 1e-9, SVI_UPPER_BOUNDS - 1e-9)
+    prior_scale = np.sqrt(prior_weight)
+    floor_scale = np.sqrt(floor_weight)
+
+    def residuals(params):
+        parts = [svi_total_variance(k, params) - w]
+        if prior is not None and prior_weight > 0:
+            parts.append(prior_scale * (params - prior))
+        if floor_k is not None and floor_weight > 0:
+            parts.append(floor_scale * np.minimum(svi_total_variance(floor_k, params) - floor_w, 0.0))
+        return np.concatenate(parts)
+
+    return least_squares(residuals, initial, bounds=(SVI_LOWER_BOUNDS, SVI_UPPER_BOUNDS), max_nfev=max_nfev).x
+
+
+class VolSurface:
+    """
+    SVI volatility surface of the options on one underlying, fitted from the live option books.
+
+    update() works out which expiries have changed option prices and refits only those. Each fit bumps the version of its
+    expiry and of the surface, so consumers can cache anything derived from it and recompute only when a version moved.
+    """
+
+    def __init__(self, client, underlying_id, rate=0.0, spot_tolerance=0.001, price_tolerance=1e-9,
+                 smoothness=1e-3, calendar_penalty=100.0, min_quotes=5, max_nfev=200):
+        """
+        Args:
+            client (Exchange): Source of the instruments and the top of book of the options and underlying.
+            underlying_id (str): The instrument id of the underlying.
+            rate (float): Continuously compounded interest rate.
+            spot_tolerance (float): Relative move of the underlying since the last fit after which all expiries are refitted.
+            price_tolerance (float): Change of an option price below which its book is considered unchanged.
+            smoothness (float): Weight of the distance to the previous parameters of an expiry.
+            calendar_penalty (float): Weight of the total variance falling below that of the previous expiry.
+            min_quotes (int): Minimum number of implied vols an expiry needs to be fitted.
+            max_nfev (int): Maximum number of function evaluations of one fit.
+        """
+        self._client = client
+        self.pricer = OptionPricer(client, underlying_id, rate)
+        self.underlying_id = underlying_id
+        self.spot_tolerance = spot_tolerance
+        self.price_tolerance = price_tolerance
+        self.smoothness = smoothness
+        self.calendar_penalty = calendar_penalty
+        self.min_quotes = min_quotes
+        self.max_nfev = max_nfev
+
+        self.version = 0
+        self._chain = None
+        self._prices = None
+        self._fit_spot = None
+        # keyed by expiry timestamp, so fits survive instruments of other expiries being created or expiring
+        self._params: typing.Dict[float, np.ndarray] = {}
+        self._versions: typing.Dict[float, int] = {}
+        self.nr_fits = 0
+
+    def get_option_prices(self):
+        """
+        Returns:
+            (np.ndarray): Mid price of each option of the chain from its top of book, NaN without a two sided book.
+        """
+        chain = self.pricer.get_chain()
+        prices = np.full(len(chain), np.nan)
+        for n, instrument_id in enumerate(chain.instrument_ids):
+            top_of_book = self._client.get_top_of_book(instrument_id)
+            if top_of_book is not None and top_of_book.mid_price is not None:
+                prices[n] = top_of_book.mid_price
+        return prices
+
+    def update_from_books(self, now=None):
+        """
+        Refits the expiries whose option books changed, using the mid prices of the options and the underlying.
+        Returns:
+            (list): The expiries that were refitted.
+        """
+        top_of_book = self._client.get_top_of_book(self.underlying_id)
+        if top_of_book is None or top_of_book.mid_price is None:
+            return []
+        return self.update(top_of_book.mid_price, self.get_option_prices(), now)
+
+    def update(self, spot, option_prices, now=None):
+        """
+        Refits the expiries whose option prices changed since the previous update.
+        Args:
+            spot (float): Price of the underlying.
+            option_prices (np.ndarray): Price of each option in chain order, NaN where there is none.
+            now (float): The current time in seconds since the epoch, the wall clock if None.
+        Returns:
+            (list): The expiries (seconds since the epoch) that were refitted.
+        """
+        chain = self.pricer.get_chain()
+        option_prices = np.asarray(option_prices, dtype=float)
+        if chain is not self._chain:
+            self._chain = chain
+            self._prices = None
+            expiries = set(chain.unique_expiries.tolist())
+            self._params = {e: p for e, p in self._params.items() if e in expiries}
+            self._versions = {e: v for e, v in self._versions.items() if e in expiries}
+
+        if self._prices is None or self._fit_spot is None or abs(spot / self._fit_spot - 1) > self.spot_tolerance:
+            dirty = np.arange(len(chain.unique_expiries))
+            self._fit_spot = spot
+        else:
+            unchanged = np.isclose(option_prices, self._prices, rtol=0.0, atol=self.price_tolerance, equal_nan=True)
+            dirty = np.unique(chain.expiry_index[~unchanged])
+        self._prices = option_prices.copy()
+        if dirty.size == 0:
+            return []
+
+        time_to_expiry = chain.time_to_expiry(now)
+        # implied vols are only needed for the options of the expiries that are refitted
+        solve = np.isin(chain.expiry_index, dirty)
+        vols = np.full(len(chain), np.nan)
+        vols[solve] = implied_volatility(option_prices[solve], spot, chain.strikes[solve], time_to_expiry[solve],
+                                         self.pricer.rate, chain.is_call[solve])
+        forward = spot * np.exp(self.pricer.rate * time_to_expiry)
+        log_moneyness = np.log(chain.strikes / forward)
+
+        dirty = set(dirty.tolist())
+        refitted = []
+        floor_k, floor_w = None, None
+        for e, expiry in enumerate(chain.unique_expiries.tolist()):
+            in_expiry = chain.expiry_index == e
+            ok = in_expiry & np.isfinite(vols)
+            k = log_moneyness[ok]
+            if e in dirty and k.size >= self.min_quotes:
+                w = vols[ok] ** 2 * time_to_expiry[ok]
+                previous = self._params.get(expiry)
+                params = fit_svi(k, w,
+                                 initial=previous if previous is not None else initial_svi_params(k, w),
+                                 prior=previous, prior_weight=self.smoothness if previous is not None else 0.0,
+                                 floor_k=floor_k, floor_w=floor_w, floor_weight=self.calendar_penalty,
+                                 max_nfev=self.max_nfev)
+                self._params[expiry] = params
+                self.version += 1
+                self._versions[expiry] = self.version
+                self.nr_fits += 1
+                refitted.append(expiry)
+            params = self._params.get(expiry)
+            if params is not None and k.size:
+                # the next expiry should not have less total variance on this expiry's strikes
+                floor_k = np.linspace(k.min(), k.max(), 11)
+                floor_w = svi_total_variance(floor_k, params)
+        return refitted
+
+    def get_expiries(self):
+        """
+        Returns:
+            (list): The expiries that have a fit, in seconds since the epoch.
+        """
+        return sorted(self._params)
+
+    def get_params(self, expiry):
+        """
+        Returns:
+            (np.ndarray): The SVI parameters (a, b, rho, m, sigma) of the expiry, or None if it was not fitted.
+        """
+        return self._params.get(expiry)
+
+    def get_version(self, expiry=None):
+        """
+        Returns:
+            (int): The version of the fit of the expiry, or of the whole surface if expiry is None. 0 if never fitted.
+        """
+        if expiry is None:
+            return self.version
+        return self._versions.get(expiry, 0)
+
+    def get_implied_vols(self, expiry, log_moneyness, time_to_expiry):
+        """
+        Args:
+            expiry (float): The expiry in seconds since the epoch.
+            log_moneyness (array_like): ln(K / F) to evaluate at.
+            time_to_expiry (float): Time to expiry in years.
+        Returns:
+            (np.ndarray): The implied vols of the fitted smile, NaN if the expiry was not fitted.
+        """
+        params = self._params.get(expiry)
+        if params is None:
+            return np.full(np.shape(log_moneyness), np.nan)
+        return np.sqrt(np.maximum(svi_total_variance(log_moneyness, params), 0.0) / time_to_expiry)